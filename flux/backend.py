@@ -1,9 +1,19 @@
+import collections
 import time
 
 from PySide import QtCore, QtMultimedia
 import numpy as np
 
 import effects
+import chain
+import clock
+import convert
+import instrumentation
+import looper
+import metering
+import profiler
+import recorder
+import watchdog
 
 class AudioPath(QtCore.QObject):
     """Class that handles audio input and output and applying effects.
@@ -15,58 +25,314 @@ class AudioPath(QtCore.QObject):
     def __init__(self, app):
         super(AudioPath, self).__init__()
         
+        self.app = app
+        
+        #the audio devices are opened on first use (see open_devices) since format
+        #negotiation is slow on some machines and shouldn't delay startup
+        self.audio_input = None
+        self.audio_output = None
+        
+        self.source = None
+        self.sink = None
+        
+        self.processing_enabled = True
+        
+        #whether the last block was processed, so that the reblocker can be reset when
+        #processing_enabled is turned back on
+        self._processing = True
+        
+        #the device's sample rate [Hz]. open_devices asks for requested_rate, or the
+        #device's preferred rate if it's None, and sets this to the rate it gets.
+        self.requested_rate = None
+        self.sample_rate = effects.SAMPLE_RATE
+        
+        #the rate the chains run at, or None to run them at the device's rate. Chains at
+        #another rate are resampled at their edges, see set_processing_rate.
+        self.processing_rate = None
+        
+        #one EffectChain per preset, keyed by an arbitrary hashable (the GUI uses the preset's tab)
+        self.chains = {}
+        self.current_chain = None
+        self._next_chain = None
+        
+        #the chain keys in the order that step_chain moves through them
+        self.chain_order = []
+        
+        #clock.monotonic() of the event that requested the pending switch
+        self._switch_time = None
+        
+        #if True, inactive chains are fed the input and their output discarded, so
+        #that their delay lines and filter states are current when switched to
+        self.keep_warm = True
+        
+        #if True, a chain that is switched away from keeps running on silence until
+        #its reverb and delay tails have decayed
+        self.ring_out_tails = False
+        self._tails = []
+        
+        #equal-power crossfade used when switching chains. The ramps are computed
+        #once for each sample rate so that a switch doesn't allocate anything.
+        self.crossfade_samples = 0
+        self._fade_in = self._fade_out = None
+        self._make_crossfade()
+        
+        #[chain, position in _fade_out] of each chain that is fading out, and the position
+        #of the current chain in _fade_in. A chain switched away from mid-fade finishes
+        #its fade from the gain it had reached, so quick switches don't click.
+        self._outgoing = []
+        self._fade_pos = 0
+        
+        #batches of (Parameter, value) pairs queued by other threads, see queue_updates
+        self._updates = collections.deque()
+        
+        self._scratch = chain.ScratchBuffer(effects.BUFFER_SIZE)
+        self._mix = chain.ScratchBuffer(effects.BUFFER_SIZE)
+        self._silence = chain.ScratchBuffer(effects.BUFFER_SIZE)
+        
+        self.looper = looper.Looper()
+        self.loop_track = 0
+        self.overdub = False
+        
+        #snapshots of the input and of the output before it's clipped, for the meters
+        self.input_meter = metering.MeterTap()
+        self.output_meter = metering.MeterTap()
+        
+        #the SessionRecorder that output is streamed to, if any
+        self.recorder = None
+        
+        #the profiler.SamplingProfiler that samples each callback, if any
+        self.profiler = None
+        
+        #every chain's output is delayed to match the chain with the highest latency, so
+        #that crossfades and ringing tails line up. This is the resulting latency in samples,
+        #including the latency of reblocking.
+        self.latency = 0
+        self._dry_delay = chain.DelayLine(dtype=np.int16)
+        self._dry = np.zeros(0, np.int16)
+        
+        #converts device samples to floats and back without allocating a buffer per block
+        self.converter = convert.SampleConverter()
+        
+        #the quality tier that every effect is set to, one of effects.QUALITY_TIERS
+        self.quality = 'normal'
+        
+        #lowers the quality of the effects when processing can't keep up, see set_watchdog_enabled
+        self.watchdog = watchdog.Watchdog()
+        
+        #the chains are run on blocks of exactly this many samples, however much audio
+        #the device delivers at a time. See set_block_size.
+        self.block_size = None
+        self._reblocker = None
+        self.set_block_size(chain.BLOCK_SIZE)
+        
+    def set_block_size(self, size):
+        """Run the chains on blocks of size samples, or on blocks as they arrive if size is None.
+        
+        This adds size samples of latency.
+        """
+        self.block_size = size
+        self._reblocker = chain.Reblocker(size) if size else None
+        
+    def _make_crossfade(self):
+        self.crossfade_samples = int(0.02 * self.sample_rate)
+        ramp = np.linspace(0, np.pi / 2, self.crossfade_samples)
+        self._fade_in = np.sin(ramp)
+        self._fade_out = np.cos(ramp)
+        
+    def open_devices(self):
+        """Negotiate the audio format and create the input and output devices.
+        
+        The device's preferred sample rate is used unless requested_rate is set,
+        so the operating system doesn't resample and add latency. This is done
+        at most once, and is called automatically by start().
+        """
+        if self.audio_input is not None:
+            return
+        
         info = QtMultimedia.QAudioDeviceInfo.defaultInputDevice()
         format = info.preferredFormat()
         format.setChannels(effects.CHANNEL_COUNT)
         format.setChannelCount(effects.CHANNEL_COUNT)
         format.setSampleSize(effects.SAMPLE_SIZE)
-        format.setSampleRate(effects.SAMPLE_RATE)
+        if self.requested_rate:
+            format.setSampleRate(self.requested_rate)
         
         if not info.isFormatSupported(format):
             print 'Format not supported, using nearest available'
-            format = nearestFormat(format)
-            if format.sampleSize != effects.SAMPLE_SIZE:
+            format = info.nearestFormat(format)
+            if format.sampleSize() != effects.SAMPLE_SIZE:
                 #this is important, since effects assume this sample size.
                 raise RuntimeError('16-bit sample size not supported!')
         
-        self.audio_input = QtMultimedia.QAudioInput(format, app)
-        self.audio_input.setBufferSize(effects.BUFFER_SIZE)
+        self._set_device_rate(format.sampleRate())
+        
+        self.audio_input = QtMultimedia.QAudioInput(format, self.app)
+        #the same duration of audio as BUFFER_SIZE bytes at SAMPLE_RATE, in whole samples
+        buffer_size = int(effects.BUFFER_SIZE * self.sample_rate / effects.SAMPLE_RATE) // 2 * 2
+        self.audio_input.setBufferSize(buffer_size)
         self.audio_output = QtMultimedia.QAudioOutput(format)
         
-        self.source = None
-        self.sink = None
+    def _set_device_rate(self, rate):
+        """Switch everything that depends on the device's sample rate to rate, before the devices start."""
+        self.sample_rate = rate
+        self._make_crossfade()
+        self.watchdog.sample_rate = rate
+        self.looper.set_sample_rate(rate)
+        for c in self.chains.itervalues():
+            c.set_sample_rate(self.processing_rate or rate, rate)
         
-        self.processing_enabled = True
+    def set_processing_rate(self, rate):
+        """Run the chains at rate, in Hz, resampling at their edges if the device runs at another rate.
+        
+        None runs them at the device's rate, which costs nothing extra. A chain
+        at a lower rate is cheaper, and one at a higher rate aliases less.
+        """
+        self.processing_rate = rate
+        for c in self.chains.itervalues():
+            c.set_sample_rate(rate or self.sample_rate, self.sample_rate)
         
-        self.effects = []
+    @property
+    def effects(self):
+        """The effects in the currently selected chain."""
+        if self.current_chain in self.chains:
+            return self.chains[self.current_chain].effects
+        return []
+    
+    def set_chain(self, key, effects):
+        """Create or update the chain for key with a list of effects."""
+        for effect in effects:
+            if effect.quality != self.quality:
+                effect.set_quality(self.quality)
+        if key in self.chains:
+            self.chains[key].effects = list(effects)
+        else:
+            self.chains[key] = chain.EffectChain(effects)
+            self.chains[key].watchdog = self.watchdog
+        #also sets the rate of effects that are new to the chain
+        self.chains[key].set_sample_rate(self.processing_rate or self.sample_rate, self.sample_rate)
+    
+    def set_quality(self, quality):
+        """Set every effect, now and as they're added, to quality, one of effects.QUALITY_TIERS."""
+        if quality not in effects.QUALITY_TIERS:
+            raise ValueError('unknown quality %r' % quality)
+        self.quality = quality
+        for c in self.chains.itervalues():
+            for effect in c.effects:
+                effect.set_quality(quality)
+    
+    def remove_chain(self, key):
+        chain = self.chains.pop(key, None)
+        if key in self.chain_order:
+            self.chain_order.remove(key)
+        if key == self.current_chain:
+            self.current_chain = None
+        if self._next_chain == key:
+            self._next_chain = None
+        self._outgoing = [entry for entry in self._outgoing if entry[0] is not chain]
+        if chain in self._tails:
+            self._tails.remove(chain)
+    
+    def select_chain(self, key):
+        """Switch to the chain for key, crossfading at the start of the next block."""
+        if key != self.current_chain:
+            self._next_chain = key
+        else:
+            self._next_chain = None
+    
+    def step_chain(self, step, timestamp=None):
+        """Select the chain step places after the current (or pending) one in chain_order.
+        
+        This may be called from any thread. If given, timestamp is the clock.monotonic()
+        time of the request and is used to measure the latency of the switch.
+        """
+        order = list(self.chain_order)
+        if not order:
+            return
+        
+        key = self._next_chain if self._next_chain is not None else self.current_chain
+        index = order.index(key) if key in order else 0
+        self._switch_time = timestamp
+        self.select_chain(order[(index + step) % len(order)])
+    
+    def pedal_event(self, event):
+        """Handle a pedal.PedalEvent. Called directly from the pedal thread."""
+        if event.pressed:
+            if event.button == 'L':
+                self.step_chain(-1, event.timestamp)
+            elif event.button == 'R':
+                self.step_chain(1, event.timestamp)
+        
+    def queue_updates(self, updates):
+        """Queue a list of (Parameter, value) pairs to be set at the start of the next block.
         
-        self.recording_loop = False
-        self.playing_loop = False
-        self.interval_size = None
-        self.record_track = None
-        self.playback_track = None
+        This may be called from any thread. The updates in one call are always
+        applied together.
+        """
+        self._updates.append(updates)
+    
+    def _apply_updates(self):
+        #only the last value queued for each parameter is set
+        latest = {}
+        while self._updates:
+            for param, value in self._updates.popleft():
+                latest[param] = value
+        for param, value in latest.iteritems():
+            param.value = value
         
+    def set_bpm(self, bpm):
+        """Set the tempo that the length of the first loop is rounded to. None disables rounding."""
+        self.looper.bpm = bpm
+    
     def start_recording(self):
-        self.record_track = np.array([])
-        self.recording_loop = True
+        self.looper.start_recording(self.loop_track, self.overdub)
     
     def stop_recording(self):
-        self.recording_loop = False
-        self.playback_track = self.record_track
-        self.record_track = None
+        self.looper.stop_recording()
         
     def start_loop_playback(self, bpm=None):
-        if self.playback_track is not None:
-            self.playing_loop = True
+        if bpm is not None:
+            self.set_bpm(bpm)
+        if self.looper.length:
+            self.looper.playing = True
         
     def stop_loop_playback(self):
-        self.playing_loop = False
+        self.looper.playing = False
+        
+    def set_track_muted(self, track, muted):
+        self.looper.set_muted(track, muted)
         
     def erase_recorded_data(self):
-        self.playing_loop = False
-        self.playback_track = None
+        self.looper.erase()
+    
+    def set_watchdog_enabled(self, value):
+        """Let the watchdog degrade and bypass effects that overrun, or undo what it has done and stop it."""
+        self.watchdog.enabled = value
+    
+    def start_profiling(self, duration):
+        """Profile the audio callback for duration seconds, and return the profiler.SamplingProfiler."""
+        sampler = profiler.SamplingProfiler([AudioPath.on_ready_read])
+        sampler.start(duration)
+        self.profiler = sampler
+        return sampler
     
+    def stop_profiling(self):
+        """Stop profiling, and return the profiler.SamplingProfiler or None if there wasn't one."""
+        sampler, self.profiler = self.profiler, None
+        if sampler is not None:
+            sampler.stop()
+        return sampler
+    
+    def start_session_recording(self, path, record_dry=True):
+        self.stop_session_recording()
+        self.recorder = recorder.SessionRecorder(path, record_dry, self.sample_rate)
+        
+    def stop_session_recording(self):
+        session, self.recorder = self.recorder, None
+        if session is not None:
+            session.close()
+        
     def start(self):
+        self.open_devices()
         self.processing_enabled = True
         
         self.source = self.audio_input.start()
@@ -75,28 +341,187 @@ class AudioPath(QtCore.QObject):
         self.source.readyRead.connect(self.on_ready_read)
     
     def stop(self):
+        if self.audio_input is None:
+            return
         self.audio_input.stop()
         self.audio_output.stop()
     
     def on_ready_read(self):
-        #cast the input data as int32 while it's being processed so that it doesn't get clipped prematurely
-        data = np.fromstring(self.source.readAll(), 'int16').astype(float)
+        sampler = self.profiler
+        if sampler is None:
+            self._read_and_process()
+            return
+        sampler.resume()
+        try:
+            self._read_and_process()
+        finally:
+            sampler.pause()
+    
+    def _read_and_process(self):
+        #the input is converted to floats while it's being processed so that it doesn't get clipped prematurely
+        raw = self.source.readAll()
+        data = self.converter.to_float(raw)
         
         #empty arrays cause a crash; use len(data) since np.array doesn't have an implicit boolean value
         if len(data) == 0:
             return
         
-        if self.processing_enabled:
-            for effect in self.effects:
-                data = effect.process_data(data)
+        if self._updates:
+            self._apply_updates()
+        
+        self.input_meter.publish(data)
+        
+        #read once, since it's set from the GUI thread
+        processing = self.processing_enabled
+        if processing:
+            start = clock.monotonic()
+            reblocker = self._reblocker
+            if reblocker is not None:
+                if not self._processing:
+                    #it still holds the audio from before processing was disabled
+                    reblocker.reset()
+                data = reblocker.process(data, self._process_chains)
+            else:
+                data = self._process_chains(data)
+            self.watchdog.check(clock.monotonic() - start, len(data))
+        else:
+            self.latency = self.looper.latency = 0
+        self._processing = processing
+
+        #record the data and add the playing loop tracks to it
+        data = self.looper.process_data(data)
+            
+        self.output_meter.publish(data)
+        output = self.converter.to_bytes(data)
+        self.sink.write(output)
+        
+        #read recorder once, since it may be replaced from the GUI thread
+        session = self.recorder
+        if session is not None:
+            #the dry track is delayed to line up with the output
+            self._dry_delay.delay = self.latency
+            samples = self.converter.samples(raw)
+            if len(self._dry) != len(samples):
+                self._dry = np.zeros(len(samples), np.int16)
+            self._dry[:] = samples
+            #the queued blocks are copies, since the converter's buffers are reused
+            session.push(output, self._dry_delay.process(self._dry).tostring())
 
-        #add the recorded track to the data
-        if self.playing_loop and len(data) != 0:
-            data += self.playback_track[:len(data)]
-            self.playback_track = np.roll(self.playback_track, -len(data))
+    def _process_chains(self, data):
+        """Run data through the current chain, handling crossfades, tails and warm chains."""
+        if self._next_chain is not None:
+            self._switch_chains(self.chains.get(self._next_chain))
+            self.current_chain = self._next_chain
+            self._next_chain = None
             
-        self.sink.write(data.clip(effects.SAMPLE_MIN, effects.SAMPLE_MAX).astype('int16').tostring())
+            if self._switch_time is not None:
+                instrumentation.record('pedal to switch latency', clock.monotonic() - self._switch_time)
+                self._switch_time = None
+        
+        current = self.chains.get(self.current_chain)
+        size = len(data)
+        
+        self._compensate_latency()
+        
+        fading = [entry[0] for entry in self._outgoing]
+        if self.keep_warm:
+            for other in self.chains.itervalues():
+                if other is not current and other not in fading and other not in self._tails:
+                    other.process_data(self._scratch_copy(data))
+        
+        #the outgoing chains are mixed into their own buffer, since data is the input of the current chain
+        old = None
+        for entry in self._outgoing:
+            outgoing, position = entry
+            #each outgoing chain gets its own copy since effects may work in place
+            faded = self._scratch_copy(data)
+            if self.ring_out_tails:
+                #fade the input rather than the output so that the tails keep ringing
+                self._apply_fade(faded, self._fade_out, position, zero_rest=True)
+                faded = outgoing.process_data(faded)
+            else:
+                faded = outgoing.process_data(faded)
+                self._apply_fade(faded, self._fade_out, position, zero_rest=True)
+            if old is None:
+                old = self._mix.get(size)
+                old[:] = faded
+            else:
+                old += faded
+            entry[1] += size
+        
+        if current is not None:
+            data = current.process_data(data)
+        if self._fade_pos < self.crossfade_samples:
+            self._apply_fade(data, self._fade_in, self._fade_pos, zero_rest=False)
+            self._fade_pos += size
+        if old is not None:
+            data += old
+        
+        for entry in [entry for entry in self._outgoing if entry[1] >= self.crossfade_samples]:
+            self._outgoing.remove(entry)
+            if self.ring_out_tails:
+                self._tails.append(entry[0])
+        
+        for tail in list(self._tails):
+            if tail is current:
+                #switched back to a chain that was still ringing out
+                self._tails.remove(tail)
+                continue
+            data += tail.process_data(self._silence.zeros(size))
+            if tail.tail_level() < chain.TAIL_THRESHOLD:
+                self._tails.remove(tail)
+        
+        return data
+    
+    def _switch_chains(self, incoming):
+        """Start fading the current chain out and incoming in, each from the gain it's at now."""
+        last = self.crossfade_samples - 1
+        outgoing = self.chains.get(self.current_chain)
+        #the ramps mirror each other, so position p of one has the gain of position last - p of the other
+        fade_in = 0
+        for entry in list(self._outgoing):
+            if entry[0] is incoming:
+                fade_in = max(last - entry[1], 0)
+                self._outgoing.remove(entry)
+        if outgoing is not None and outgoing is not incoming:
+            self._outgoing.append([outgoing, max(last - self._fade_pos, 0)])
+        self._fade_pos = fade_in
+        if incoming in self._tails:
+            #switched back to a chain that was still ringing out
+            self._tails.remove(incoming)
+    
+    def _compensate_latency(self):
+        """Delay the chains being mixed to line up with the one with the highest latency.
+        
+        Only the current chain and those fading or ringing out are heard, so a chain with
+        a high latency only delays the others while it's mixed with them, and the current
+        chain alone isn't delayed at all. Warm chains' output is discarded.
+        """
+        current = self.chains.get(self.current_chain)
+        mixed = [current] if current is not None else []
+        mixed += [entry[0] for entry in self._outgoing] + self._tails
+        latencies = [(c, int(round(c.latency))) for c in mixed]
+        highest = max([latency for c, latency in latencies] + [0])
+        for c in self.chains.itervalues():
+            c.compensation = 0
+        for c, latency in latencies:
+            c.compensation = highest - latency
+        self.latency = highest + (self.block_size or 0)
+        self.looper.latency = self.latency
+    
+    def _scratch_copy(self, data):
+        copy = self._scratch.get(len(data))
+        copy[:] = data
+        return copy
+    
+    def _apply_fade(self, data, ramp, position, zero_rest):
+        """Multiply data in place by the part of ramp starting at position.
         
-        #record the data it's written to the sink to reduce latency
-        if self.recording_loop:
-            self.record_track = np.concatenate((self.record_track, data))
+        Samples past the end of the ramp are zeroed if zero_rest is True and left
+        unchanged otherwise.
+        """
+        start = min(position, self.crossfade_samples)
+        count = min(len(data), self.crossfade_samples - start)
+        data[:count] *= ramp[start:start + count]
+        if zero_rest:
+            data[count:] = 0
@@ -0,0 +1,200 @@
+"""Render a directory tree of WAV files through one or more presets, in parallel.
+
+Usage: python batch.py INPUT_DIRECTORY OUTPUT_DIRECTORY PRESET [PRESET ...]
+                       [--quality TIER] [--block-size SAMPLES] [--jobs N] [--force]
+
+Every WAV file under INPUT_DIRECTORY is rendered through every PRESET, as
+render.py does for one file, into OUTPUT_DIRECTORY/<preset name>/ with the
+same relative path. The files x presets are shared out over a pool of --jobs
+processes, one per core by default. Each file is streamed a block at a time,
+so memory use doesn't depend on the length of the files.
+
+Outputs that are newer than both their input and their preset are skipped,
+unless --force is given, so an interrupted batch picks up where it left off.
+Each output is written to a .partial file first and only renamed once it's
+complete, so an interrupted render is never mistaken for a finished one.
+Each file is rendered at its own sample rate. Files that can't be rendered,
+for example because they aren't 16 bit mono, are reported and the batch
+carries on.
+"""
+
+import multiprocessing
+import os
+import signal
+import sys
+import traceback
+
+import chain
+import clock
+import effects
+import render
+
+__all__ = ['find_inputs', 'plan', 'run_batch']
+
+#suffix of outputs that are still being written
+PARTIAL_SUFFIX = '.partial'
+
+def find_inputs(directory, exclude=None):
+    """Return the paths, relative to directory, of the WAV files under it, in order.
+
+    exclude is a directory that isn't searched, so that outputs written inside
+    the input tree aren't taken for inputs.
+    """
+    exclude = os.path.abspath(exclude) if exclude else None
+    inputs = []
+    for root, directories, files in os.walk(directory):
+        directories[:] = sorted(name for name in directories
+                                if os.path.abspath(os.path.join(root, name)) != exclude)
+        for name in sorted(files):
+            if name.lower().endswith('.wav'):
+                inputs.append(os.path.relpath(os.path.join(root, name), directory))
+    return inputs
+
+def _preset_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+def _up_to_date(output_path, sources):
+    if not os.path.exists(output_path):
+        return False
+    modified = os.path.getmtime(output_path)
+    return all(os.path.getmtime(source) <= modified for source in sources)
+
+def plan(input_directory, output_directory, presets, force=False):
+    """Return (jobs, skipped): the (preset, input, output) paths still to render, and the number up to date."""
+    jobs = []
+    skipped = 0
+    inputs = find_inputs(input_directory, exclude=output_directory)
+    for preset in presets:
+        for relative_path in inputs:
+            input_path = os.path.join(input_directory, relative_path)
+            output_path = os.path.join(output_directory, _preset_name(preset), relative_path)
+            if not force and _up_to_date(output_path, [input_path, preset]):
+                skipped += 1
+            else:
+                jobs.append((preset, input_path, output_path))
+    return jobs, skipped
+
+def _ignore_interrupts():
+    #the parent handles Ctrl+C and terminates the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def _render_job(job):
+    """Render one file in a worker. Returns (job, seconds of audio, seconds taken, error message or None)."""
+    (preset, input_path, output_path), quality, block_size = job
+    start = clock.monotonic()
+    partial_path = output_path + PARTIAL_SUFFIX
+    try:
+        directory = os.path.dirname(output_path)
+        if directory and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                #another worker made it first
+                if not os.path.isdir(directory):
+                    raise
+        #a fresh chain for each file, so no state carries over between files
+        effect_chain = render.load_preset(preset, quality)
+        samples = render.render_file(effect_chain, input_path, partial_path, block_size)
+        duration = samples / float(effect_chain.stream_rate)
+        if os.path.exists(output_path):
+            #rename doesn't replace files on Windows
+            os.remove(output_path)
+        os.rename(partial_path, output_path)
+    except (IOError, OSError, EOFError, ValueError) as error:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        return job[0], 0, clock.monotonic() - start, str(error)
+    except Exception:
+        return job[0], 0, clock.monotonic() - start, traceback.format_exc()
+    return job[0], duration, clock.monotonic() - start, None
+
+def run_batch(jobs, quality='normal', block_size=chain.BLOCK_SIZE, processes=None):
+    """Render jobs, as returned by plan(), over a pool of processes, one per core by default.
+
+    Prints each file as it finishes. Returns (rendered, failed, seconds of audio, cpu_seconds).
+    """
+    processes = processes or multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(min(processes, max(len(jobs), 1)), _ignore_interrupts)
+    rendered = failed = 0
+    duration = cpu_seconds = 0.0
+    try:
+        results = pool.imap_unordered(_render_job, [(job, quality, block_size) for job in jobs])
+        for done, ((preset, input_path, output_path), job_duration, seconds, error) in enumerate(results, 1):
+            cpu_seconds += seconds
+            if error is None:
+                rendered += 1
+                duration += job_duration
+                print '[%i/%i] %s' % (done, len(jobs), output_path)
+            else:
+                failed += 1
+                print '[%i/%i] Error: %s through %s: %s' % (done, len(jobs), input_path,
+                                                          _preset_name(preset), error.strip())
+        pool.close()
+    except:
+        #including KeyboardInterrupt, which leaves .partial files for the next run to redo
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return rendered, failed, duration, cpu_seconds
+
+def main(args):
+    quality = 'normal'
+    block_size = chain.BLOCK_SIZE
+    processes = None
+    force = False
+    paths = []
+    while args:
+        arg = args.pop(0)
+        if arg == '--quality':
+            quality = args.pop(0)
+        elif arg == '--block-size':
+            block_size = int(args.pop(0))
+        elif arg == '--jobs':
+            processes = int(args.pop(0))
+        elif arg == '--force':
+            force = True
+        else:
+            paths.append(arg)
+
+    if len(paths) < 3:
+        print __doc__
+        return 2
+    if quality not in effects.QUALITY_TIERS:
+        print 'Unknown quality %r, use one of %s' % (quality, ', '.join(effects.QUALITY_TIERS))
+        return 2
+    input_directory, output_directory = paths[:2]
+    presets = paths[2:]
+    names = [_preset_name(preset) for preset in presets]
+    if len(set(names)) != len(names):
+        print 'Presets must have different names, since each gets its own output directory'
+        return 2
+    for preset in presets:
+        #fail before starting the pool, rather than once per file
+        try:
+            render.load_preset(preset)
+        except (IOError, ValueError) as error:
+            print 'Error:', error
+            return 2
+
+    jobs, skipped = plan(input_directory, output_directory, presets, force)
+    print '%i files to render, %i up to date' % (len(jobs), skipped)
+    if not jobs:
+        return 0
+
+    start = clock.monotonic()
+    try:
+        rendered, failed, duration, cpu_seconds = run_batch(jobs, quality, block_size, processes)
+    except KeyboardInterrupt:
+        print 'Interrupted, run again to resume'
+        return 1
+    elapsed = clock.monotonic() - start
+
+    print 'Rendered %i files, %i failed, %i skipped' % (rendered, failed, skipped)
+    print '%.1f s of audio in %.2f s at %s quality: %.1fx realtime overall, %.1fx per process' % (
+        duration, elapsed, quality, duration / elapsed if elapsed else 0,
+        duration / cpu_seconds if cpu_seconds else 0)
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,132 @@
+"""Measure the processing cost of every effect without an audio device.
+
+Usage: python benchmark.py [--block-size SAMPLES] [--blocks COUNT]
+
+Each effect processes blocks of noise at the 16 bit scale, chain.BLOCK_SIZE
+samples long unless --block-size is given. The cost is shown per block and
+as a percentage of the block's duration, which is the budget that the whole
+chain has to fit in. Effects that support oversampling are
+also measured at each oversampling factor, and effects with several quality
+tiers at each tier, at their highest oversampling factor. The conversion of each block from
+the device's 16 bit samples to floats and back is measured separately, since
+it's part of every callback whatever effects are used. Last, a sweep of
+SWEEP_COUNT settings through a chain of the effects that can be stacked is
+compared with running that many chains one after another.
+"""
+
+import sys
+
+import numpy as np
+
+import chain
+import clock
+import convert
+import effects
+import instrumentation
+import sweep
+
+#settings in the sweep benchmark
+SWEEP_COUNT = 64
+
+def block_duration(block_size):
+    return block_size / float(effects.SAMPLE_RATE)
+
+def measure(process, block_size, blocks):
+    """Return the mean time in seconds that process takes on a block of noise."""
+    noise = np.random.RandomState(0).randn(block_size) * effects.SAMPLE_MAX / 4
+
+    #process one block first so that one-off setup isn't measured
+    process(noise.copy())
+
+    total = 0
+    for _ in range(blocks):
+        data = noise.copy()
+        start = clock.monotonic()
+        process(data)
+        total += clock.monotonic() - start
+    return total / blocks
+
+def print_result(label, seconds, block_size):
+    budget = seconds / block_duration(block_size) * 100
+    print '  %-40s %9.1f us %6.2f%%' % (label, seconds * 1e6, budget)
+
+def benchmark_effects(block_size, blocks):
+    for effect_class in sorted(effects.available_effects, key=lambda e: e.name):
+        factors = effects.OVERSAMPLING_FACTORS if effect_class.supports_oversampling else (1,)
+        settings = [(factor, 'normal') for factor in factors]
+        settings += [(factors[-1], tier) for tier in effect_class.tiers if tier != 'normal']
+        for factor, tier in settings:
+            effect = effect_class()
+            effect.set_oversampling(factor)
+            effect.set_quality(tier)
+            details = (['%ix' % factor] if factor > 1 else []) + ([tier] if tier != 'normal' else [])
+            label = '%s (%s)' % (effect.name, ', '.join(details)) if details else effect.name
+            print_result(label, measure(effect.process, block_size, blocks), block_size)
+
+def benchmark_conversion(block_size, blocks):
+    noise = np.random.RandomState(0).randn(block_size) * effects.SAMPLE_MAX / 4
+    raw = noise.clip(effects.SAMPLE_MIN, effects.SAMPLE_MAX).astype('int16').tostring()
+
+    def copying(data):
+        #the conversion the audio path used to do, for comparison
+        data = np.fromstring(raw, 'int16').astype(float)
+        return data.clip(effects.SAMPLE_MIN, effects.SAMPLE_MAX).astype('int16').tostring()
+    print_result('fromstring, astype, clip, tostring', measure(copying, block_size, blocks), block_size)
+
+    for dither in (False, True):
+        converter = convert.SampleConverter(dither)
+        def converting(data):
+            return converter.to_bytes(converter.to_float(raw))
+        label = 'SampleConverter (dithered)' if dither else 'SampleConverter'
+        print_result(label, measure(converting, block_size, blocks), block_size)
+
+def benchmark_sweep(block_size, blocks):
+    stackable = [effect_class() for effect_class in sorted(effects.available_effects, key=lambda e: e.name)
+                 if effect_class.batch_parameters]
+    effect_chain = chain.EffectChain(stackable)
+    print_result('one chain of %i effects' % len(stackable), measure(effect_chain.process_data, block_size, blocks),
+                 block_size)
+
+    #every setting differs in the first parameter that can be stacked
+    effect = stackable[0]
+    param = effect.parameters[effect.batch_parameters[0]]
+    values = np.linspace(param.minimum, param.maximum, SWEEP_COUNT)
+    chains = [chain.EffectChain(sweep.copy_effect(other, {effect.batch_parameters[0]: value} if other is effect else {})
+                                for other in stackable) for value in values]
+    def looping(data):
+        for effect_chain in chains:
+            effect_chain.process_data(data.copy())
+    print_result('%i chains one after another' % SWEEP_COUNT, measure(looping, block_size, blocks), block_size)
+
+    sweep_chain = sweep.SweepChain(stackable, sweep.grid(0, effect.batch_parameters[0], values))
+    stacked = np.zeros((SWEEP_COUNT, block_size))
+    def sweeping(data):
+        stacked[:] = data
+        sweep_chain.process_data(stacked)
+    print_result('SweepChain of %i settings' % SWEEP_COUNT, measure(sweeping, block_size, blocks), block_size)
+
+def main(args):
+    #the size of the blocks the audio path runs the chains on
+    block_size = chain.BLOCK_SIZE
+    blocks = 200
+    if '--block-size' in args:
+        block_size = int(args[args.index('--block-size') + 1])
+    if '--blocks' in args:
+        blocks = int(args[args.index('--blocks') + 1])
+
+    print 'Block size %i samples, budget %.2f ms per block' % (block_size, block_duration(block_size) * 1000)
+    print
+    print 'Conversion:'
+    benchmark_conversion(block_size, blocks)
+    print
+    print 'Effects:'
+    benchmark_effects(block_size, blocks)
+    print
+    print 'Sweep:'
+    benchmark_sweep(block_size, blocks)
+    print
+    print 'Instrumentation:'
+    print instrumentation.report()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
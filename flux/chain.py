@@ -0,0 +1,424 @@
+import fractions
+
+import numpy as np
+
+import clock
+import effects
+from effects import SAMPLE_RATE
+from effects._resample import Resampler, HIGH_QUALITY_TAPS
+
+#peak level below which a ringing tail is considered to have decayed
+TAIL_THRESHOLD = 4
+
+#the number of samples that the audio path runs its chains on at a time
+BLOCK_SIZE = 256
+
+#the samples over which a chain's output crosses over when its compensation changes
+COMPENSATION_FADE = 128
+
+#blocks that a FusedStage's parameters must stay unchanged for before its lookup table is rebuilt
+TABLE_SETTLE_BLOCKS = 16
+
+class EffectChain(object):
+    """An ordered list of AudioEffects that audio is passed through.
+
+    A run of two or more stateless effects that aren't oversampled, at the head
+    of a chain whose input is 16 bit integers as it is from the audio device,
+    is grouped into a FusedStage, which costs one table lookup per block
+    however many effects it has. Anywhere else the effects' input isn't whole
+    numbers, so they run one after another. Bypassed effects are skipped
+    entirely, except for effects whose tail is still ringing out, which are fed silence until the tail falls below
+    TAIL_THRESHOLD. The output of effects with a meter is published to it,
+    so a metered effect always ends a fused run.
+
+    The output can be delayed by a further compensation samples, so that it
+    lines up with chains that have a higher latency.
+
+    If watchdog is set to a watchdog.Watchdog, the time each stage takes is
+    recorded with it.
+
+    The effects run at sample_rate. If the audio passed to process_data is at
+    another rate, stream_rate, it's resampled at the edges of the chain by a
+    RateConverter. See set_sample_rate.
+
+    Parameters:
+        effects -- a list of AudioEffect instances, applied in order
+    """
+    def __init__(self, effects=()):
+        self.effects = list(effects)
+
+        #True if the chain's input is always whole numbers in the 16 bit range, as it
+        #is straight from the audio device. This lets a leading FusedStage use a table.
+        self.integer_input = True
+
+        #extra delay added to the output, set by whoever mixes this chain with others
+        self.compensation = 0
+        self._delay = DelayLine(fade=COMPENSATION_FADE)
+
+        self.watchdog = None
+
+        self.sample_rate = SAMPLE_RATE
+        self.stream_rate = SAMPLE_RATE
+        self._converter = None
+
+        self._silence = ScratchBuffer()
+        self._stage_key = None
+        self._stages = []
+
+    def set_sample_rate(self, sample_rate, stream_rate=None):
+        """Run the effects at sample_rate, on audio that arrives at stream_rate, both in Hz.
+
+        stream_rate defaults to sample_rate. Effects added to the chain later
+        must be given the rate with their own set_sample_rate.
+        """
+        stream_rate = stream_rate or sample_rate
+        for effect in self.effects:
+            if effect.sample_rate != sample_rate:
+                effect.set_sample_rate(sample_rate)
+        if (sample_rate, stream_rate) != (self.sample_rate, self.stream_rate):
+            self._converter = RateConverter(stream_rate, sample_rate) if stream_rate != sample_rate else None
+            self.sample_rate = sample_rate
+            self.stream_rate = stream_rate
+            #whether a FusedStage can use a lookup table depends on the converter
+            self._stage_key = None
+
+    def stages(self):
+        """Return the effects and FusedStages that process_data runs, rebuilding them if the chain changed."""
+        key = [(effect, effect.bypassed, effect.oversampling, effect.meter is not None) for effect in self.effects]
+        if key != self._stage_key:
+            self._stage_key = key
+            self._stages = self._build_stages()
+        return self._stages
+
+    def _build_stages(self):
+        stages = []
+        run = []
+        for effect in self.effects:
+            if effect.stateless and effect.oversampling == 1:
+                #a bypassed stateless effect has no tail, so it doesn't break up a run
+                if not effect.bypassed:
+                    run.append(effect)
+                    if effect.meter is not None:
+                        #its output must be seen, so the run can't continue past it
+                        self._add_run(stages, run)
+                        run = []
+                continue
+
+            self._add_run(stages, run)
+            run = []
+            if not effect.bypassed or effect.has_tail:
+                stages.append(effect)
+        self._add_run(stages, run)
+        return stages
+
+    def _add_run(self, stages, run):
+        #only the chain's own input is whole numbers, and resampled input isn't
+        if len(run) > 1 and self.integer_input and self._converter is None and not stages:
+            stages.append(FusedStage(run))
+        else:
+            stages.extend(run)
+
+    def process_data(self, data):
+        if self._converter is not None:
+            data = self._converter.process(data, self._process_stages)
+        else:
+            data = self._process_stages(data)
+
+        if self.compensation or self._delay.delay:
+            self._delay.delay = self.compensation
+            data = self._delay.process(data)
+        return data
+
+    def _process_stages(self, data):
+        watchdog = self.watchdog
+        for stage in self.stages():
+            if watchdog is not None:
+                start = clock.monotonic()
+            if not stage.bypassed:
+                data = stage.process(data)
+                meter = stage.meter
+                if meter is not None:
+                    meter.publish(data)
+            elif stage.tail_active:
+                data += stage.process(self._silence.zeros(len(data)))
+                if stage.tail_level() < TAIL_THRESHOLD:
+                    stage.tail_active = False
+            if watchdog is not None:
+                watchdog.record(stage, clock.monotonic() - start)
+        return data
+
+    @property
+    def latency(self):
+        """The delay that the chain's effects and any resampling add, in samples at stream_rate, not including compensation."""
+        latency = sum(effect.latency for effect in self.effects if not effect.bypassed)
+        if self._converter is None:
+            return latency
+        return latency * self.stream_rate / float(self.sample_rate) + self._converter.latency
+
+    def tail_level(self):
+        """Return the peak level of the tails still to be output by the chain's effects."""
+        return max([effect.tail_level() for effect in self.effects
+                    if not effect.bypassed or effect.tail_active] + [0])
+
+class FusedStage(object):
+    """A run of stateless effects that runs as one table lookup.
+
+    The whole run is tabulated over every possible 16 bit input value, and
+    each block costs a single table lookup however many effects there are.
+    Input that isn't whole numbers, such as a faded ring out, is rounded to
+    the nearest entry. Building the table costs as much as 65536 samples of
+    processing, so while the parameters are changing, for example during a
+    knob sweep, the effects are applied one after another, and the table is
+    only rebuilt once they have stayed the same for TABLE_SETTLE_BLOCKS blocks.
+
+    Parameters:
+        effects -- a list of AudioEffects with stateless set
+    """
+    bypassed = False
+
+    #every possible 16 bit input value, in order
+    _domain = np.arange(effects.SAMPLE_MIN, effects.SAMPLE_MAX + 1, dtype=float)
+
+    def __init__(self, effects):
+        self.effects = effects
+        self._table = None
+        self._table_key = None
+        #the parameters that the table will be built for once they settle, and the blocks they've been unchanged for
+        self._pending_key = None
+        self._settled = 0
+        self._rounded = np.zeros(0)
+        self._index = np.zeros(0, int)
+
+    @property
+    def meter(self):
+        #only the last effect of a run can have a meter
+        return self.effects[-1].meter
+
+    def _parameter_values(self):
+        return [param.value for effect in self.effects for param in effect.parameters.itervalues()]
+
+    def _apply(self, data):
+        for effect in self.effects:
+            data = effect.process_data(data)
+        return data
+
+    def process(self, data):
+        key = self._parameter_values()
+        if key != self._table_key:
+            if key != self._pending_key:
+                self._pending_key = key
+                self._settled = 0
+            self._settled += 1
+            if self._settled < TABLE_SETTLE_BLOCKS:
+                return self._apply(data)
+            self._table = self._apply(self._domain.copy())
+            self._table_key = key
+            self._pending_key = None
+
+        size = len(data)
+        if len(self._index) < size:
+            self._rounded = np.zeros(size)
+            self._index = np.zeros(size, int)
+        rounded = self._rounded[:size]
+        index = self._index[:size]
+        #assigning to index alone would truncate
+        np.rint(data, out=rounded)
+        index[:] = rounded
+        index -= effects.SAMPLE_MIN
+        np.take(self._table, index, out=data, mode='clip')
+        return data
+
+class DelayLine(object):
+    """Delays a stream of blocks by a whole number of samples.
+
+    The delay can be changed between blocks. When it grows, silence is
+    inserted; when it shrinks, the oldest delayed samples are discarded. If
+    fade is set, the output crosses over from the old delay to the new one
+    over the first fade samples of the next block, rather than jumping, and
+    the delayed signal fades back in over fade samples after inserted silence.
+
+    Parameters:
+        delay -- the delay in samples
+        dtype -- the type of the samples
+        fade  -- the length of the crossover when the delay changes, in samples
+    """
+    def __init__(self, delay=0, dtype=float, fade=0):
+        self.delay = delay
+        self.fade = fade
+        self._buffer = np.zeros(delay, dtype)
+        self._scratch = np.zeros(0, dtype)
+
+    def process(self, data):
+        """Delay data in place and return it."""
+        delay = int(self.delay)
+        fade_from = None
+        resume = None
+        if len(self._buffer) != delay:
+            if self.fade and len(data):
+                #the output at the old delay
+                fade_from = np.concatenate((self._buffer, data))[:len(data)]
+                if delay > len(self._buffer):
+                    #where the delayed signal resumes after the inserted silence
+                    resume = delay - len(self._buffer)
+            buffer = np.zeros(delay, self._buffer.dtype)
+            kept = min(delay, len(self._buffer))
+            buffer[delay - kept:] = self._buffer[len(self._buffer) - kept:]
+            self._buffer = buffer
+        if delay:
+            self._delay(data, delay, resume)
+        if fade_from is not None:
+            count = min(len(data), self.fade)
+            ramp = np.arange(count) / float(count)
+            data[:count] = fade_from[:count] + (data[:count] - fade_from[:count]) * ramp
+        return data
+
+    def _delay(self, data, delay, resume=None):
+        size = len(data)
+        if len(self._scratch) < size + delay:
+            self._scratch = np.zeros(size + delay, self._buffer.dtype)
+        joined = self._scratch[:size + delay]
+        joined[:delay] = self._buffer
+        joined[delay:] = data
+        if resume is not None:
+            faded = joined[resume:resume + self.fade]
+            faded *= np.arange(len(faded)) / float(self.fade)
+        data[:] = joined[:size]
+        self._buffer[:] = joined[size:]
+
+class Fifo(object):
+    """A first in, first out ring buffer of samples, which grows when it's full.
+
+    Parameters:
+        capacity -- the number of samples it can hold before growing
+    """
+    def __init__(self, capacity=0):
+        self._data = np.zeros(capacity)
+        self._start = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def clear(self):
+        self._start = 0
+        self._count = 0
+
+    def write(self, data):
+        size = len(data)
+        if self._count + size > len(self._data):
+            self._grow(self._count + size)
+        capacity = len(self._data)
+        end = (self._start + self._count) % capacity
+        first = min(size, capacity - end)
+        self._data[end:end + first] = data[:first]
+        self._data[:size - first] = data[first:]
+        self._count += size
+
+    def read(self, out):
+        """Fill out with the oldest len(out) samples, remove them and return out."""
+        size = len(out)
+        if size > self._count:
+            raise ValueError('only %i samples available, %i requested' % (self._count, size))
+        if not size:
+            return out
+        capacity = len(self._data)
+        first = min(size, capacity - self._start)
+        out[:first] = self._data[self._start:self._start + first]
+        out[first:] = self._data[:size - first]
+        self._start = (self._start + size) % capacity
+        self._count -= size
+        return out
+
+    def _grow(self, size):
+        count = self._count
+        data = np.zeros(max(size, 2 * len(self._data)))
+        self.read(data[:count])
+        self._data = data
+        self._start = 0
+        self._count = count
+
+class Reblocker(object):
+    """Runs a function on blocks of exactly block_size samples, whatever size blocks arrive in.
+
+    Input is collected in a ring buffer until a whole block is available, and
+    output is taken from another, so process() returns as many samples as it's
+    given. This delays the audio by latency samples, which is block_size.
+
+    Parameters:
+        block_size -- the number of samples passed to the function at a time
+    """
+    def __init__(self, block_size):
+        self.block_size = block_size
+        self._input = Fifo(4 * block_size)
+        self._output = Fifo(4 * block_size)
+        self._output.write(np.zeros(block_size))
+        self._block = np.zeros(block_size)
+
+    @property
+    def latency(self):
+        return self.block_size
+
+    def reset(self):
+        """Discard the samples held, so that the output starts again with block_size samples of silence."""
+        self._input.clear()
+        self._output.clear()
+        self._block[:] = 0
+        self._output.write(self._block)
+
+    def process(self, data, function):
+        """Pass data through function in fixed size blocks. data is overwritten with the output and returned."""
+        self._input.write(data)
+        while len(self._input) >= self.block_size:
+            self._output.write(function(self._input.read(self._block)))
+        return self._output.read(data)
+
+class RateConverter(object):
+    """Runs a function at another sample rate, resampling a stream of blocks to it and back.
+
+    Each block is resampled to rate, passed through the function and resampled
+    back to stream_rate with streaming polyphase filters, so the output is
+    continuous and doesn't depend on the block size. Round trips return at
+    least as many samples as were put in, and the extra few are kept in a
+    Fifo for the next block, so process() returns as many samples as it's given.
+
+    Parameters:
+        stream_rate -- the rate of the blocks passed to process [Hz]
+        rate        -- the rate the function runs at [Hz]
+        taps        -- the resampling filters' length per input sample
+    """
+    def __init__(self, stream_rate, rate, taps=HIGH_QUALITY_TAPS):
+        self.stream_rate = stream_rate
+        self.rate = rate
+        ratio = fractions.Fraction(rate, stream_rate)
+        self._in = Resampler(ratio.numerator, ratio.denominator, taps)
+        self._out = Resampler(ratio.denominator, ratio.numerator, taps)
+        self._output = Fifo(4 * BLOCK_SIZE)
+
+    @property
+    def latency(self):
+        """The delay added by the resampling filters, in samples at stream_rate."""
+        return self._in.latency + self._out.latency * self.stream_rate / float(self.rate)
+
+    def process(self, data, function):
+        """Run function on data at rate. data is overwritten with the output and returned."""
+        resampled = self._in.process(data)
+        if len(resampled):
+            self._output.write(self._out.process(function(resampled)))
+        return self._output.read(data)
+
+class ScratchBuffer(object):
+    """A reusable float buffer that only reallocates when a larger block is requested."""
+    def __init__(self, size=0):
+        self._data = np.zeros(size)
+
+    def get(self, size):
+        """Return a view of size samples. The contents are undefined."""
+        if size > len(self._data):
+            self._data = np.zeros(size)
+        return self._data[:size]
+
+    def zeros(self, size):
+        """Return a view of size samples set to zero."""
+        data = self.get(size)
+        data.fill(0)
+        return data
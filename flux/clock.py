@@ -0,0 +1,49 @@
+"""A monotonic clock for timestamping events and measuring intervals.
+
+Python 2 has no time.monotonic, and time.clock measures processor time on
+everything but Windows, so the system's monotonic clock is used directly.
+"""
+
+import ctypes
+import ctypes.util
+import platform
+import time
+
+__all__ = ['monotonic']
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+def _posix_monotonic():
+    #CLOCK_MONOTONIC is 6 on OS X (10.12 and later) and 1 on Linux
+    clock_id = 6 if platform.system() == 'Darwin' else 1
+
+    for name in ('c', 'rt'):
+        path = ctypes.util.find_library(name)
+        if path is None:
+            continue
+        try:
+            clock_gettime = ctypes.CDLL(path, use_errno=True).clock_gettime
+            break
+        except (OSError, AttributeError):
+            continue
+    else:
+        return None
+
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+    ts = _timespec()
+    if clock_gettime(clock_id, ctypes.byref(ts)) != 0:
+        return None
+
+    def monotonic():
+        clock_gettime(clock_id, ctypes.byref(ts))
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+    return monotonic
+
+if hasattr(time, 'monotonic'):
+    monotonic = time.monotonic
+elif platform.system() == 'Windows':
+    #time.clock uses QueryPerformanceCounter on Windows
+    monotonic = time.clock
+else:
+    monotonic = _posix_monotonic() or time.time
@@ -0,0 +1,79 @@
+"""Conversion between the audio device's 16 bit samples and the float blocks that effects process."""
+
+import numpy as np
+
+from effects import SAMPLE_MIN, SAMPLE_MAX
+
+__all__ = ['SampleConverter']
+
+#length of the table of dither noise, which is read cyclically
+DITHER_TABLE_SIZE = 1 << 16
+
+class SampleConverter(object):
+    """Converts 16 bit sample buffers to floats and back, reusing its buffers between blocks.
+
+    to_float() reads the device's buffer in place and converts it into a float
+    buffer that is kept between calls. to_bytes() optionally dithers, and clips
+    the output straight into a reusable int16 buffer, and returns its bytes as
+    a string, which the device and the wave module both accept. The buffers
+    only grow, and arrays returned are only valid until the next call.
+
+    Parameters:
+        dither -- if True, triangular dither of +-1 LSB is added before rounding on output
+    """
+    def __init__(self, dither=False):
+        self.dither = dither
+        self._float = np.zeros(0)
+        self._int = np.zeros(0, np.int16)
+
+        noise = np.random.RandomState(0)
+        self._dither_table = noise.random_sample(DITHER_TABLE_SIZE) - noise.random_sample(DITHER_TABLE_SIZE)
+        self._dither_position = 0
+
+    def samples(self, buffer):
+        """Return a read only int16 view of a buffer of 16 bit samples, without copying it."""
+        try:
+            return np.frombuffer(buffer, np.int16)
+        except (TypeError, AttributeError):
+            #bindings whose byte arrays don't expose the buffer interface
+            return np.frombuffer(buffer.data(), np.int16)
+
+    def to_float(self, buffer):
+        """Return the 16 bit samples in buffer as floats."""
+        samples = self.samples(buffer)
+        size = len(samples)
+        if len(self._float) < size:
+            self._float = np.zeros(size)
+        data = self._float[:size]
+        data[:] = samples
+        return data
+
+    def to_int(self, data):
+        """Clip data to the 16 bit range and pack it into int16 samples. data is modified if dithering."""
+        size = len(data)
+        if len(self._int) < size:
+            self._int = np.zeros(size, np.int16)
+        out = self._int[:size]
+
+        if self.dither:
+            self._add_dither(data)
+            np.rint(data, out=data)
+
+        #clipping straight into out truncates like astype, without an intermediate array
+        data.clip(SAMPLE_MIN, SAMPLE_MAX, out)
+        return out
+
+    def to_bytes(self, data):
+        """Clip data, pack it as 16 bit samples and return their bytes as a string. data is modified if dithering."""
+        return self.to_int(data).tostring()
+
+    def _add_dither(self, data):
+        position = self._dither_position
+        table = self._dither_table
+        done = 0
+        while done < len(data):
+            count = min(len(data) - done, len(table) - position)
+            data[done:done + count] += table[position:position + count]
+            done += count
+            position = (position + count) % len(table)
+        self._dither_position = position
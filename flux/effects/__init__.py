@@ -9,8 +9,6 @@ import importlib
 import sys
 import inspect
 
-from PySide import QtCore
-
 import _base
 from _base import *
 
@@ -1,28 +1,191 @@
+"""The effects' base classes and parameter model, which depend only on numpy, not on Qt."""
+
 import collections
 
-from PySide import QtCore
+import numpy as np
+
+from _resample import Oversampler, OVERSAMPLING_FACTORS, TAPS, HIGH_QUALITY_TAPS
 
 __all__ = ['SAMPLE_SIZE', 'SAMPLE_RATE', 'SAMPLE_MAX', 'NYQUIST', 'SAMPLE_MIN', 'CHANNEL_COUNT', 'BUFFER_SIZE',
-           'AudioEffect', 'Parameter', 'TempoParameter', 'DiscreteParameter'] 
+           'OVERSAMPLING_FACTORS', 'QUALITY_TIERS', 'AudioEffect', 'Parameter', 'TempoParameter', 'DiscreteParameter'] 
 
 SAMPLE_MAX = 32767
 SAMPLE_MIN = -(SAMPLE_MAX + 1)
-SAMPLE_RATE = 44100 # [Hz]
+SAMPLE_RATE = 44100 # [Hz], the default rate of effects, see AudioEffect.set_sample_rate
 NYQUIST = SAMPLE_RATE / 2
 SAMPLE_SIZE = 16 # [bit]
 CHANNEL_COUNT = 1
 BUFFER_SIZE = 2500 #this is the smallest buffer that prevents underruns on my machine
 
+#implementation tiers that an effect can declare, cheapest first. See AudioEffect.set_quality.
+QUALITY_TIERS = ('draft', 'normal', 'high')
 
-class AudioEffect(QtCore.QObject):
+
+class AudioEffect(object):
     """Base class for audio effects."""
     name = 'Unknown Effect'
     description = ''
     
+    #True for effects whose output continues after their input stops, such as delays
+    has_tail = False
+    
+    #True for effects whose process_data maps each sample independently of all
+    #others and of previous blocks. EffectChain fuses runs of these effects.
+    stateless = False
+    
+    #True for nonlinear effects that alias, which can be run at a higher sample rate
+    supports_oversampling = False
+    
+    #the QUALITY_TIERS that the effect implements, cheapest first. For effects that support
+    #oversampling, the base class makes the draft tier skip oversampling and the high tier
+    #use sharper resampling filters. Other effects check self.tier in process_data.
+    tiers = ('normal',)
+    
+    #the names of the parameters that stacked instances can differ in, or None for effects
+    #that can't be stacked. See stack().
+    batch_parameters = None
+    
     def __init__(self):
-        """parameters -- A dictionary of str(param_name):Parameter items that describes all parameters that a user can alter."""
+        """parameters  -- A dictionary of str(param_name):Parameter items that describes all parameters that a user can alter.
+        bypassed    -- If True, process_data isn't called and the data passes through unchanged.
+        trails      -- If True, bypassing an effect with a tail lets the tail ring out.
+        meter       -- A metering.MeterTap that EffectChain publishes the effect's output to, or None.
+        quality     -- The tier asked for with set_quality.
+        tier        -- The tier in use, which is lower than quality if the effect doesn't have it or is degraded.
+        sample_rate -- The rate of the audio passed to process, in Hz. See set_sample_rate.
+        """
         super(AudioEffect, self).__init__()
         self.parameters = {}
+        self.bypassed = False
+        self.trails = False
+        self.tail_active = False
+        self.oversampling = 1
+        self._oversampler = None
+        self.meter = None
+        self.quality = 'normal'
+        self.tier = 'normal' if 'normal' in self.tiers else self.tiers[0]
+        self.sample_rate = SAMPLE_RATE
+        
+        #functions that undo each degrade(), most recent last
+        self._restore_steps = []
+    
+    def set_sample_rate(self, rate):
+        """Process audio at rate, in Hz, from now on.
+        
+        Parameters keep their meaning, so times and frequencies sound the same
+        at any rate. The effect's state is reset.
+        """
+        self.sample_rate = rate
+        self.sample_rate_changed_event()
+    
+    def sample_rate_changed_event(self):
+        """Called by set_sample_rate. Effects that design anything from the sample rate override this."""
+        pass
+    
+    def set_oversampling(self, factor):
+        """Run process_data at factor times the sample rate. factor is one of OVERSAMPLING_FACTORS."""
+        self.oversampling = factor
+        self._update_oversampler()
+    
+    def _update_oversampler(self):
+        factor = 1 if self.tier == 'draft' else self.oversampling
+        taps = HIGH_QUALITY_TAPS if self.tier == 'high' else TAPS
+        self._oversampler = Oversampler(factor, taps) if factor > 1 else None
+    
+    def set_quality(self, quality):
+        """Use the highest of the effect's tiers that is no higher than quality, one of QUALITY_TIERS.
+        
+        Effects that don't have a tier that low use their cheapest. Anything
+        that degrade() did is forgotten.
+        """
+        self._restore_steps = []
+        self.quality = quality
+        rank = QUALITY_TIERS.index(quality)
+        allowed = [tier for tier in self.tiers if QUALITY_TIERS.index(tier) <= rank]
+        self._set_tier(allowed[-1] if allowed else self.tiers[0])
+    
+    def _set_tier(self, tier):
+        self.tier = tier
+        if self.supports_oversampling:
+            self._update_oversampler()
+    
+    def process(self, data):
+        """Process data, oversampled if set_oversampling has been used.
+        
+        This is what EffectChain calls. Subclasses override process_data instead.
+        """
+        if self._oversampler is None:
+            return self.process_data(data)
+        return self._oversampler.process(data, self.process_data)
+    
+    @property
+    def latency(self):
+        """The delay between the effect's input and its output, in samples.
+        
+        Effects that delay their output, for example to look ahead, should add
+        their own delay to this.
+        """
+        if self._oversampler is None:
+            return 0
+        return self._oversampler.latency
+    
+    @property
+    def degraded(self):
+        """The number of quality steps that the effect is below its settings."""
+        return len(self._restore_steps)
+    
+    def degrade(self):
+        """Switch to a cheaper, lower quality way of processing, if there is one.
+        
+        Returns a short description of the change, or None if the effect can't
+        get any cheaper. Each step is undone by restore(), most recent first.
+        The default steps down through the effect's tiers, skipping steps that
+        wouldn't change the processing. While the effect is oversampled, the
+        oversampling factor is lowered one step at a time before the draft
+        tier, which would drop it altogether. Effects with other costly
+        settings should extend this, and use _add_restore_step.
+        """
+        index = self.tiers.index(self.tier)
+        lower = self.tiers[index - 1] if index > 0 else None
+        if self._oversampler is not None and lower in (None, 'draft'):
+            factor = self.oversampling
+            self.set_oversampling(OVERSAMPLING_FACTORS[OVERSAMPLING_FACTORS.index(factor) - 1])
+            self._add_restore_step(lambda: self.set_oversampling(factor))
+            return 'oversampling %ix' % self.oversampling
+        
+        if lower is None or not self._tier_matters():
+            return None
+        tier = self.tier
+        self._set_tier(lower)
+        self._add_restore_step(lambda: self._set_tier(tier))
+        return '%s tier' % self.tier
+    
+    def _tier_matters(self):
+        """Return True if changing the tier changes how the effect processes.
+        
+        The tiers of effects that support oversampling only choose how they're
+        oversampled, so they don't matter while the effect isn't. Such effects
+        that also check self.tier in process_data should override this.
+        """
+        return not self.supports_oversampling or self._oversampler is not None
+    
+    def restore(self):
+        """Undo the most recent degrade(). Returns False if there was nothing to undo."""
+        if not self._restore_steps:
+            return False
+        self._restore_steps.pop()()
+        return True
+    
+    def _add_restore_step(self, function):
+        self._restore_steps.append(function)
+    
+    def set_bypassed(self, value):
+        #the effect's state is left alone, so it resumes where it left off
+        self.tail_active = value and self.trails and self.has_tail
+        self.bypassed = value
+    
+    def set_trails(self, value):
+        self.trails = value
     
     def process_data(self, data):
         """Modify a numpy.array and return the modified array.
@@ -31,30 +194,95 @@ class AudioEffect(QtCore.QObject):
         function when subclassing AudioEffect.
         """
         return data
+    
+    def tail_level(self):
+        """Return the peak level of the tail that is still to be output.
+        
+        Effects that set has_tail should override this.
+        """
+        return 0
+    
+    def batch_key(self):
+        """Return a key that is equal for instances that stack() can combine, or None if this one can't be.
+        
+        Instances can be combined if they're the same class at the same tier and
+        sample rate and differ only in batch_parameters. Oversampled instances
+        aren't combined.
+        """
+        if self.batch_parameters is None or self._oversampler is not None:
+            return None
+        return (type(self), self.tier, self.sample_rate) + tuple(sorted((name, param.value) for name, param in self.parameters.iteritems()
+                                                      if name not in self.batch_parameters))
+    
+    @classmethod
+    def stack(cls, instances):
+        """Return a new effect that processes arrays of shape (len(instances), frames), each row as one of instances would.
+        
+        instances must have equal batch_key()s and must not have processed
+        anything yet. Parameters in batch_parameters become columns holding
+        each instance's value, so process_data must broadcast them against
+        the rows. Effects that keep state between blocks give each row its own
+        by overriding _stack_state.
+        """
+        stacked = cls()
+        stacked._set_tier(instances[0].tier)
+        stacked.set_sample_rate(instances[0].sample_rate)
+        for name, param in stacked.parameters.iteritems():
+            values = [instance.parameters[name].value for instance in instances]
+            if name in cls.batch_parameters and len(set(values)) > 1:
+                param.value = np.array(values)[:, np.newaxis]
+            else:
+                param.value = values[0]
+        stacked._stack_state(len(instances))
+        return stacked
+    
+    def _stack_state(self, count):
+        """Give each of count rows its own copy of the state kept between blocks. See stack()."""
+        pass
 
-class Parameter(QtCore.QObject):
+class Callbacks(object):
+    """A list of functions that are called, in the order they were connected, by emit().
+    
+    This has the connect() and emit() of a Qt signal, so effects don't need Qt.
+    The callbacks run on the thread that calls emit(). See main.ParameterSignal
+    for delivering changes to the GUI thread.
+    """
+    __slots__ = ('_callbacks',)
+    
+    def __init__(self):
+        self._callbacks = []
+    
+    def connect(self, callback):
+        self._callbacks.append(callback)
+    
+    def disconnect(self, callback):
+        self._callbacks.remove(callback)
+    
+    def emit(self, *args):
+        for callback in self._callbacks:
+            callback(*args)
+
+class Parameter(object):
     """A description of an effect parameter.
     
     Members:
-        maximum  -- The largest value that the parameter should contain.
-        minumum  -- The smallest value that the parameter should contain.
-        value    -- The current value of the parameter. It is updated whenever the interface element changes.
-        type     -- The type that value sould be stored as.
-        inverted -- If True, a slider at the highest position will produce the minimum value and vice versa.
+        maximum       -- The largest value that the parameter should contain.
+        minumum       -- The smallest value that the parameter should contain.
+        value         -- The current value of the parameter. It is updated whenever the interface element changes.
+        type          -- The type that value sould be stored as.
+        inverted      -- If True, a slider at the highest position will produce the minimum value and vice versa.
+        value_changed -- Callbacks called with no arguments whenever value is set.
     """
-    
-    #Signal emited when value member changes
-    value_changed = QtCore.Signal()
+    __slots__ = ('type', 'minimum', 'maximum', '_value', 'inverted', 'value_changed')
     
     def __init__(self, type=int, minimum=0, maximum=100, value=10, inverted=False):
-        super(Parameter, self).__init__()
-        
         #type must be a callable that will convert a value from a float to the desired type
         self.type = type
         self.minimum = minimum
         self.maximum = maximum
         self._value = value
         self.inverted = inverted
+        self.value_changed = Callbacks()
         
     def __repr__(self):
         return '%s(%s, %s, %s, %s, %i)' % (self.__class__.__name__, self.type, self.minimum, self.maximum, self.value, self.inverted)
@@ -75,6 +303,8 @@ class TempoParameter(Parameter):
     If use_bpm is True, value will be an integer with 0 < value < 1000.
     Otherwise value will be a value adhering to minumum, maximum and type, as usual.
     """
+    __slots__ = ('use_bpm',)
+    
     bpm = 0
     
     def __init__(self, type=int, minimum=0, maximum=100, value=10):
@@ -110,6 +340,7 @@ class DiscreteParameter(Parameter):
                         should be an empty string
         value        -- the name currently selected choice
     """
+    __slots__ = ('choices_dict',)
 
     def __init__(self, choices_dict, value):
         super(DiscreteParameter, self).__init__()
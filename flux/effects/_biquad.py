@@ -0,0 +1,139 @@
+"""Biquad filters whose coefficients change every few samples, filtered a block at a time."""
+
+import numpy as np
+
+from _base import SAMPLE_RATE
+
+#scipy is slow to import, so scipy.signal is loaded when the first TimeVaryingBiquad is created
+signal = None
+
+def _load_signal():
+    global signal
+    if signal is None:
+        import scipy.signal
+        signal = scipy.signal
+
+__all__ = ['SUB_BLOCK', 'MIN_Q', 'design', 'TimeVaryingBiquad']
+
+#the number of samples that a set of coefficients is used for
+SUB_BLOCK = 32
+
+#the lowest quality factor that design() allows, which keeps the poles of every design complex or repeated
+MIN_Q = 0.5
+
+def design(kind, frequency, q, sample_rate=SAMPLE_RATE):
+    """Return the coefficients of a biquad filter from the Audio EQ Cookbook.
+
+    frequency and q can be arrays, in which case one filter is designed for
+    each element. The coefficients are normalized so that a0 is 1.
+
+    Parameters:
+        kind        -- 'LP', 'HP', 'BP' (constant 0 dB peak gain) or 'BS'
+        frequency   -- the center or cutoff frequency [Hz]
+        q           -- the quality factor, at least MIN_Q
+        sample_rate -- the sample rate [Hz]
+
+    Returns (b, a), where b has shape frequency.shape + (3,) and holds b0, b1
+    and b2, and a has shape frequency.shape + (2,) and holds a1 and a2.
+    """
+    w0 = 2 * np.pi * np.asarray(frequency, dtype=float) / sample_rate
+    cos_w0 = np.cos(w0)
+    alpha = np.sin(w0) / (2 * np.maximum(q, MIN_Q))
+
+    if kind == 'LP':
+        b = ((1 - cos_w0) / 2, 1 - cos_w0, (1 - cos_w0) / 2)
+    elif kind == 'HP':
+        b = ((1 + cos_w0) / 2, -(1 + cos_w0), (1 + cos_w0) / 2)
+    elif kind == 'BP':
+        b = (alpha, np.zeros_like(alpha), -alpha)
+    elif kind == 'BS':
+        b = (np.ones_like(alpha), -2 * cos_w0, np.ones_like(alpha))
+    else:
+        raise ValueError('unknown filter type %r' % kind)
+
+    a0 = 1 + alpha
+    b_out = np.empty(a0.shape + (3,))
+    a_out = np.empty(a0.shape + (2,))
+    for i, coefficient in enumerate(b):
+        b_out[..., i] = coefficient / a0
+    a_out[..., 0] = -2 * cos_w0 / a0
+    a_out[..., 1] = (1 - alpha) / a0
+    return b_out, a_out
+
+class TimeVaryingBiquad(object):
+    """A biquad filter whose coefficients change every sub_block samples.
+
+    The filter is in transposed direct form II, and its state is kept across
+    coefficient changes and between blocks, so sweeps are smooth. Blocks whose
+    coefficients don't change are filtered with a single lfilter call, and
+    other blocks with one call per sub-block.
+
+    Sub-blocks continue across calls to process(), so the output doesn't
+    depend on how the input is split into blocks. starts() tells the caller
+    where the sub-blocks that need new coefficients begin.
+
+    Parameters:
+        sub_block -- the number of samples that each set of coefficients is used for
+    """
+    def __init__(self, sub_block=SUB_BLOCK):
+        self.sub_block = sub_block
+        self.state = np.zeros(2)
+
+        # loaded here rather than by process_fixed, which runs on the audio thread
+        _load_signal()
+
+        # samples of the current sub-block already processed, and its coefficients
+        self._offset = 0
+        self._b = None
+        self._a = None
+
+    def reset(self):
+        self.state[:] = 0
+
+    def starts(self, size):
+        """Return the indices in a block of size samples at which new coefficients are needed."""
+        return np.arange((self.sub_block - self._offset) % self.sub_block, size, self.sub_block)
+
+    def process_fixed(self, data, b, a):
+        """Filter data in place with one set of coefficients for the whole block, and return it.
+        
+        This costs about as much as a static filter, so it's used for draft
+        quality. b and a are a single row of coefficients as returned by
+        design(). The state is shared with process(), which starts its next
+        call on a new sub-block.
+        """
+        data[:], self.state[:] = signal.lfilter(b, (1, a[0], a[1]), data, zi=self.state)
+        self._offset = 0
+        return data
+
+    def process(self, data, b, a):
+        """Filter data in place and return it.
+
+        b and a hold one row of coefficients, as returned by design(), for each
+        index returned by starts(len(data)). Samples before the first index
+        continue the previous block's last sub-block.
+        """
+        size = len(data)
+        if not size:
+            return data
+        first = min(size, self.sub_block - self._offset)
+        if self._offset:
+            b = np.concatenate((self._b, b))
+            a = np.concatenate((self._a, a))
+        self._offset = (self._offset + size) % self.sub_block
+        self._b = b[-1:]
+        self._a = a[-1:]
+
+        if (b == b[0]).all() and (a == a[0]).all():
+            data[:], self.state[:] = signal.lfilter(b[0], (1, a[0, 0], a[0, 1]), data, zi=self.state)
+        else:
+            self._process_sub_blocks(data, b, a, first)
+        return data
+
+    def _process_sub_blocks(self, data, b, a, first):
+        state = self.state
+        start, end = 0, first
+        for k in range(len(b)):
+            data[start:end], state = signal.lfilter(b[k], (1, a[k, 0], a[k, 1]), data[start:end], zi=state)
+            start, end = end, end + self.sub_block
+        self.state[:] = state
@@ -0,0 +1,86 @@
+"""A process-wide cache of the coefficients and tables that effects design from their parameters.
+
+Effects call cached(designer, *args) instead of designer(*args), so every
+instance with the same settings, such as the filters in each Equalizer or
+the same effect in several presets, shares one design, and turning a knob
+back to a value it had recently doesn't design it again. The designer's
+arguments, which include the sample rate, are rounded to SIGNIFICANT_DIGITS
+to make the key, and the designer is called with the rounded values, so the
+result doesn't depend on which instance designed it first.
+
+The arrays returned are shared, so they're made read only. The number of
+hits and misses is reported to the instrumentation module as 'design cache'.
+"""
+
+import collections
+
+import numpy as np
+
+import instrumentation
+
+__all__ = ['cached', 'DesignCache', 'CAPACITY', 'SIGNIFICANT_DIGITS']
+
+#the most designs kept before the least recently used is dropped
+CAPACITY = 512
+
+#floats in keys are rounded to this many significant digits
+SIGNIFICANT_DIGITS = 12
+
+def _quantize(value):
+    if isinstance(value, float):
+        return float('%.*g' % (SIGNIFICANT_DIGITS, value))
+    return value
+
+def _freeze(value):
+    if isinstance(value, np.ndarray):
+        value.setflags(write=False)
+    elif isinstance(value, tuple):
+        for item in value:
+            _freeze(item)
+    return value
+
+class DesignCache(object):
+    """A least recently used cache of the results of design functions.
+
+    Parameters:
+        capacity -- the most results kept
+    """
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, designer, *args):
+        """Return designer(*args) with its arguments rounded, designing it only if it isn't cached.
+
+        Array results, and arrays in tuple results, are made read only.
+        """
+        args = tuple(_quantize(arg) for arg in args)
+        key = (designer,) + args
+        try:
+            value = self._entries.pop(key)
+            self.hits += 1
+        except KeyError:
+            value = _freeze(designer(*args))
+            self.misses += 1
+            if len(self._entries) >= self.capacity:
+                self._entries.popitem(last=False)
+        self._entries[key] = value
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+_cache = DesignCache()
+instrumentation.register_source('design cache', _cache.stats)
+
+def cached(designer, *args):
+    """Return designer(*args) from the shared DesignCache. The result must not be modified."""
+    return _cache.get(designer, *args)
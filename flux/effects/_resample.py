@@ -0,0 +1,125 @@
+"""Streaming polyphase resampling, used to oversample nonlinear effects."""
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+import clock
+import instrumentation
+from _cache import cached
+
+__all__ = ['Resampler', 'Oversampler', 'OVERSAMPLING_FACTORS', 'TAPS', 'HIGH_QUALITY_TAPS']
+
+OVERSAMPLING_FACTORS = (1, 2, 4, 8)
+
+#filter taps per input sample of the higher of the two rates' ratios
+TAPS = 16
+
+#taps used for the high quality tier, which narrows the transition band
+HIGH_QUALITY_TAPS = 32
+
+#cutoff relative to the lower of the two nyquist frequencies, leaving room for the transition band
+ROLLOFF = 0.9
+
+#kaiser window shape, giving about 80 dB of stopband attenuation
+BETA = 8.0
+
+def filter_bank(up, down, taps=TAPS):
+    """Return the polyphase lowpass filter bank for resampling by up/down, with taps per input sample.
+
+    Row p holds the taps applied to the input for output phase p, in the order
+    that they meet the input (oldest sample first). Banks are kept in the
+    design cache and are read only.
+    """
+    return cached(_design_filter_bank, up, down, taps)
+
+def _design_filter_bank(up, down, taps):
+    taps_per_phase = -(-taps * max(up, down) // up)
+    numtaps = taps_per_phase * up
+    cutoff = ROLLOFF / max(up, down)
+    n = np.arange(numtaps) - (numtaps - 1) / 2.0
+    h = cutoff * np.sinc(cutoff * n) * np.kaiser(numtaps, BETA) * up
+
+    # bank[p, k] = h[k * up + p], reversed along k
+    return h.reshape(taps_per_phase, up).T[:, ::-1].copy()
+
+class Resampler(object):
+    """Resamples a stream of blocks by the rational factor up/down.
+
+    The filter state is kept between blocks, so the output is continuous and
+    doesn't depend on the block size. The number of samples returned for each
+    block varies by at most one unless down divides up * len(block).
+
+    Parameters:
+        up   -- the interpolation factor
+        down -- the decimation factor
+        taps -- the filter length per input sample; longer filters are sharper and cost more
+    """
+    def __init__(self, up, down, taps=TAPS):
+        self.up = up
+        self.down = down
+        self._bank = filter_bank(up, down, taps)
+        self.taps = self._bank.shape[1]
+
+        self._history = np.zeros(self.taps - 1)
+
+        # position of the next output sample on the upsampled time line, relative
+        # to the first sample of the next block
+        self._time = 0
+
+    @property
+    def latency(self):
+        """The filter's group delay, in input samples."""
+        return (self.taps * self.up - 1) / 2.0 / self.up
+
+    def process(self, data):
+        size = len(data)
+        ext = np.concatenate((self._history, data))
+
+        # frames[n] holds the taps - 1 samples before input n, then input n
+        step = ext.strides[0]
+        frames = as_strided(ext, shape=(size, self.taps), strides=(step, step))
+
+        end = size * self.up
+        count = max(0, -(-(end - self._time) // self.down))
+        if self.down == 1:
+            # every phase of every input sample is output
+            out = np.dot(frames, self._bank.T).ravel()
+        elif self.up == 1:
+            out = np.dot(frames[self._time::self.down], self._bank[0])
+        else:
+            times = self._time + self.down * np.arange(count)
+            out = np.einsum('ij,ij->i', frames[times // self.up], self._bank[times % self.up])
+
+        self._history = ext[size:]
+        self._time += count * self.down - end
+        return out
+
+class Oversampler(object):
+    """Runs a function at factor times the sample rate.
+
+    The time spent resampling is recorded in the instrumentation module as
+    'oversampling <factor>x'.
+    """
+    def __init__(self, factor, taps=TAPS):
+        self.factor = factor
+        self.taps = taps
+        self._up = Resampler(factor, 1, taps)
+        self._down = Resampler(1, factor, taps)
+        self._label = 'oversampling %ix' % factor
+
+    @property
+    def latency(self):
+        """The delay added by the resampling filters, in samples at the original rate."""
+        return self._up.latency + self._down.latency / self.factor
+
+    def process(self, data, function):
+        start = clock.monotonic()
+        data = self._up.process(data)
+        resampling = clock.monotonic() - start
+
+        data = function(data)
+
+        start = clock.monotonic()
+        data = self._down.process(data)
+        instrumentation.record(self._label, resampling + clock.monotonic() - start)
+        return data
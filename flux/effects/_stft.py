@@ -0,0 +1,110 @@
+"""A streaming short-time Fourier transform, for effects that work on spectra."""
+
+import numpy as np
+
+from _cache import cached
+
+__all__ = ['STFT', 'FFT_SIZE', 'OVERLAP', 'design_windows']
+
+#frame and FFT length [samples]
+FFT_SIZE = 2048
+
+#the number of frames that each sample is part of, so frames start every FFT_SIZE / OVERLAP samples
+OVERLAP = 4
+
+def design_windows(size, hop):
+    """Return the analysis and synthesis windows for frames of size samples that start every hop samples.
+
+    Both are periodic Hann windows. The synthesis window is divided by the sum
+    of the overlapping squared windows, so that unchanged frames add back up
+    to the input exactly.
+    """
+    window = np.hanning(size + 1)[:-1]
+    overlap = (window ** 2).reshape(-1, hop).sum(axis=0)
+    return window, window / np.tile(overlap, size // hop)
+
+class STFT(object):
+    """Runs a function on the spectrum of each frame of a stream, and adds the frames back up.
+
+    The last size samples of input are kept in a ring buffer. Each time hop
+    new samples have arrived, the frame is windowed, transformed with rfft,
+    passed to the function and transformed back, and then windowed again and
+    added into a second ring buffer, from which the oldest hop samples are
+    complete. process() returns as many samples as it's given, whatever their
+    number, so the output is delayed by latency samples, which is size.
+    Every buffer is allocated up front, and the windows are shared through
+    the design cache.
+
+    Parameters:
+        size -- the frame and FFT length [samples]
+        hop  -- the samples between the starts of frames, which must divide size
+    """
+    def __init__(self, size=FFT_SIZE, hop=FFT_SIZE // OVERLAP):
+        if size % hop:
+            raise ValueError('hop %i does not divide the frame size %i' % (hop, size))
+        self.size = size
+        self.hop = hop
+        self._analysis, self._synthesis = cached(design_windows, size, hop)
+
+        self._input = np.zeros(size)
+        self._output = np.zeros(size)
+        self._frame = np.zeros(size)
+        self._ready = np.zeros(hop)
+
+        # position in both rings of the oldest hop, which the next input overwrites,
+        # and the number of samples of it that have been overwritten
+        self._start = 0
+        self._count = 0
+
+    @property
+    def latency(self):
+        """The delay between the input and the output, in samples."""
+        return self.size
+
+    @property
+    def bins(self):
+        """The length of the spectra passed to the function."""
+        return self.size // 2 + 1
+
+    def process(self, data, function, dry=None):
+        """Run function on the spectra of data. data is overwritten with the output and returned.
+
+        function takes and returns an array of bins complex values, and may
+        change its argument. If dry is given, it's filled with data delayed by
+        latency samples, to line up with the output.
+        """
+        size = len(data)
+        position = 0
+        while position < size:
+            offset = self._start + self._count
+            take = min(self.hop - self._count, size - position)
+            new = slice(offset, offset + take)
+            if dry is not None:
+                # the samples being overwritten arrived size samples ago
+                dry[position:position + take] = self._input[new]
+            self._input[new] = data[position:position + take]
+            data[position:position + take] = self._ready[self._count:self._count + take]
+            position += take
+            self._count += take
+            if self._count == self.hop:
+                self._start = (self._start + self.hop) % self.size
+                self._count = 0
+                self._transform(function)
+        return data
+
+    def _transform(self, function):
+        # the ring holds the frame from the oldest sample at _start, round to the newest
+        start = self._start
+        split = self.size - start
+        np.multiply(self._input[start:], self._analysis[:split], out=self._frame[:split])
+        np.multiply(self._input[:start], self._analysis[split:], out=self._frame[split:])
+
+        frame = np.fft.irfft(function(np.fft.rfft(self._frame)), self.size)
+        frame *= self._synthesis
+        self._output[start:] += frame[:split]
+        self._output[:start] += frame[split:]
+
+        # no later frame overlaps the oldest hop, which becomes the slot for the next input's frames
+        oldest = slice(start, start + self.hop)
+        self._ready[:] = self._output[oldest]
+        self._output[oldest] = 0
@@ -19,6 +19,8 @@ class Compressor(AudioEffect):
     """
     name = 'Compressor'
     description = 'Peak limiting compressor'
+    stateless = True
+    batch_parameters = ('Amount', 'Sensitivity')
 
     def __init__(self):
         super(Compressor, self).__init__()
@@ -36,8 +38,8 @@ class Compressor(AudioEffect):
 
     def process_data(self, data):
         db_data = level_to_db(np.fabs(data))
-        indexes = db_data > self.threshold_db
-        db_data[indexes] = self.compress(db_data[indexes])
+        #np.where rather than indexing, so that stacked instances' thresholds broadcast against the rows
+        db_data = np.where(db_data > self.threshold_db, self.compress(db_data), db_data)
         return db_to_level(db_data) * np.sign(data)
 
 class Sustain(AudioEffect):
@@ -51,6 +53,8 @@ class Sustain(AudioEffect):
     """
     name = 'Sustain'
     description = 'Small signal gain'
+    stateless = True
+    batch_parameters = ('Amount', 'Sensitivity')
 
     def __init__(self):
         super(Sustain, self).__init__()
@@ -68,6 +72,5 @@ class Sustain(AudioEffect):
 
     def process_data(self, data):
         db_data = level_to_db(np.fabs(data))
-        indexes = db_data < self.threshold_db
-        db_data[indexes] = self.sustain(db_data[indexes])
+        db_data = np.where(db_data < self.threshold_db, self.sustain(db_data), db_data)
         return db_to_level(db_data) * np.sign(data)
@@ -1,3 +1,5 @@
+import collections
+
 import numpy as np
 
 from _base import *
@@ -6,24 +8,91 @@ class Decimation(AudioEffect):
     """Decimation / Bitcrushing effect.
 
     Creates an 8-bit sound using a combination of bitrate crushing and sample
-    rate reduction.
+    rate reduction. The sample and hold is continuous across blocks, so the
+    output doesn't depend on how the input is split into blocks. The hold is
+    counted in samples at SAMPLE_RATE, so it's scaled by the oversampling
+    factor and the chain's sample rate, and can be a fraction of a sample.
 
     Parameters:
         Bitrate     -- Amount of bit accuracy in the output data. [bits]
-        Sample Rate -- Sample rate reduction of the output data. [Hz]
+        Sample rate -- Sample rate reduction of the output data, as the number of samples at SAMPLE_RATE held. [-]
+        Dither      -- Whether to add triangular dither before truncating. (Off, On)
     """
     name = 'Decimation'
     description = 'Reduce signal sample rate and/or bit accuracy'
+    supports_oversampling = True
+    tiers = QUALITY_TIERS
 
     def __init__(self):
         super(Decimation, self).__init__()
         self.parameters = {'Bitrate':Parameter(int, 0, SAMPLE_SIZE, 0, inverted=True),
-                           'Sample rate':Parameter(int, 1, 25, 1, inverted=True)}
+                           'Sample rate':Parameter(int, 1, 25, 1, inverted=True),
+                           'Dither':DiscreteParameter(collections.OrderedDict((('Off', ''), ('On', ''))), 'Off')}
+
+        # Position within the current hold period [samples], and the value being held
+        self._phase = 0.0
+        self._held = 0.0
+
+        # Reusable buffers, grown to the largest block seen
+        self._index = np.arange(0, dtype=float)
+        self._start = np.zeros(0)
+        self._source = np.zeros(0, int)
+        self._scratch = np.zeros(0)
 
     def process_data(self, data):
-        # Truncate input data by shifting right, then left
+        # Truncate to a multiple of 2**Bitrate. This is the same as shifting an
+        # integer right then left, without converting to int and back.
         shift_amount = self.parameters['Bitrate'].value
-        data = np.left_shift(np.right_shift(data.real.astype(int), shift_amount), shift_amount)
-        # Reduce sample rate by skipping the specified number of samples
+        if shift_amount > 0:
+            step = float(1 << shift_amount)
+            if self.parameters['Dither'].value == 'On':
+                data += (np.random.random_sample(len(data)) - np.random.random_sample(len(data))) * step
+            data *= 1 / step
+            np.floor(data, out=data)
+            data *= step
+
+        # Reduce sample rate by holding every nth sample
         reduc_amount = self.parameters['Sample rate'].value
-        return np.repeat(data[::reduc_amount], reduc_amount)[:len(data)].astype(float)
+        if reduc_amount > 1:
+            factor = self._oversampler.factor if self._oversampler is not None else 1
+            hold = reduc_amount * factor * self.sample_rate / float(SAMPLE_RATE)
+            self._sample_and_hold(data, max(hold, 1.0))
+        else:
+            self._phase = 0.0
+        return data
+
+    def _sample_and_hold(self, data, hold):
+        size = len(data)
+        if len(self._index) < size:
+            self._index = np.arange(size, dtype=float)
+            self._start = np.zeros(size)
+            self._source = np.zeros(size, int)
+            self._scratch = np.zeros(size)
+        index = self._index[:size]
+        start = self._start[:size]
+        source = self._source[:size]
+        out = self._scratch[:size]
+
+        if self._phase >= hold:
+            # the hold length was reduced; start a new hold period
+            self._phase = 0.0
+
+        # source[i] is the index of the sample that is held at i, the first at or after
+        # the start of i's hold period. It's negative before the first period starts.
+        # With a whole number hold every step is exact.
+        np.add(index, self._phase, out=start)
+        start /= hold
+        np.floor(start, out=start)
+        start *= hold
+        start -= self._phase
+        np.ceil(start, out=start)
+        source[:] = start
+        np.take(data, source, out=out, mode='clip')
+
+        # samples before the first new period continue the previous block's hold
+        if self._phase:
+            out[:min(int(np.ceil(hold - self._phase)), size)] = self._held
+
+        data[:] = out
+        self._held = out[-1]
+        self._phase = (self._phase + size) % hold
@@ -2,8 +2,8 @@ import numpy as np
 
 from _base import *
 
-def samples_from_ms(milliseconds):
-    return milliseconds * 0.001 * SAMPLE_RATE
+def samples_from_ms(milliseconds, sample_rate=SAMPLE_RATE):
+    return milliseconds * 0.001 * sample_rate
 
 class Delay(AudioEffect):
     """Delay effect
@@ -11,12 +11,15 @@ class Delay(AudioEffect):
     Adds a delay to the input signal using a delay line method with variable mix and feedback.
 
     Parameters:
-        Delay    -- The amount of time to delay the signal. [ms]
+        Delay    -- The amount of time to delay the signal, in samples at SAMPLE_RATE, so presets
+                    sound the same at any sample rate. [samples]
         Mix      -- The ratio of original to delayed signal. [-]
         Feedback -- The ratio of feedback from the delayed signal. [-]
     """
     name = 'Delay'
     description = 'One tap, 100ms-1s delay'
+    has_tail = True
+    batch_parameters = ('Mix', 'Feedback')
 
     def __init__(self):
         super(Delay, self).__init__()
@@ -26,18 +29,40 @@ class Delay(AudioEffect):
                            'Feedback':Parameter(float, 0, 1, .5)}
 
         self.delay_line = None
+        self._position = 0
         self.delay_changed_event()
 
         self.parameters['Delay'].value_changed.connect(self.delay_changed_event)
 
     def delay_changed_event(self):
-        self.delay_line = np.zeros(self.parameters['Delay'].value)
+        length = int(round(self.parameters['Delay'].value * self.sample_rate / float(SAMPLE_RATE)))
+        self.delay_line = np.zeros(length)
+        self._position = 0
+
+    def sample_rate_changed_event(self):
+        self.delay_changed_event()
+
+    def _stack_state(self, count):
+        self.delay_line = np.zeros((count, len(self.delay_line)))
 
     def process_data(self, data):
         wet = self.parameters['Mix'].value
         dry = 1 - wet
-        mixin = self.delay_line[:len(data)] * wet
-        self.delay_line[:len(data)] = data + mixin * self.parameters['Feedback'].value
-        self.delay_line = np.roll(self.delay_line, -len(data))
+        # the delay line is a ring buffer, so only the samples read and written are touched each
+        # block. They're a slice unless the block wraps around the end.
+        size = data.shape[-1]
+        length = self.delay_line.shape[-1]
+        if size > length:
+            #each sample read from the line must already hold what was written length samples earlier
+            return np.concatenate([self.process_data(data[..., start:start + length])
+                                   for start in range(0, size, length)], axis=-1)
+        end = self._position + size
+        index = slice(self._position, end) if end <= length else np.arange(self._position, end) % length
+        mixin = self.delay_line[..., index] * wet
+        self.delay_line[..., index] = data + mixin * self.parameters['Feedback'].value
+        self._position = end % length
 
         return (data * dry) + mixin
+
+    def tail_level(self):
+        return np.abs(self.delay_line).max()
@@ -1,9 +1,60 @@
 import collections
 
 import numpy as np
-import scipy.signal as signal
 
 from _base import *
+from _cache import cached
+
+#scipy is slow to import, so scipy.signal is loaded when the first filter is designed
+signal = None
+
+def _load_signal():
+    global signal
+    if signal is None:
+        import scipy.signal
+        signal = scipy.signal
+
+def design_filter(type, f0, sample_rate):
+    """Return the coefficients (b, a) of a BasicFilter, and its zero input state.
+
+    Parameters:
+        type        -- the filter function type (LP, HP, BP, BS)
+        f0          -- the center frequency [Hz]
+        sample_rate -- the sample rate [Hz]
+    """
+    # Determine quality factor (Q) based on filter type
+    if type == 'LP': Q = 0.8 # optimized
+    elif type == 'HP': Q = 20 # optimized
+    elif type == 'BP': Q = 0.8 # ok - could use work
+    elif type == 'BS': Q = 5 # ok - gives around 1kHz stopband
+
+    # Perform necessary calculations for filter coefficients. Centers above the
+    # nyquist frequency, which the parameter allows at low sample rates, are held at it.
+    w0 = np.pi * min(f0, sample_rate / 2.0) / (sample_rate / 2.0)
+    cosw0 = np.cos(w0)
+    sinw0 = np.sin(w0)
+    alpha = sinw0 / (2 * Q)
+
+    if type == 'LP':
+        # Compute lowpass coefficients
+        a = np.array([1 + alpha, -2 * cosw0, 1 - alpha])
+        b = np.array([(1 - cosw0) / 2, 1 - cosw0, (1 - cosw0) / 2])
+    elif type == 'HP':
+        # Compute highpass coefficients
+        a = np.array([1 + alpha, -2 * cosw0, 1 - alpha])
+        b = np.array([(1 + cosw0) / 2, -(1 + cosw0), (1+ cosw0) / 2])
+    elif type == 'BP':
+        # Compute bandpass coefficients
+        a = np.array([1 + alpha, -2 * cosw0, 1 - alpha])
+        b = np.array([alpha, 0, -alpha])
+    elif type == 'BS':
+        # Compute bandstop (notch) coefficients
+        a = np.array([1 + alpha, -2 * cosw0, 1 - alpha])
+        b = np.array([1, -2 * cosw0, 1])
+
+    # Compute zero input response
+    _load_signal()
+    return b, a, signal.lfilter_zi(b, a)
 
 class BasicFilter(AudioEffect):
     """Basic Filter effect
@@ -17,6 +68,7 @@ class BasicFilter(AudioEffect):
 
     name = 'Basic Filters'
     description = 'Filters the incoming signal using an IIR filter design.'
+    batch_parameters = ()
 
     def __init__(self):
         super(BasicFilter, self).__init__()
@@ -33,44 +85,17 @@ class BasicFilter(AudioEffect):
         self.param_changed_event()
 
     def param_changed_event(self):
-        # First get order and designed cutoff from specifications
-        f0 = self.parameters['Center'].value
-        type = self.parameters['Type'].value
-
-        # Determine quality factor (Q) based on filter type
-        if type == 'LP': Q = 0.8 # optimized
-        elif type == 'HP': Q = 20 # optimized
-        elif type == 'BP': Q = 0.8 # ok - could use work
-        elif type == 'BS': Q = 5 # ok - gives around 1kHz stopband
-
-        # Perform necessary calculations for filter coefficients
-        w0 = np.pi * f0 / float(NYQUIST)
-        cosw0 = np.cos(w0)
-        sinw0 = np.sin(w0)
-        alpha = sinw0 / (2 * Q)
-
-        if type == 'LP':
-            # Compute lowpass coefficients
-            self._a = np.array([1 + alpha, -2 * cosw0, 1 - alpha])
-            self._b = np.array([(1 - cosw0) / 2, 1 - cosw0, (1 - cosw0) / 2])
-        elif type == 'HP':
-            # Compute highpass coefficients
-            self._a = np.array([1 + alpha, -2 * cosw0, 1 - alpha])
-            self._b = np.array([(1 + cosw0) / 2, -(1 + cosw0), (1+ cosw0) / 2])
-        elif type == 'BP':
-            # Compute bandpass coefficients
-            self._a = np.array([1 + alpha, -2 * cosw0, 1 - alpha])
-            self._b = np.array([alpha, 0, -alpha])
-        elif type == 'BS':
-            # Compute bandstop (notch) coefficients
-            self._a = np.array([1 + alpha, -2 * cosw0, 1 - alpha])
-            self._b = np.array([1, -2 * cosw0, 1])
-
-        # Compute zero input response
-        self._zi = signal.lfilter_zi(self._b, self._a)
+        self._b, self._a, self._zi = cached(design_filter, self.parameters['Type'].value,
+                                            self.parameters['Center'].value, self.sample_rate)
+
+    def sample_rate_changed_event(self):
+        self.param_changed_event()
+
+    def _stack_state(self, count):
+        self._zi = np.tile(self._zi, (count, 1))
 
     def process_data(self, data):
-        (out, self._zo) = signal.lfilter(self._b, self._a, data, axis=0, zi=self._zi)
+        (out, self._zo) = signal.lfilter(self._b, self._a, data, axis=-1, zi=self._zi)
         self._zi = self._zo
         return out
 
@@ -87,6 +112,7 @@ class Equalizer(AudioEffect):
 
     name = '3-Band Equalizer'
     description = 'A test equalizer function using an IIR filter design.'
+    batch_parameters = ('Low', 'Mid', 'High')
 
     def __init__(self):
         super(Equalizer, self).__init__()
@@ -113,6 +139,14 @@ class Equalizer(AudioEffect):
 
         self.param_changed_event()
 
+    def sample_rate_changed_event(self):
+        self._lp.set_sample_rate(self.sample_rate)
+        self._hp.set_sample_rate(self.sample_rate)
+
+    def _stack_state(self, count):
+        self._lp._stack_state(count)
+        self._hp._stack_state(count)
+
     def param_changed_event(self):
         self._low_gain = self.parameters['Low'].value
         self._mid_gain = self.parameters['Mid'].value
@@ -12,6 +12,10 @@ class Fuzzbox(AudioEffect):
     """
     name = 'Fuzzbox'
     description = 'Asymetrical distortion'
+    stateless = True
+    supports_oversampling = True
+    tiers = QUALITY_TIERS
+    batch_parameters = ('Mix',)
 
     def __init__(self):
         super(Fuzzbox, self).__init__()
@@ -19,4 +23,4 @@ class Fuzzbox(AudioEffect):
 
     def process_data(self, data):
         a = self.parameters['Mix'].value * 5.
-        return np.piecewise(data, [data > 0, data < 0], [lambda x: x * a, lambda x: x / a, 0])
+        return np.where(data > 0, data * a, data / a)
@@ -14,10 +14,13 @@ class Gain(AudioEffect):
     """
     name = 'Gain'
     description = 'Increase the volume, clipping loud signals'
+    stateless = True
+    batch_parameters = ('Amount',)
 
     def __init__(self):
         super(Gain, self).__init__()
         self.parameters = {'Amount':Parameter(float, 0, 20, 1)}
 
     def process_data(self, data):
-        return np.multiply(data, self.parameters['Amount'].value)
+        data *= self.parameters['Amount'].value
+        return data
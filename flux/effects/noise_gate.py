@@ -14,6 +14,8 @@ class NoiseGate(AudioEffect):
 
     name = 'Noise Gate'
     description = 'Basic noise gate (no hysteresis)'
+    stateless = True
+    batch_parameters = ('Attenuation', 'Threshold')
 
     def __init__(self):
         super(NoiseGate, self).__init__()
@@ -21,7 +23,8 @@ class NoiseGate(AudioEffect):
                            'Threshold':Parameter(int, 0, SAMPLE_MAX / 100, SAMPLE_MAX / 200)}
 
     def process_data(self, data):
-        data[data < self.parameters['Threshold'].value] *= self.parameters['Attenuation'].value
+        #a gain array rather than indexing, so that stacked instances' values broadcast against the rows
+        data *= np.where(data < self.parameters['Threshold'].value, self.parameters['Attenuation'].value, 1.0)
         return data
 
 class HysteresisGate(AudioEffect):
@@ -14,23 +14,25 @@ class StandardOverdrive(AudioEffect):
     """
     name = 'Overdrive Standard'
     description = 'Non-linear distortion'
+    stateless = True
+    supports_oversampling = True
+    tiers = QUALITY_TIERS
+    batch_parameters = ('Amount', 'Sensitivity')
 
     def __init__(self):
         super(StandardOverdrive, self).__init__()
         self.parameters = {'Amount':Parameter(float, 0.1, 0.75, 0.75, inverted=True),
                            'Sensitivity':Parameter(float, 0.01, 1, 1, inverted=True)}
 
-    def sigmoid_vector(self):
+    def sigmoid(self, x):
         #a knee of 0.75 results in approxamately linear amplification for -0.5 < x < 0.5
         knee = self.parameters['Amount'].value
-        def f(x):
-            return  x / (x * x + knee)
-        return np.vectorize(f)
+        return x / (x * x + knee)
 
     def process_data(self, data):
         #normalize the data before applying the amplification
         normal_factor = SAMPLE_MAX * self.parameters['Sensitivity'].value
-        return self.sigmoid_vector()(data / normal_factor) * normal_factor
+        return self.sigmoid(data / normal_factor) * normal_factor
 
 class ClassicOverdrive(AudioEffect):
     """ClassicOverdrive class
@@ -44,20 +46,22 @@ class ClassicOverdrive(AudioEffect):
     """
     name = 'Overdrive Classic'
     description = 'Non-linear Tube Emulation Distortion'
+    stateless = True
+    supports_oversampling = True
+    tiers = QUALITY_TIERS
+    batch_parameters = ('Amount', 'Sensitivity')
 
     def __init__(self):
         super(ClassicOverdrive, self).__init__()
         self.parameters = {'Amount':Parameter(float, 0.1, 0.75, 0.75, inverted=True),
                            'Sensitivity':Parameter(float, 0.01, 1, 1, inverted=True)}
 
-    def sigmoid_vector(self):
+    def sigmoid(self, x):
         #a knee of 0.75 results in approxamately linear amplification for -0.5 < x < 0.5
         knee = self.parameters['Amount'].value
-        def f(x):
-            return  knee*(2*(1 / (np.exp(-4*x)+1) - 0.5))
-        return np.vectorize(f)
+        return knee * (2 * (1 / (np.exp(-4 * x) + 1) - 0.5))
 
     def process_data(self, data):
         #normalize the data before applying the amplification
         normal_factor = SAMPLE_MAX * self.parameters['Sensitivity'].value
-        return self.sigmoid_vector()(data / normal_factor) * normal_factor
+        return self.sigmoid(data / normal_factor) * normal_factor
@@ -1,18 +1,35 @@
 import numpy as np
 
 from _base import *
+from _cache import cached
+from _stft import STFT, FFT_SIZE, OVERLAP
+
+def design_modulators(f, sample_rate):
+    """Return one period of the sin and cos signals that shift the frequency by f [Hz]."""
+    phase = np.linspace(0, 2*np.pi, num=sample_rate/f, endpoint=False)
+    return np.sin(phase), np.cos(phase)
+
+def design_block_tables(size, sample_rate):
+    """Return the window and the sign of each FFT frequency for blocks of size samples."""
+    return np.hamming(size), np.sign(np.fft.fftfreq(size, d=1.0/sample_rate))
+
+def design_phase_advance(size, hop):
+    """Return the phase that a sinusoid at the center of each rfft bin advances by over hop samples [rad]."""
+    return 2 * np.pi * hop * np.arange(size // 2 + 1) / float(size)
 
 class PitchShift(AudioEffect):
     """Pitch Shift effect
 
     Modifies the original signal by shifting the pitch up. This utilizes the
-    single-sideband amplitude modulation method.
+    single-sideband amplitude modulation method. Every frequency moves by the
+    same amount, so harmonics no longer line up; see PhaseVocoder for intervals.
 
     Parameters:
         Frequency -- The frequency amount to shift the original signal.
     """
     name = 'PitchShift'
     description = 'Frequency shifting in the time domain'
+    batch_parameters = ()
 
     def __init__(self):
         super(PitchShift, self).__init__()
@@ -22,36 +39,132 @@ class PitchShift(AudioEffect):
         self._mod_cos = None
         self.param_changed_event()
 
+        # The window and FFT frequencies depend only on the block size, which the
+        # audio path keeps fixed, so they're computed once per size
+        self._block_size = None
+        self._window = None
+        self._sign = None
+
     def param_changed_event(self):
-        f = self.parameters['Frequency'].value
+        self._mod_sin, self._mod_cos = cached(design_modulators, self.parameters['Frequency'].value, self.sample_rate)
+
+    def sample_rate_changed_event(self):
+        self.param_changed_event()
+        self._block_size = None
 
-        # Initialize the sin and cos signals with the specified modulation frequency
-        self._mod_sin = np.sin(np.linspace(0, 2*np.pi, num=SAMPLE_RATE/f, endpoint=False))
-        self._mod_cos = np.cos(np.linspace(0, 2*np.pi, num=SAMPLE_RATE/f, endpoint=False))
+    def _set_block_size(self, size):
+        self._block_size = size
+        self._window, self._sign = cached(design_block_tables, size, self.sample_rate)
 
     def process_data(self, data):
+        # the last axis is time, so stacked instances are transformed a row at a time
+        size = data.shape[-1]
+        if size != self._block_size:
+            self._set_block_size(size)
+
         # Taper the input data using a hamming window method
-        window = np.hamming(data.size)
-        data *= window
+        data *= self._window
 
         # SSB-AM: Single-Side Band Amplitude Modulation Method
         # output = data*Cos(2pi*Fc*t) + HilbertXF(data)*Sin(2pi*Fc*t)
 
         # First process data*Cos(2pi*Fc*t) portion of the equation
-        part1 = np.multiply(data, np.resize(self._mod_cos, data.size))
+        part1 = np.multiply(data, np.resize(self._mod_cos, size))
 
         # Process the Hilbert transform of the signal
         # HilbertXF(data) = ifft(1j * fft(data) * sigmoid)
-        data_spect = np.fft.fft(data, n=data.size)
-        freq = np.fft.fftfreq(data.size, d=1/SAMPLE_RATE)
-        data_hilbert = np.fft.ifft(1j * data_spect * np.sign(freq), n=data.size)
+        data_spect = np.fft.fft(data, n=size)
+        data_hilbert = np.fft.ifft(1j * data_spect * self._sign, n=size)
 
         # Process second portion of the equation. HilbertXF(data)*Sin(2pi*Fc*t)
-        part2 = np.multiply(data_hilbert, np.resize(self._mod_sin, data.size))
+        part2 = np.multiply(data_hilbert, np.resize(self._mod_sin, size))
 
         # Roll sin and cos functions to provide a uniform modulation
-        self._mod_sin = np.roll(self._mod_sin, data.size)
-        self._mod_cos = np.roll(self._mod_cos, data.size)
+        self._mod_sin = np.roll(self._mod_sin, size)
+        self._mod_cos = np.roll(self._mod_cos, size)
 
         # Add part one and two of the equation and use only the real portion
         return np.add(part1, part2).real
+
+class PhaseVocoder(AudioEffect):
+    """Phase Vocoder effect
+
+    Shifts the pitch by a musical interval, so the harmonics of a note stay in
+    tune with each other. Each frame of a streaming STFT is analysed into the
+    true frequency of each bin, from how far its phase moved since the last
+    frame. The bins are moved to the frequencies times the pitch ratio, and
+    their phases advanced at the new frequencies. The output is delayed by the
+    FFT_SIZE samples of a frame. At draft quality frames overlap by half rather
+    than by three quarters, which halves the cost and smears transients more.
+
+    Parameters:
+        Semitones -- The interval to shift by. [semitones]
+        Cents     -- A fine adjustment of the interval. [cents]
+        Mix       -- The ratio of shifted to original signal. [-]
+    """
+    name = 'Phase Vocoder'
+    description = 'Pitch shifting by musical intervals'
+    tiers = ('draft', 'normal')
+
+    def __init__(self):
+        super(PhaseVocoder, self).__init__()
+        self.parameters = {'Semitones':Parameter(int, -12, 12, 12),
+                           'Cents':Parameter(int, -50, 50, 0),
+                           'Mix':Parameter(float, 0, 1, 1)}
+        self._dry = np.zeros(0)
+        self._make_stft()
+
+    def _set_tier(self, tier):
+        super(PhaseVocoder, self)._set_tier(tier)
+        self._make_stft()
+
+    def _make_stft(self):
+        self._stft = STFT(FFT_SIZE, FFT_SIZE // (2 if self.tier == 'draft' else OVERLAP))
+        self._advance = cached(design_phase_advance, self._stft.size, self._stft.hop)
+        bins = self._stft.bins
+        self._bins = np.arange(bins)
+        self._magnitude = np.zeros(bins)
+        self._last_phase = np.zeros(bins)
+        self._frequency = np.zeros(bins)
+        self._phase = np.zeros(bins)
+
+    @property
+    def latency(self):
+        return super(PhaseVocoder, self).latency + self._stft.latency
+
+    def _shift(self, spectrum):
+        ratio = 2 ** ((self.parameters['Semitones'].value + self.parameters['Cents'].value / 100.0) / 12.0)
+        np.abs(spectrum, out=self._magnitude)
+        phase = np.angle(spectrum)
+
+        # the true frequency of each bin, as its phase advance per hop, from how far the
+        # phase moved beyond the bin's own advance, wrapped to [-pi, pi]
+        deviation = phase - self._last_phase - self._advance
+        self._last_phase = phase
+        deviation -= 2 * np.pi * np.round(deviation / (2 * np.pi))
+        frequency = self._advance + deviation
+
+        # bins moved onto the same bin add up, and the last one's frequency is kept
+        target = np.round(self._bins * ratio).astype(int)
+        kept = target < len(target)
+        target = target[kept]
+        magnitude = np.bincount(target, weights=self._magnitude[kept], minlength=len(spectrum))
+        self._frequency.fill(0)
+        self._frequency[target] = frequency[kept] * ratio
+
+        self._phase += self._frequency
+        np.mod(self._phase, 2 * np.pi, out=self._phase)
+        return magnitude * np.exp(1j * self._phase)
+
+    def process_data(self, data):
+        mix = self.parameters['Mix'].value
+        if mix == 1:
+            return self._stft.process(data, self._shift)
+
+        size = len(data)
+        if len(self._dry) != size:
+            self._dry = np.zeros(size)
+        wet = self._stft.process(data, self._shift, self._dry)
+        wet *= mix
+        wet += self._dry * (1 - mix)
+        return wet
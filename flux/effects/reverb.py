@@ -2,8 +2,8 @@ import numpy as np
 
 from _base import *
 
-def samples_from_ms(milliseconds):
-    return milliseconds * 0.001 * SAMPLE_RATE
+def samples_from_ms(milliseconds, sample_rate=SAMPLE_RATE):
+    return milliseconds * 0.001 * sample_rate
 
 class Reverb(AudioEffect):
     """Reverb effect
@@ -15,26 +15,50 @@ class Reverb(AudioEffect):
     """
     name = 'Reverb'
     description = 'Reverb'
+    has_tail = True
+    batch_parameters = ('Mix',)
 
     def __init__(self):
         super(Reverb, self).__init__()
 
         self.parameters = {'Mix':Parameter(float, 0, 0.5, .1)}
-        self.delay = samples_from_ms(75)
+        self.delay = samples_from_ms(75, self.sample_rate)
         self.feedback = 0.5
 
         self.delay_line = None
+        self._position = 0
         self.delay_changed_event()
 
         #self.parameters['Delay'].value_changed.connect(self.delay_changed_event)
 
     def delay_changed_event(self):
         self.delay_line = np.zeros(self.delay)
+        self._position = 0
+
+    def sample_rate_changed_event(self):
+        self.delay = samples_from_ms(75, self.sample_rate)
+        self.delay_changed_event()
+
+    def _stack_state(self, count):
+        self.delay_line = np.zeros((count, len(self.delay_line)))
 
     def process_data(self, data):
         wet = self.parameters['Mix'].value
         dry = 1 - wet
-        mixin = self.delay_line[:len(data)] * wet
-        self.delay_line[:len(data)] = data + mixin * self.feedback
-        self.delay_line = np.roll(self.delay_line, -len(data))
+        # the delay line is a ring buffer, so only the samples read and written are touched each
+        # block. They're a slice unless the block wraps around the end.
+        size = data.shape[-1]
+        length = self.delay_line.shape[-1]
+        if size > length:
+            #each sample read from the line must already hold what was written length samples earlier
+            return np.concatenate([self.process_data(data[..., start:start + length])
+                                   for start in range(0, size, length)], axis=-1)
+        end = self._position + size
+        index = slice(self._position, end) if end <= length else np.arange(self._position, end) % length
+        mixin = self.delay_line[..., index] * wet
+        self.delay_line[..., index] = data + mixin * self.feedback
+        self._position = end % length
         return (data * dry) + mixin
+
+    def tail_level(self):
+        return np.abs(self.delay_line).max()
@@ -3,6 +3,19 @@ import math
 import numpy as np
 
 from _base import *
+from _cache import cached
+
+def design_pulse(duration, duty, sample_rate):
+    """Return one cycle of a PulseModulation carrier, duration [s] long and on for the fraction duty of it."""
+    # Calculate the samples active and inactive during one cycle (duty)
+    total_samples = duration * sample_rate
+    active_samples = math.floor(total_samples * duty)
+    inactive_samples = total_samples - active_samples
+
+    # Create a new array with the specified duty cycle and speed
+    on_cycle = np.ones(active_samples) * np.hamming(active_samples)
+    off_cycle = np.zeros(inactive_samples)
+    return np.concatenate([on_cycle, off_cycle])
 
 class PulseModulation(AudioEffect):
     """Pulse Width Modulation effect
@@ -16,6 +29,7 @@ class PulseModulation(AudioEffect):
     """
     name = 'Pulse Modulation'
     description = 'Introduces pulse width modulation to the signal.'
+    batch_parameters = ()
 
     def __init__(self):
         super(PulseModulation, self).__init__()
@@ -26,33 +40,53 @@ class PulseModulation(AudioEffect):
         self._old_data_size = 0
         self._mod = np.array([])
 
+    def sample_rate_changed_event(self):
+        # the carrier is designed again on the next block
+        self._old_duration = 0.0
+
     def process_data(self, data):
         duration = self.parameters['Duration'].value
         duty = self.parameters['Duty'].value
 
         # Determine if the duration or duty cycle parameters have been changed
         if (self._old_duration != duration or self._old_duty != duty):
-            # Calculate the samples active and inactive during one cycle (duty)
-            total_samples = duration * SAMPLE_RATE
-            active_samples = math.floor(total_samples * duty)
-            inactive_samples = total_samples - active_samples
-
             self._old_duration = duration
             self._old_duty = duty
-
-            # Create a new array with the specified duty cycle and speed
-            on_cycle = np.ones(active_samples) * np.hamming(active_samples)
-            off_cycle = np.zeros(inactive_samples)
-            self._mod = np.concatenate([on_cycle, off_cycle])
+            self._mod = cached(design_pulse, duration, duty, self.sample_rate)
         else:
             # Continue to modulate the signal with the old carrier signal
             self._mod = np.roll(self._mod, self._old_data_size)
 
         # Store the data size to roll the carrier signal in the next run
-        self._old_data_size = data.size
+        size = data.shape[-1]
+        self._old_data_size = size
 
         # Perform the signal modulation
-        return np.multiply(data, np.resize(self._mod, (data.size,)))
+        return np.multiply(data, np.resize(self._mod, (size,)))
+
+#the shapes that design_carrier knows
+CARRIER_SHAPES = ('Sin', 'Sawtooth', 'Square')
+
+def design_carrier(shape, speed, sample_rate):
+    """Return one period of a Tremelo carrier of shape, one of CARRIER_SHAPES, at speed [Hz]."""
+    period = sample_rate / speed
+
+    if shape == 'Sin':
+        return np.sin(np.linspace(0, np.pi, period / 2))
+    elif shape == 'Sawtooth':
+        sawtooth = np.linspace(0, 1, period / 2)
+        # Smooth out the wave a bit by multiplying it with it's complement raised to a large power
+        complement = 1 - np.power(sawtooth, 20)
+        # This is 1 / max(complement) when the exponent is 20, and is used to keep a constant maximum amplitude
+        normalization_factor = 1.2226448438558761
+        return sawtooth * complement * normalization_factor
+    elif shape == 'Square':
+        # Create a rounded square wave by multiplying 1-sawtooth(-x)**20, which rises sharply at x=0
+        # and 1-sawtooth(x)**20, which falls sharply at the half period
+        sawtooth = np.linspace(0, 1, period / 2)
+        sawtooth_neg = np.linspace(1, 0, period / 2)
+        square = (1 - np.power(sawtooth, 20)) * (1 - np.power(sawtooth_neg, 20))
+        return np.concatenate([square, np.zeros(period / 2)])
 
 class Tremelo(AudioEffect):
     """Tremelo effect
@@ -67,6 +101,7 @@ class Tremelo(AudioEffect):
     """
     name = 'Tremelo'
     description = 'Modulates the time signal, creating a vibrato effect.'
+    batch_parameters = ('Mix',)
 
     def __init__(self):
         super(Tremelo, self).__init__()
@@ -85,30 +120,18 @@ class Tremelo(AudioEffect):
 
     def carrier_changed_event(self):
         shape = self.parameters['Shape'].value
-        period = SAMPLE_RATE /  self.parameters['Speed'].value
-
-        if shape == 'Sin':
-            self.carrier = np.sin(np.linspace(0, np.pi, period / 2))
-        elif shape == 'Sawtooth':
-            sawtooth = np.linspace(0, 1, period / 2)
-            # Smooth out the wave a bit by multiplying it with it's complement raised to a large power
-            complement = 1 - np.power(sawtooth, 20)
-            # This is 1 / max(complement) when the exponent is 20, and is used to keep a constant maximum amplitude
-            normalization_factor = 1.2226448438558761
-            self.carrier = sawtooth * complement * normalization_factor
-        elif shape == 'Square':
-            # Create a rounded square wave by multiplying 1-sawtooth(-x)**20, which rises sharply at x=0
-            # and 1-sawtooth(x)**20, which falls sharply at the half period
-            sawtooth = np.linspace(0, 1, period / 2)
-            sawtooth_neg = np.linspace(1, 0, period / 2)
-            square = (1 - np.power(sawtooth, 20)) * (1 - np.power(sawtooth_neg, 20))
-            self.carrier = np.concatenate([square, np.zeros(period / 2)])
+        if shape in CARRIER_SHAPES:
+            self.carrier = cached(design_carrier, shape, self.parameters['Speed'].value, self.sample_rate)
         else:
             print 'Error, unknown carrier shape:', shape
 
+    def sample_rate_changed_event(self):
+        self.carrier_changed_event()
+
     def process_data(self, data):
         mix = self.parameters['Mix'].value
-        wet = data * np.resize(self.carrier, len(data))
-        self.carrier = np.roll(self.carrier, -len(data))
+        size = data.shape[-1]
+        wet = data * np.resize(self.carrier, size)
+        self.carrier = np.roll(self.carrier, -size)
 
         return ((1 - mix) * data) + (mix * wet)
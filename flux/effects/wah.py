@@ -0,0 +1,128 @@
+import collections
+
+import numpy as np
+
+from _base import *
+from _biquad import design, TimeVaryingBiquad
+
+#scipy is slow to import, so scipy.signal is loaded when the first EnvelopeFilter is created
+signal = None
+
+def _load_signal():
+    global signal
+    if signal is None:
+        import scipy.signal
+        signal = scipy.signal
+
+# The range that the filters sweep over [Hz]
+SWEEP_LOW = 350.0
+SWEEP_HIGH = 2500.0
+
+# Time constant of the envelope follower [s]
+ENVELOPE_TIME = 0.02
+
+def sweep_frequency(position):
+    """Map positions from 0 to 1 onto the sweep range, evenly in pitch."""
+    return SWEEP_LOW * (SWEEP_HIGH / SWEEP_LOW) ** position
+
+class AutoWah(AudioEffect):
+    """Auto-Wah effect
+
+    Sweeps a resonant bandpass filter up and down with a sine wave LFO. The
+    filter's coefficients are updated every few samples, and its state is
+    kept as they change, so the sweep is smooth. At draft quality the
+    coefficients only change once per block.
+
+    Parameters:
+        Speed     -- The number of sweeps up and down per second. [Hz]
+        Resonance -- The quality factor of the filter. [-]
+        Mix       -- The ratio of filtered to original signal. [-]
+    """
+    name = 'Auto-Wah'
+    description = 'A bandpass filter swept by an LFO'
+    tiers = ('draft', 'normal')
+
+    def __init__(self):
+        super(AutoWah, self).__init__()
+        self.parameters = {'Speed':Parameter(float, 0.1, 10, 2),
+                           'Resonance':Parameter(float, 1, 10, 4),
+                           'Mix':Parameter(float, 0, 1, 1)}
+
+        self._filter = TimeVaryingBiquad()
+        self._phase = 0.0 # LFO phase at the start of the next block [cycles]
+
+    def process_data(self, data):
+        size = len(data)
+        step = self.parameters['Speed'].value / float(self.sample_rate)
+        draft = self.tier == 'draft'
+        starts = np.zeros(1) if draft else self._filter.starts(size)
+        phases = self._phase + starts * step
+        self._phase = (self._phase + size * step) % 1
+
+        position = 0.5 - 0.5 * np.cos(2 * np.pi * phases)
+        b, a = design('BP', sweep_frequency(position), self.parameters['Resonance'].value, self.sample_rate)
+        process = self._filter.process_fixed if draft else self._filter.process
+        if draft:
+            b, a = b[0], a[0]
+
+        mix = self.parameters['Mix'].value
+        if mix == 1:
+            return process(data, b, a)
+        dry = data * (1 - mix)
+        wet = process(data, b, a)
+        wet *= mix
+        wet += dry
+        return wet
+
+class EnvelopeFilter(AudioEffect):
+    """Envelope Filter effect
+
+    Sweeps a resonant filter with the level of the input, so that the filter
+    opens as a note is played and closes as it decays. At draft quality the
+    filter only follows the envelope once per block.
+
+    Parameters:
+        Sensitivity -- How far the filter moves for a given input level. [-]
+        Resonance   -- The quality factor of the filter. [-]
+        Type        -- The filter type. (LP, BP, HP)
+        Direction   -- Whether louder input moves the filter up or down. (Up, Down)
+    """
+    name = 'Envelope Filter'
+    description = 'A filter swept by the input level'
+    tiers = ('draft', 'normal')
+
+    def __init__(self):
+        super(EnvelopeFilter, self).__init__()
+        self.parameters = {'Sensitivity':Parameter(float, 1, 20, 5),
+                           'Resonance':Parameter(float, 1, 10, 5),
+                           'Type':DiscreteParameter(collections.OrderedDict((('LP', ''), ('BP', ''), ('HP', ''))), 'LP'),
+                           'Direction':DiscreteParameter(collections.OrderedDict((('Up', ''), ('Down', ''))), 'Up')}
+
+        self._filter = TimeVaryingBiquad()
+
+        _load_signal()
+        self.sample_rate_changed_event()
+
+    def sample_rate_changed_event(self):
+        # the envelope follower is a one pole lowpass filter of the rectified input
+        decay = np.exp(-1.0 / (ENVELOPE_TIME * self.sample_rate))
+        self._envelope_b = np.array([1 - decay])
+        self._envelope_a = np.array([1, -decay])
+        self._envelope_state = np.zeros(1)
+
+    def process_data(self, data):
+        envelope, self._envelope_state = signal.lfilter(self._envelope_b, self._envelope_a, np.abs(data),
+                                                        zi=self._envelope_state)
+
+        # the envelope is only needed where the filter's coefficients change
+        draft = self.tier == 'draft'
+        level = envelope[:1] if draft else envelope[self._filter.starts(len(data))]
+        position = np.minimum(level * (self.parameters['Sensitivity'].value / float(SAMPLE_MAX)), 1)
+        if self.parameters['Direction'].value == 'Down':
+            position = 1 - position
+
+        b, a = design(self.parameters['Type'].value, sweep_frequency(position), self.parameters['Resonance'].value,
+                      self.sample_rate)
+        if draft:
+            return self._filter.process_fixed(data, b[0], a[0])
+        return self._filter.process(data, b, a)
@@ -0,0 +1,63 @@
+"""Process-wide counters and timings reported by the audio engine.
+
+Anything can report into this module without holding a reference to it:
+
+    instrumentation.count('design cache misses')
+    instrumentation.record('pedal switch latency', seconds)
+
+Objects that keep their own statistics can instead register a source, a
+callable returning a dictionary of values that is read when a report is made.
+"""
+
+import collections
+
+__all__ = ['count', 'record', 'register_source', 'snapshot', 'report', 'reset']
+
+#number of most recent values kept for each timing
+HISTORY = 1000
+
+_counters = collections.defaultdict(int)
+_timings = {}
+_sources = {}
+
+def count(name, amount=1):
+    _counters[name] += amount
+
+def record(name, seconds):
+    try:
+        series = _timings[name]
+    except KeyError:
+        series = _timings[name] = collections.deque(maxlen=HISTORY)
+    series.append(seconds)
+
+def register_source(name, source):
+    """Register a callable that returns a dictionary of values to report under name."""
+    _sources[name] = source
+
+def snapshot():
+    """Return the current counters, timing statistics and source values as a dictionary."""
+    result = dict(_counters)
+    for name, series in _timings.items():
+        values = list(series)
+        if values:
+            result[name] = {'count': len(values),
+                            'mean': sum(values) / len(values),
+                            'max': max(values)}
+    for name, source in _sources.items():
+        result[name] = source()
+    return result
+
+def report():
+    """Return a human readable report of snapshot()."""
+    lines = []
+    for name, value in sorted(snapshot().items()):
+        if isinstance(value, dict) and 'mean' in value:
+            lines.append('%s: mean %.3f ms, max %.3f ms (%i samples)' %
+                         (name, value['mean'] * 1000, value['max'] * 1000, value['count']))
+        else:
+            lines.append('%s: %s' % (name, value))
+    return '\n'.join(lines)
+
+def reset():
+    _counters.clear()
+    _timings.clear()
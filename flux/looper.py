@@ -0,0 +1,194 @@
+import tempfile
+
+import numpy as np
+
+import effects
+
+#the length of loop that the backing file is first made for [s]. It doubles whenever a first recording outgrows it.
+INITIAL_SECONDS = 30
+
+class Looper(object):
+    """A multi-track looper whose tracks are kept in a memory mapped file.
+
+    All tracks share the loop length, which is set when the first recording
+    stops and is rounded to a whole number of beats if a tempo is set. Later
+    recordings either replace a track or are overdubbed onto it. Since the
+    tracks live in a file, only the pages being played or recorded need to be
+    in memory, however long the loop is. The file is created when recording
+    first starts and grows with the first recording, so it's only as large as
+    the loop, and the longest loop is limited by disk space rather than by
+    the address space.
+
+    The audio reaching the looper lags what the player heard by the latency of
+    the effects, so recordings are written latency samples earlier in the loop
+    to line up with the tracks they were played along to.
+
+    Parameters:
+        tracks      -- the number of tracks
+        max_seconds -- the longest loop that can be recorded
+        sample_rate -- the sample rate of the audio [Hz]
+        directory   -- where to put the backing file; the system's temporary directory by default
+    """
+    def __init__(self, tracks=4, max_seconds=30 * 60, sample_rate=effects.SAMPLE_RATE, directory=None):
+        self.max_seconds = max_seconds
+        self.sample_rate = sample_rate
+        self.max_length = int(max_seconds * sample_rate)
+        self.directory = directory
+
+        #one row per sample and one column per track, so that the file only has to grow at
+        #its end. It's an empty array until the first recording, and then a memory map of a
+        #temporary file that's deleted when it's closed.
+        self.tracks = np.zeros((0, tracks), dtype=np.float32)
+        self._file = None
+
+        self.recorded = [False] * tracks
+        self.muted = [False] * tracks
+        self._gains = np.zeros(tracks, dtype=np.float32)
+
+        self.length = 0 # loop length in samples, 0 until the first recording stops
+        self.position = 0
+        self.playing = False
+        self.recording = None # the index of the track being recorded, if any
+        self.overdub = False
+        self.bpm = None
+        self.latency = 0 # [samples]
+        self._skip = 0
+
+    @property
+    def track_count(self):
+        return len(self.recorded)
+
+    def set_sample_rate(self, sample_rate):
+        """Change the sample rate of the audio [Hz], keeping the tempo and mutes.
+
+        A recorded loop can't be played at another rate, so it's erased.
+        """
+        self.sample_rate = sample_rate
+        self.max_length = int(self.max_seconds * sample_rate)
+        if self.length:
+            self.erase()
+
+    def _reserve(self, length):
+        """Make the tracks at least length samples long, keeping what they hold."""
+        capacity = len(self.tracks)
+        if length <= capacity:
+            return
+        capacity = min(max(length, 2 * capacity, int(INITIAL_SECONDS * self.sample_rate)), self.max_length)
+        if self._file is None:
+            self._file = tempfile.NamedTemporaryFile(prefix='flux_loop_', suffix='.f32', dir=self.directory)
+        else:
+            #the old map must be closed before the file grows, since Windows can't resize a mapped file
+            self.tracks.flush()
+            self.tracks = None
+        #mode r+ extends the file, which is sparse on most file systems, so unused space isn't written to disk
+        self.tracks = np.memmap(self._file, dtype=np.float32, mode='r+', shape=(capacity, self.track_count))
+
+    def _update_gains(self):
+        for track in range(self.track_count):
+            self._gains[track] = self.recorded[track] and not self.muted[track]
+
+    def set_muted(self, track, muted):
+        self.muted[track] = muted
+        self._update_gains()
+
+    def snap_length(self, samples):
+        """Round a length in samples to a whole number of beats at the current bpm."""
+        if not self.bpm:
+            return samples
+        beat = 60.0 * self.sample_rate / self.bpm
+        beats = max(1, int(round(samples / beat)))
+        while beats > 1 and beats * beat > self.max_length:
+            beats -= 1
+        return min(int(round(beats * beat)), self.max_length)
+
+    def start_recording(self, track, overdub=False):
+        """Start recording onto track, replacing it unless overdub is True."""
+        if self.length and not self.recorded[track]:
+            #the track may hold data from before the last erase
+            self.tracks[:self.length, track] = 0
+        if not self.length:
+            self._reserve(1)
+            self.position = 0
+            #the first latency samples were played before recording started
+            self._skip = int(self.latency)
+        self.overdub = overdub
+        self.recording = track
+
+    def stop_recording(self):
+        track = self.recording
+        if track is None:
+            return
+        self.recording = None
+        self.recorded[track] = True
+        if not self.length:
+            #the first recording sets the length of the loop
+            recorded = self.position
+            self.length = self.snap_length(recorded)
+            self._reserve(self.length)
+            self.tracks[recorded:self.length, track] = 0
+            self.position = 0
+            self.playing = True
+        self._update_gains()
+
+    def erase(self):
+        """Erase all tracks and forget the loop length."""
+        self.recording = None
+        self.playing = False
+        self.length = 0
+        self.position = 0
+        self.recorded = [False] * self.track_count
+        self._update_gains()
+
+    def process_data(self, data):
+        """Record data if recording, and return data with the playing loop mixed in."""
+        if not self.length:
+            #the first recording, which sets the loop length
+            if self.recording is not None:
+                skipped = min(self._skip, len(data))
+                self._skip -= skipped
+                count = min(len(data) - skipped, self.max_length - self.position)
+                self._reserve(self.position + count)
+                self.tracks[self.position:self.position + count, self.recording] = data[skipped:skipped + count]
+                self.position += count
+            return data
+
+        if not self.playing and self.recording is None:
+            return data
+
+        offset = 0
+        while offset < len(data):
+            count = min(len(data) - offset, self.length - self.position)
+            start, stop = self.position, self.position + count
+            live = data[offset:offset + count]
+
+            #all tracks are mixed in one pass. The mix is taken before recording so
+            #that an overdub isn't heard twice.
+            mix = np.dot(self.tracks[start:stop], self._gains) if self.playing else None
+
+            if self.recording is not None:
+                self._record(live, (start - int(self.latency)) % self.length)
+
+            if mix is not None:
+                live += mix
+
+            offset += count
+            self.position = stop % self.length
+        return data
+
+    def _record(self, data, position):
+        """Write data to the recording track at position, wrapping around the end of the loop."""
+        while len(data):
+            count = min(len(data), self.length - position)
+            track = self.tracks[position:position + count, self.recording]
+            if self.overdub:
+                track += data[:count]
+            else:
+                track[:] = data[:count]
+            data = data[count:]
+            position = 0
+
+    def close(self):
+        self.tracks = np.zeros((0, self.track_count), dtype=np.float32)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -4,16 +4,25 @@ import collections
 import json
 import os
 
-try:
-    import pedal
-except ImportError:
-    pass
+import startup
 
-import numpy
-from PySide import QtCore, QtGui, QtMultimedia
+startup_profile = startup.StartupProfile('--profile-startup' in sys.argv)
 
-import effects
-import backend
+#the pedal module (and pyserial) is imported after the window is shown, see deferred_startup
+with startup_profile.timed('import numpy'):
+    import numpy
+with startup_profile.timed('import PySide'):
+    from PySide import QtCore, QtGui, QtMultimedia
+
+with startup_profile.timed('import effects'):
+    import effects
+with startup_profile.timed('import backend'):
+    import backend
+    import metering
+    import profiler
+
+#how often the meters and spectrum are recomputed from the audio path's snapshots
+METER_INTERVAL = 50 # [ms]
 
 def bpm_to_ms(bpm):
     return 60000 / int(bpm)
@@ -122,6 +131,7 @@ class FluxTabBar(QtGui.QTabBar):
         
 class FluxCentralWidget(QtGui.QTabWidget):
     widgets_changed = QtCore.Signal()
+    tab_removed = QtCore.Signal((object,))
     tab_save_requested = QtCore.Signal((int,))
     
     #this is used to compensate for the size of the tab bar
@@ -185,6 +195,7 @@ class FluxCentralWidget(QtGui.QTabWidget):
         self.setCurrentIndex(self.count() - 1)
         
     def remove_tab(self, index):
+        self.tab_removed.emit(self.widget(index))
         self.removeTab(index)
         if self.count() == 0:
             self.add_tab()
@@ -354,14 +365,42 @@ class FluxCentralWidget(QtGui.QTabWidget):
             
         
 class EffectWidgetTitleBar(QtGui.QFrame):
-    def __init__(self, title):
+    def __init__(self, title, has_tail=False, supports_oversampling=False):
         super(EffectWidgetTitleBar, self).__init__()
         self.layout = QtGui.QHBoxLayout()
         self.setLayout(self.layout)
         
+        #the bypass button shows a red light while the effect is active
+        self.bypass_btn = QtGui.QPushButton(QtGui.QIcon('res/icons/circle_red.png'), '')
+        self.bypass_btn.setObjectName('effect_bypass_btn')
+        self.bypass_btn.setToolTip('Bypass')
+        self.bypass_btn.setCheckable(True)
+        self.bypass_btn.setFlat(True)
+        self.bypass_btn.toggled.connect(self._bypass_toggled_event)
+        self.layout.addWidget(self.bypass_btn, alignment=QtCore.Qt.AlignLeft)
+        
         self.label = QtGui.QLabel(title, parent=self)
         self.layout.addWidget(self.label, alignment=QtCore.Qt.AlignLeft)
         
+        if has_tail:
+            self.trails_btn = QtGui.QPushButton('trails')
+            self.trails_btn.setObjectName('effect_trails_btn')
+            self.trails_btn.setToolTip('Let the tail ring out when bypassed')
+            self.trails_btn.setCheckable(True)
+            self.layout.addWidget(self.trails_btn, alignment=QtCore.Qt.AlignLeft)
+        else:
+            self.trails_btn = None
+        
+        if supports_oversampling:
+            self.oversampling_box = QtGui.QComboBox()
+            self.oversampling_box.setObjectName('effect_oversampling_box')
+            self.oversampling_box.setToolTip('Oversampling')
+            for factor in effects.OVERSAMPLING_FACTORS:
+                self.oversampling_box.addItem('%ix' % factor, factor)
+            self.layout.addWidget(self.oversampling_box, alignment=QtCore.Qt.AlignLeft)
+        else:
+            self.oversampling_box = None
+        
         style = app.style()
         close_icon = QtGui.QIcon('res/icons/tab_close.png')
         self.exit_btn = QtGui.QPushButton(close_icon, '')
@@ -369,18 +408,47 @@ class EffectWidgetTitleBar(QtGui.QFrame):
         self.exit_btn.setFlat(True)
         self.layout.addWidget(self.exit_btn, alignment=QtCore.Qt.AlignRight)
         
+    def _bypass_toggled_event(self, checked):
+        if checked:
+            self.bypass_btn.setIcon(QtGui.QIcon('res/icons/circle_grey.png'))
+        else:
+            self.bypass_btn.setIcon(QtGui.QIcon('res/icons/circle_red.png'))
+        
+class ParameterSignal(QtCore.QObject):
+    """Qt adapter that re-emits a Parameter's value_changed callbacks as a Qt signal.
+    
+    Parameters may be set on the audio thread, for example by remote control,
+    and Qt queues the signal to receivers on other threads.
+    """
+    value_changed = QtCore.Signal()
+    
+    def __init__(self, param):
+        super(ParameterSignal, self).__init__()
+        self.param = param
+        param.value_changed.connect(self.value_changed.emit)
+    
 class EffectWidget(QtGui.QFrame):
     _slider_max = 99.0
     def __init__(self, effect):
         super(EffectWidget, self).__init__()
         self.effect = effect
         
+        #(parameter, slider) pairs, kept in step with parameters that are changed elsewhere
+        self._sliders = []
+        self._signals = []
+        
         self.setObjectName('effect_frame')
         self.layout = QtGui.QGridLayout()
         self.setLayout(self.layout)
         
-        self.title_bar = EffectWidgetTitleBar(effect.name)
+        self.title_bar = EffectWidgetTitleBar(effect.name, effect.has_tail, effect.supports_oversampling)
         self.title_bar.setObjectName('effect_titlebar')
+        self.title_bar.bypass_btn.toggled.connect(self.effect.set_bypassed)
+        if self.title_bar.trails_btn is not None:
+            self.title_bar.trails_btn.toggled.connect(self.effect.set_trails)
+        if self.title_bar.oversampling_box is not None:
+            self.title_bar.oversampling_box.currentIndexChanged.connect(
+                lambda index: self.effect.set_oversampling(effects.OVERSAMPLING_FACTORS[index]))
         self.layout.addWidget(self.title_bar, 0, 0, max((1, len(self.effect.parameters)-1)), 0)
         
         
@@ -394,6 +462,11 @@ class EffectWidget(QtGui.QFrame):
                 slider = self._create_param_slider(param)
             self.layout.addWidget(slider, 3, column, QtCore.Qt.AlignHCenter)
             
+            #queued, so that parameters set during the audio callback don't redraw sliders there
+            signal = ParameterSignal(param)
+            signal.value_changed.connect(self.update_sliders, QtCore.Qt.QueuedConnection)
+            self._signals.append(signal)
+            
             if isinstance(param, effects.TempoParameter):
                 button = QtGui.QPushButton('use bpm')
                 button.setObjectName('use_bpm_button')
@@ -409,12 +482,13 @@ class EffectWidget(QtGui.QFrame):
         slider = QtGui.QSlider(self)
         slider.setMinimum(0)
         slider.setMaximum(len(param.choices_dict) - 1)
-        slider.setValue(param.choices_dict.keys().index(param.value))
+        slider.setValue(self._slider_position(param))
         slider.setTickPosition(QtGui.QSlider.TicksRight)
         slider.setTickInterval(1)
         slider.setOrientation(QtCore.Qt.Vertical)
         slider.valueChanged.connect(self._create_discrete_slot(param))
         slider.setInvertedAppearance(True)
+        self._sliders.append((param, slider))
         
         layout.addWidget(slider, 0, 0, len(param.choices_dict), 1, QtCore.Qt.AlignHCenter)
         
@@ -439,24 +513,45 @@ class EffectWidget(QtGui.QFrame):
         slider = QtGui.QSlider(self)
         slider.setMinimum(0)
         slider.setMaximum(EffectWidget._slider_max)
-        slider.setValue((float(param.value) / param.maximum) * self._slider_max)
+        slider.setValue(self._slider_position(param))
         slider.setTickInterval(10)
         slider.setTickPosition(QtGui.QSlider.TicksBothSides)
         slider.setOrientation(QtCore.Qt.Vertical)
         slider.valueChanged.connect(self._create_slider_slot(param))
         slider.setInvertedAppearance(param.inverted)
+        self._sliders.append((param, slider))
         
         return slider
+    
+    def _slider_position(self, param):
+        if isinstance(param, effects.DiscreteParameter):
+            return param.choices_dict.keys().index(param.value)
+        ratio = (float(param.value) - param.minimum) / (param.maximum - param.minimum)
+        return int(round(ratio * self._slider_max))
+    
+    def _slider_value(self, param, position):
+        if isinstance(param, effects.DiscreteParameter):
+            return param.choices_dict.keys()[position]
+        ratio = position / EffectWidget._slider_max
+        return param.type(ratio * (param.maximum - param.minimum) + param.minimum)
+    
+    def update_sliders(self):
+        """Move the sliders to match parameters that were changed elsewhere, such as by remote control."""
+        for param, slider in self._sliders:
+            #a slider that already gives the value was the one that set it, so it's left alone
+            if self._slider_value(param, slider.value()) != param.value:
+                slider.blockSignals(True)
+                slider.setValue(self._slider_position(param))
+                slider.blockSignals(False)
             
     def _create_slider_slot(self, param):
         def update_paramater(value):
-            ratio = value / EffectWidget._slider_max
-            param.value = param.type(ratio * (param.maximum - param.minimum) + param.minimum)
+            param.value = self._slider_value(param, value)
         return update_paramater
     
     def _create_discrete_slot(self, param):
         def update_paramater(value):
-            param.value = param.choices_dict.keys()[value]
+            param.value = self._slider_value(param, value)
         return update_paramater
    
     
@@ -490,6 +585,9 @@ class FluxEffectListWidget(QtGui.QListWidget):
         super(FluxEffectListWidget, self).mouseMoveEvent(event)
         
 class TempoWidget(QtGui.QWidget):
+    #emitted with the new tempo, or None if no tempo is entered
+    bpm_changed = QtCore.Signal((object,))
+    
     def __init__(self):
         super(TempoWidget, self).__init__()
         
@@ -505,6 +603,7 @@ class TempoWidget(QtGui.QWidget):
         self.bpm_entry = QtGui.QLineEdit()
         self.bpm_entry.setMaxLength(3)
         self.bpm_entry.setValidator(QtGui.QIntValidator(1, 999, self.bpm_entry))
+        self.bpm_entry.textChanged.connect(lambda text: self.bpm_changed.emit(self.bpm()))
         self.layout.addWidget(self.bpm_entry)
         
         self.tap_button = QtGui.QPushButton(QtGui.QIcon('res/icons/time_down.png'), '')
@@ -513,6 +612,13 @@ class TempoWidget(QtGui.QWidget):
         
         self.tempo_times = collections.deque(maxlen=5)
         
+    def bpm(self):
+        """Return the entered tempo, or None if there isn't one."""
+        text = self.bpm_entry.text()
+        if text and int(text) > 0:
+            return int(text)
+        return None
+        
     def tap_tempo(self):
         t = time.clock()
         
@@ -538,14 +644,17 @@ class FluxLoopWidget(QtGui.QWidget):
     record_button_checked = QtCore.Signal()
     record_button_unchecked = QtCore.Signal()
     
-    def __init__(self):
+    def __init__(self, track_count):
         super(FluxLoopWidget, self).__init__()
         
-        self.setMaximumHeight(50)
+        self.setMaximumHeight(120)
         
-        self.layout = QtGui.QHBoxLayout()
+        self.layout = QtGui.QVBoxLayout()
         self.setLayout(self.layout)
         
+        self.transport_layout = QtGui.QHBoxLayout()
+        self.layout.addLayout(self.transport_layout)
+        
         self.play_button = QtGui.QPushButton(QtGui.QIcon('res/icons/control_small_play.png'), '')
         self.pause_button = QtGui.QPushButton(QtGui.QIcon('res/icons/control_small_pause.png'), '')
         self.stop_button = QtGui.QPushButton(QtGui.QIcon('res/icons/control_small_stop.png'), '')
@@ -556,10 +665,42 @@ class FluxLoopWidget(QtGui.QWidget):
         for button in self.play_button, self.pause_button, self.stop_button, self.record_button:
             button.setFlat(True)
         
-        self.layout.addWidget(self.play_button)
-        self.layout.addWidget(self.pause_button)
-        self.layout.addWidget(self.stop_button)
-        self.layout.addWidget(self.record_button)
+        self.transport_layout.addWidget(self.play_button)
+        self.transport_layout.addWidget(self.pause_button)
+        self.transport_layout.addWidget(self.stop_button)
+        self.transport_layout.addWidget(self.record_button)
+        
+        #the track that is recorded onto and whose mute button is shown
+        self.track_layout = QtGui.QHBoxLayout()
+        self.layout.addLayout(self.track_layout)
+        
+        self.track_box = QtGui.QSpinBox()
+        self.track_box.setPrefix('Track ')
+        self.track_box.setRange(1, track_count)
+        self.track_box.valueChanged.connect(self._track_changed_event)
+        self.track_layout.addWidget(self.track_box)
+        
+        self.overdub_button = QtGui.QPushButton('overdub')
+        self.overdub_button.setCheckable(True)
+        self.track_layout.addWidget(self.overdub_button)
+        
+        self.mute_button = QtGui.QPushButton('mute')
+        self.mute_button.setCheckable(True)
+        self.track_layout.addWidget(self.mute_button)
+        self.muted_tracks = [False] * track_count
+        
+        #the length of the first loop is rounded to a whole number of beats at this tempo
+        self.tempo_widget = TempoWidget()
+        self.layout.addWidget(self.tempo_widget)
+        
+    def current_track(self):
+        return self.track_box.value() - 1
+        
+    def _track_changed_event(self, value):
+        #show the mute state of the newly selected track without emitting toggled
+        self.mute_button.blockSignals(True)
+        self.mute_button.setChecked(self.muted_tracks[value - 1])
+        self.mute_button.blockSignals(False)
         
     def _record_toggled_event(self, checked):
         if checked:
@@ -567,17 +708,202 @@ class FluxLoopWidget(QtGui.QWidget):
         else:
             self.record_button_unchecked.emit()
         
+class LevelMeter(QtGui.QWidget):
+    """A horizontal meter showing RMS as a bar and peak as a line, in dBFS.
+    
+    Levels fall by at most FALL_DB per update. The clip light at the right
+    stays on once the peak has gone over full scale, until the meter is clicked.
+    """
+    RANGE = 60.0 # [dB] shown below full scale
+    FALL_DB = 3.0
+    
+    def __init__(self):
+        super(LevelMeter, self).__init__()
+        
+        self.setMinimumSize(60, 10)
+        self.peak = metering.FLOOR_DB
+        self.rms = metering.FLOOR_DB
+        self.clipped = False
+        
+    def sizeHint(self):
+        return QtCore.QSize(150, 12)
+        
+    def set_levels(self, peak, rms):
+        self.peak = max(peak, self.peak - self.FALL_DB)
+        self.rms = max(rms, self.rms - self.FALL_DB)
+        self.clipped = self.clipped or peak > 0
+        self.update()
+        
+    def mousePressEvent(self, event):
+        self.clipped = False
+        self.update()
+        
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self)
+        width = self.width() - 6
+        height = self.height()
+        to_x = lambda db: int(width * (min(max(db, -self.RANGE), 0) + self.RANGE) / self.RANGE)
+        
+        painter.fillRect(0, 0, width, height, QtGui.QColor(40, 40, 40))
+        painter.fillRect(0, 0, to_x(self.rms), height, QtGui.QColor(80, 180, 80))
+        painter.fillRect(max(to_x(self.peak) - 2, 0), 0, 2, height, QtGui.QColor(230, 200, 60))
+        painter.fillRect(width + 2, 0, 4, height, QtGui.QColor(220, 40, 40) if self.clipped else QtGui.QColor(70, 30, 30))
+        
+class SpectrumWidget(QtGui.QWidget):
+    """A spectrum plot with a logarithmic frequency axis."""
+    LOWEST_FREQUENCY = 20 # [Hz]
+    RANGE = 90.0 # [dB] shown below full scale
+    
+    #weight of the previous spectrum when averaging, to steady the display
+    SMOOTHING = 0.5
+    
+    def __init__(self):
+        super(SpectrumWidget, self).__init__()
+        
+        self.setMinimumSize(150, 60)
+        self.frequencies = None
+        self.magnitudes = None
+        
+    def sizeHint(self):
+        return QtCore.QSize(200, 100)
+        
+    def set_spectrum(self, frequencies, magnitudes):
+        if self.magnitudes is not None and len(self.magnitudes) == len(magnitudes):
+            magnitudes = self.SMOOTHING * self.magnitudes + (1 - self.SMOOTHING) * magnitudes
+        self.frequencies = frequencies
+        self.magnitudes = magnitudes
+        self.update()
+        
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self)
+        width = self.width()
+        height = self.height()
+        painter.fillRect(0, 0, width, height, QtGui.QColor(40, 40, 40))
+        if self.magnitudes is None:
+            return
+        
+        visible = self.frequencies >= self.LOWEST_FREQUENCY
+        low, high = numpy.log(self.LOWEST_FREQUENCY), numpy.log(self.frequencies[-1])
+        xs = (numpy.log(self.frequencies[visible]) - low) / (high - low) * width
+        ys = (-self.magnitudes[visible].clip(-self.RANGE, 0)) / self.RANGE * height
+        
+        painter.setPen(QtGui.QColor(80, 180, 80))
+        painter.drawPolyline(QtGui.QPolygonF([QtCore.QPointF(x, y) for x, y in zip(xs, ys)]))
+        
+class FluxMeterWidget(QtGui.QWidget):
+    """Input, output and per effect level meters and a spectrum of the output.
+    
+    The audio path only copies snapshots into its MeterTaps; update() computes
+    the levels and spectrum from the snapshots published since the last update.
+    """
+    IDLE_UPDATES = 3
+    
+    def __init__(self):
+        super(FluxMeterWidget, self).__init__()
+        
+        self.layout = QtGui.QVBoxLayout()
+        self.setLayout(self.layout)
+        
+        self.level_layout = QtGui.QFormLayout()
+        self.layout.addLayout(self.level_layout)
+        self.input_meter = LevelMeter()
+        self.output_meter = LevelMeter()
+        self.level_layout.addRow('In', self.input_meter)
+        self.level_layout.addRow('Out', self.output_meter)
+        
+        self.spectrum = SpectrumWidget()
+        self.layout.addWidget(self.spectrum)
+        
+        #metered effects can't be fused with their neighbours, so per effect meters are optional
+        self.effects_button = QtGui.QPushButton('effect meters')
+        self.effects_button.setCheckable(True)
+        self.layout.addWidget(self.effects_button)
+        
+        self.effect_layout = QtGui.QFormLayout()
+        self.layout.addLayout(self.effect_layout)
+        self.effect_meters = []
+        
+        #the number of snapshots each tap had published at the last update, and the
+        #number of updates since it last published
+        self._published = {}
+        self._idle = {}
+        
+    def set_effects(self, effect_list):
+        """Show meters for effect_list, replacing any effects shown before."""
+        self.clear_effects()
+        for effect in effect_list:
+            effect.meter = metering.MeterTap()
+            meter = LevelMeter()
+            self.effect_layout.addRow(effect.name, meter)
+            self.effect_meters.append((effect, meter))
+        
+    def clear_effects(self):
+        #effects without a meter can be fused again
+        for effect, meter in self.effect_meters:
+            self._published.pop(effect.meter, None)
+            self._idle.pop(effect.meter, None)
+            effect.meter = None
+        self.effect_meters = []
+        while self.effect_layout.count():
+            item = self.effect_layout.takeAt(0)
+            if item.widget() is not None:
+                item.widget().deleteLater()
+        
+    def _new_snapshots(self, tap):
+        count = tap.published - self._published.get(tap, 0)
+        self._published[tap] = tap.published
+        return tap.latest(count) if count else None
+        
+    def _update_meter(self, meter, tap):
+        snapshots = self._new_snapshots(tap)
+        if snapshots is None:
+            #blocks can arrive less often than updates; only fall once the audio has stopped
+            if self._idle.get(tap, 0) >= self.IDLE_UPDATES:
+                meter.set_levels(metering.FLOOR_DB, metering.FLOOR_DB)
+            self._idle[tap] = self._idle.get(tap, 0) + 1
+        else:
+            self._idle[tap] = 0
+            meter.set_levels(*metering.levels(snapshots))
+        return snapshots
+        
+    def update_meters(self, audio_path):
+        self._update_meter(self.input_meter, audio_path.input_meter)
+        output = self._update_meter(self.output_meter, audio_path.output_meter)
+        if output is not None:
+            self.spectrum.set_spectrum(*metering.spectrum(output, audio_path.sample_rate))
+        
+        for effect, meter in self.effect_meters:
+            if effect.meter is not None:
+                self._update_meter(meter, effect.meter)
+        
 class FluxWindow(QtGui.QMainWindow):
     def __init__(self, app):
         super(FluxWindow, self).__init__()
         
         self.setWindowTitle('Flux Audio Effects')
         
-        with open('res/stylesheet.qss') as style_sheet:
-            self.setStyleSheet(style_sheet.read())
+        with startup_profile.timed('stylesheet load'):
+            with open('res/stylesheet.qss') as style_sheet:
+                self.setStyleSheet(style_sheet.read())
         
         self.app = app
-        self.audio_path = backend.AudioPath(app)
+        with startup_profile.timed('AudioPath.__init__'):
+            self.audio_path = backend.AudioPath(app)
+        self.audio_path.keep_warm = '--cold-presets' not in sys.argv
+        self.audio_path.ring_out_tails = '--ring-out-tails' in sys.argv
+        self.audio_path.converter.dither = '--dither' in sys.argv
+        self.audio_path.set_watchdog_enabled('--no-watchdog' not in sys.argv)
+        self.audio_path.set_quality(command_line_option('--quality', 'normal'))
+        block_size = command_line_option('--block-size')
+        if block_size is not None:
+            #0 runs the effects on blocks as the device delivers them
+            self.audio_path.set_block_size(int(block_size) or None)
+        device_rate = command_line_option('--device-rate')
+        if device_rate is not None:
+            self.audio_path.requested_rate = int(device_rate)
+        processing_rate = command_line_option('--processing-rate')
+        if processing_rate is not None:
+            self.audio_path.set_processing_rate(int(processing_rate))
             
         #create a dock widget and populate it with available effects
         self.effect_dock = QtGui.QDockWidget('Available Effects')
@@ -594,16 +920,39 @@ class FluxWindow(QtGui.QMainWindow):
         
         #Add the loop dock
         self.loop_dock = QtGui.QDockWidget('Loop controls')
-        self.loop_dock_widget = FluxLoopWidget()
+        self.loop_dock_widget = FluxLoopWidget(self.audio_path.looper.track_count)
         self.loop_dock.setWidget(self.loop_dock_widget)
         self.loop_dock.setFeatures(QtGui.QDockWidget.DockWidgetMovable|QtGui.QDockWidget.DockWidgetFloatable)
-        self.loop_dock_widget.play_button.clicked.connect(self.audio_path.start_loop_playback)
+        self.loop_dock_widget.play_button.clicked.connect(
+            lambda: self.audio_path.start_loop_playback(self.loop_dock_widget.tempo_widget.bpm()))
+        self.loop_dock_widget.pause_button.clicked.connect(self.audio_path.stop_loop_playback)
         self.loop_dock_widget.stop_button.clicked.connect(self.audio_path.erase_recorded_data)
         self.loop_dock_widget.stop_button.clicked.connect(lambda:self.loop_dock_widget.record_button.setChecked(False))
         self.loop_dock_widget.record_button_checked.connect(self.audio_path.start_recording)
         self.loop_dock_widget.record_button_unchecked.connect(self.audio_path.stop_recording)
+        self.loop_dock_widget.track_box.valueChanged.connect(self.loop_track_changed_event)
+        self.loop_dock_widget.overdub_button.toggled.connect(self.overdub_toggled_event)
+        self.loop_dock_widget.mute_button.toggled.connect(self.mute_toggled_event)
+        self.loop_dock_widget.tempo_widget.bpm_changed.connect(self.bpm_changed_event)
         self.addDockWidget(QtCore.Qt.LeftDockWidgetArea, self.loop_dock)
         
+        #add the meter dock, which is updated from a timer rather than by the audio thread
+        self.meter_dock = QtGui.QDockWidget('Meters')
+        self.meter_widget = FluxMeterWidget()
+        self.meter_widget.effects_button.toggled.connect(self.effect_meters_toggled_event)
+        self.meter_dock.setWidget(self.meter_widget)
+        self.meter_dock.setFeatures(QtGui.QDockWidget.DockWidgetMovable|QtGui.QDockWidget.DockWidgetFloatable)
+        self.addDockWidget(QtCore.Qt.RightDockWidgetArea, self.meter_dock)
+        
+        #the latency of the current preset, and of the whole path after compensation
+        self.latency_label = QtGui.QLabel()
+        self.statusBar().addPermanentWidget(self.latency_label)
+        
+        self.meter_timer = QtCore.QTimer(self)
+        self.meter_timer.setInterval(METER_INTERVAL)
+        self.meter_timer.timeout.connect(self.meter_timer_event)
+        self.meter_timer.start()
+        
         #create the top toolbar
         self.toolbar = QtGui.QToolBar()
         self.toolbar.setFloatable(False)
@@ -617,6 +966,33 @@ class FluxWindow(QtGui.QMainWindow):
         self.toolbar.addAction(self.pause_action)
         self.toolbar.addAction(QtGui.QIcon('res/icons/control_stop.png'), 'Stop', self.stop_btn_event)
         self.toolbar.addSeparator()
+        
+        self.session_record_action = QtGui.QAction(QtGui.QIcon('res/icons/circle_red.png'), 'Record Session', self.toolbar)
+        self.session_record_action.setCheckable(True)
+        self.session_record_action.toggled.connect(self.session_record_event)
+        self.toolbar.addAction(self.session_record_action)
+        
+        #profiles the audio callback for profiler.DURATION seconds, or until it's unchecked
+        self.profile_action = QtGui.QAction('Profile', self.toolbar)
+        self.profile_action.setToolTip('Profile the audio processing')
+        self.profile_action.setCheckable(True)
+        self.profile_action.toggled.connect(self.profile_event)
+        self.toolbar.addAction(self.profile_action)
+        self.profile_path = None
+        self.profile_timer = QtCore.QTimer()
+        self.profile_timer.setSingleShot(True)
+        self.profile_timer.timeout.connect(lambda: self.profile_action.setChecked(False))
+        self.toolbar.addSeparator()
+        
+        #the quality tier used by every effect, so the same presets suit fast and slow machines
+        self.quality_box = QtGui.QComboBox()
+        self.quality_box.setToolTip('Quality')
+        self.quality_box.addItems(list(effects.QUALITY_TIERS))
+        self.quality_box.setCurrentIndex(effects.QUALITY_TIERS.index(self.audio_path.quality))
+        self.quality_box.currentIndexChanged.connect(
+            lambda index: self.audio_path.set_quality(effects.QUALITY_TIERS[index]))
+        self.toolbar.addWidget(self.quality_box)
+        self.toolbar.addSeparator()
         self.toolbar.addAction(QtGui.QIcon('res/icons/save.png'), 'Save', self.save_effects)
         self.toolbar.addAction(QtGui.QIcon('res/icons/open.png'), 'Open', self.load_effects)
         self.toolbar.addSeparator()
@@ -624,7 +1000,7 @@ class FluxWindow(QtGui.QMainWindow):
         self.toolbar.addAction(QtGui.QIcon('res/icons/tab_right.png'), 'Previous Preset', self.tab_right_event)
         self.toolbar.addAction(QtGui.QIcon('res/icons/tab_edit.png'), 'Rename Preset', self.rename_tab_event)
 
-        self.toolbar.sizeHint = lambda :QtCore.QSize(264, 44)
+        self.toolbar.sizeHint = lambda :QtCore.QSize(440, 44)
         
         self.addToolBar(self.toolbar)
         
@@ -634,6 +1010,8 @@ class FluxWindow(QtGui.QMainWindow):
         self.central_widget.setTabsClosable (True)
         self.setCentralWidget(self.central_widget)
         self.central_widget.widgets_changed.connect(self.update_audio_path)
+        self.central_widget.tab_removed.connect(self.audio_path.remove_chain)
+        self.central_widget.tabBar().tabMoved.connect(lambda from_index, to_index: self.update_audio_path())
         self.central_widget.tab_save_requested.connect(self.save_effects)
         
     def sizeHint(self):
@@ -648,6 +1026,75 @@ class FluxWindow(QtGui.QMainWindow):
     def stop_btn_event(self):
         self.audio_path.stop()
         
+    def session_record_event(self, checked):
+        if not checked:
+            self.audio_path.stop_session_recording()
+            return
+        
+        file_name, file_ext = QtGui.QFileDialog.getSaveFileName(self, 'Record Session', 'session.wav', 'WAV File (*.wav)')
+        if file_name:
+            #the dry input is written alongside the output for re-amping
+            self.audio_path.start_session_recording(file_name)
+        else:
+            self.session_record_action.blockSignals(True)
+            self.session_record_action.setChecked(False)
+            self.session_record_action.blockSignals(False)
+        
+    def profile_event(self, checked):
+        if not checked:
+            self.profile_timer.stop()
+            sampler = self.audio_path.stop_profiling()
+            if sampler is not None:
+                summary_path = sampler.write(self.profile_path)
+                print sampler.summary()
+                print 'Profile written to %s, summary to %s' % (self.profile_path, summary_path)
+            return
+        
+        file_name, file_ext = QtGui.QFileDialog.getSaveFileName(self, 'Profile', 'profile.collapsed',
+                                                                'Collapsed Stacks (*.collapsed)')
+        if file_name:
+            self.profile_path = file_name
+            self.audio_path.start_profiling(profiler.DURATION)
+            self.profile_timer.start(int(profiler.DURATION * 1000))
+        else:
+            self.profile_action.blockSignals(True)
+            self.profile_action.setChecked(False)
+            self.profile_action.blockSignals(False)
+        
+    def meter_timer_event(self):
+        if self.meter_dock.isVisible():
+            self.meter_widget.update_meters(self.audio_path)
+        self.update_latency_label()
+        
+    def update_latency_label(self):
+        current = self.audio_path.chains.get(self.audio_path.current_chain)
+        preset_latency = current.latency if current is not None else 0
+        to_ms = lambda samples: 1000.0 * samples / self.audio_path.sample_rate
+        self.latency_label.setText('Latency: preset %.1f ms, output %.1f ms' %
+                                   (to_ms(preset_latency), to_ms(self.audio_path.latency)))
+        
+    def effect_meters_toggled_event(self, checked):
+        if checked:
+            self.meter_widget.set_effects(self.audio_path.effects)
+        else:
+            self.meter_widget.clear_effects()
+        
+    def loop_track_changed_event(self, value):
+        self.audio_path.loop_track = value - 1
+        
+    def overdub_toggled_event(self, checked):
+        self.audio_path.overdub = checked
+        
+    def mute_toggled_event(self, checked):
+        track = self.loop_dock_widget.current_track()
+        self.loop_dock_widget.muted_tracks[track] = checked
+        self.audio_path.set_track_muted(track, checked)
+        
+    def bpm_changed_event(self, bpm):
+        self.audio_path.set_bpm(bpm)
+        if bpm is not None:
+            effects.TempoParameter.set_bpm(bpm)
+        
     def add_tab_event(self):
         self.central_widget.add_tab()
         
@@ -664,8 +1111,14 @@ class FluxWindow(QtGui.QMainWindow):
         self.central_widget.add_effect(list_item.text())
             
     def update_audio_path(self):
+        #every preset keeps its own chain in the audio path, so changing tabs only
+        #selects a chain that is already built
         panel = self.central_widget.currentWidget()
-        self.audio_path.effects = [i.widget().effect for i in panel.layout.itemList]
+        self.audio_path.chain_order = [self.central_widget.widget(i) for i in range(self.central_widget.count())]
+        self.audio_path.set_chain(panel, [i.widget().effect for i in panel.layout.itemList])
+        self.audio_path.select_chain(panel)
+        if self.meter_widget.effects_button.isChecked():
+            self.meter_widget.set_effects(self.audio_path.chains[panel].effects)
         
     def save_effects(self, index=None):
         if index is None:
@@ -694,19 +1147,61 @@ class FluxWindow(QtGui.QMainWindow):
                     for effect_name, parameters in json.load(f):
                         effect = self.central_widget.add_effect(effect_name, parameters)
 
-if __name__ == '__main__':
-    app = QtGui.QApplication(sys.argv)
-    window = FluxWindow(app)
+def command_line_option(name, default=None):
+    """Return the argument following name on the command line, or default if name wasn't given."""
+    if name in sys.argv[:-1]:
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
+
+def deferred_startup(window):
+    """Perform the slow parts of startup once the window has been shown."""
+    with startup_profile.timed('import scipy.signal'):
+        import scipy.signal
+    
+    with startup_profile.timed('AudioPath device probing'):
+        window.audio_path.open_devices()
+    
+    control_port = command_line_option('--control-port')
+    if control_port is not None:
+        import remote
+        window.control_server = remote.ControlServer(window.audio_path, port=int(control_port))
+        window.control_server.start()
     
     try:
-        pedal_thread = pedal.PedalThread()
-        pedal_thread.left_clicked.connect(window.tab_left_event)
-        pedal_thread.right_clicked.connect(window.tab_right_event)
-        pedal_thread.action_clicked.connect(window.pause_action.toggle)
-        pedal_thread.start()
-    except NameError:
-        #pedal wasn't imported correctly
-        pass
+        with startup_profile.timed('import pedal'):
+            import pedal
+    except ImportError:
+        #pedal can't be used without pyserial
+        startup_profile.report()
+        return
+    
+    def scan_finished(seconds):
+        startup_profile.add('PedalThread port scanning', seconds)
+        startup_profile.report()
     
-    window.show()
+    #the ports are scanned on the pedal thread itself. The audio path gets the events
+    #directly from the pedal thread so that preset switches don't wait for the GUI.
+    window.pedal_thread = pedal.PedalThread()
+    window.pedal_thread.scan_finished.connect(scan_finished)
+    window.pedal_thread.add_listener(window.audio_path.pedal_event)
+    window.pedal_thread.left_clicked.connect(window.tab_left_event)
+    window.pedal_thread.right_clicked.connect(window.tab_right_event)
+    window.pedal_thread.action_clicked.connect(window.pause_action.toggle)
+    window.pedal_thread.start()
+
+if __name__ == '__main__':
+    with startup_profile.timed('QApplication'):
+        app = QtGui.QApplication(sys.argv)
+    with startup_profile.timed('FluxWindow.__init__'):
+        window = FluxWindow(app)
+    with startup_profile.timed('FluxWindow.show'):
+        window.show()
+    
+    QtCore.QTimer.singleShot(0, lambda: deferred_startup(window))
     app.exec_()
+    
+    window.audio_path.stop_session_recording()
+    
+    if hasattr(window, 'pedal_thread'):
+        window.pedal_thread.stop()
+        window.pedal_thread.wait()
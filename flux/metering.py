@@ -0,0 +1,90 @@
+"""Level and spectrum metering that does almost no work on the audio thread.
+
+The audio thread only copies the end of each block into a MeterTap. Levels
+and spectra are computed from those snapshots by whoever displays them,
+usually a GUI timer.
+"""
+
+import numpy as np
+
+import effects
+
+__all__ = ['SNAPSHOT_SIZE', 'MeterTap', 'levels', 'spectrum', 'to_db']
+
+#samples copied from the end of each block; also the FFT size of the spectrum
+SNAPSHOT_SIZE = 512
+
+#snapshots kept by a tap, so that a slow reader still sees complete snapshots
+SLOTS = 8
+
+#level reported for silence [dBFS]
+FLOOR_DB = -120.0
+
+_windows = {}
+
+class MeterTap(object):
+    """A ring buffer of snapshots of the audio at one point in the signal path.
+
+    publish() is called from the audio thread and does nothing but copy the
+    last size samples of the block. The newest complete snapshot is the one
+    before the slot being written, and the ring is large enough that it won't
+    be overwritten while it's read.
+
+    Parameters:
+        size -- the number of samples in each snapshot
+    """
+    def __init__(self, size=SNAPSHOT_SIZE):
+        self.size = size
+        self._slots = np.zeros((SLOTS, size))
+        self.published = 0
+
+    def publish(self, data):
+        count = min(len(data), self.size)
+        slot = self._slots[self.published % SLOTS]
+        slot[:self.size - count] = 0
+        slot[self.size - count:] = data[len(data) - count:]
+        #only count the snapshot once it's complete
+        self.published += 1
+
+    def latest(self, count=1):
+        """Return copies of the newest count snapshots, oldest first, as a (count, size) array."""
+        count = min(count, self.published, SLOTS - 1)
+        newest = self.published - 1
+        rows = [(newest - i) % SLOTS for i in reversed(range(count))]
+        return self._slots[rows]
+
+def to_db(level):
+    """Convert a level in sample units to dB relative to full scale."""
+    return 20 * np.log10(np.maximum(level, 1e-6) / effects.SAMPLE_MAX).clip(FLOOR_DB, None)
+
+def levels(snapshots):
+    """Return the (peak, rms) level of snapshots in dBFS.
+
+    The peak can be above 0 dBFS, which means the signal will be clipped.
+    """
+    if not len(snapshots):
+        return FLOOR_DB, FLOOR_DB
+    peak = np.abs(snapshots).max()
+    rms = np.sqrt(np.mean(np.square(snapshots)))
+    return float(to_db(peak)), float(to_db(rms))
+
+def _window(size):
+    if size not in _windows:
+        window = np.hanning(size)
+        #scale so that a full scale sine reads 0 dBFS
+        window *= 2 / window.sum()
+        window.setflags(write=False)
+        _windows[size] = window
+    return _windows[size]
+
+def spectrum(snapshots, sample_rate=effects.SAMPLE_RATE):
+    """Return the frequencies [Hz] and Hann windowed magnitude spectrum [dBFS] of snapshots.
+
+    The spectra of several snapshots are averaged.
+    """
+    snapshots = np.atleast_2d(snapshots)
+    size = snapshots.shape[1]
+    magnitudes = np.abs(np.fft.rfft(snapshots * _window(size), axis=1))
+    #np.fft.rfftfreq needs NumPy 1.8
+    frequencies = np.arange(size // 2 + 1) * (sample_rate / float(size))
+    return frequencies, to_db(np.sqrt(np.mean(np.square(magnitudes), axis=0)))
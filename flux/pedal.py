@@ -1,59 +1,293 @@
-import serial
-import time
+import collections
+import glob
+import os
 import platform
+import threading
+from multiprocessing.pool import ThreadPool
+
+import serial
 from PySide import QtCore
 
-class PedalThread(QtCore.QThread):    
+import clock
+
+# default serial connection attributes
+BAUD = 9600
+READ_TIMEOUT = 0.1 # [s] how often the reader checks whether it should stop
+
+# the pedal answers HANDSHAKE_QUERY with HANDSHAKE_REPLY. The board resets when the
+# port is opened, so it's asked repeatedly until it replies or HANDSHAKE_TIMEOUT passes.
+HANDSHAKE_QUERY = '?'
+HANDSHAKE_REPLY = 'FLUX'
+HANDSHAKE_TIMEOUT = 3.0 # [s]
+
+# state changes of one button closer together than this are treated as contact bounce
+DEBOUNCE_TIME = 0.02 # [s]
+
+# releasing the action button after this long is a long press instead of a click
+LONGPRESS_TIME = 2.0 # [s]
+
+# button -- 'L', 'R' or 'E' (the action button)
+# pressed -- True if the button went down, False if it was released
+# timestamp -- clock.monotonic() when the event was read from the port
+PedalEvent = collections.namedtuple('PedalEvent', 'button pressed timestamp')
+
+def candidate_ports():
+    """Return the names of the serial ports that the pedal could be connected to."""
+    try:
+        from serial.tools import list_ports
+        return [port[0] for port in list_ports.comports()]
+    except ImportError:
+        pass
+
+    if platform.system() == 'Windows':
+        return ['COM%i' % i for i in range(1, 257)]
+    return glob.glob('/dev/tty.usbserial*') + glob.glob('/dev/ttyUSB*') + glob.glob('/dev/ttyACM*')
+
+def probe_port(port):
+    """Return an open connection to port if the pedal answers the handshake on it, otherwise None."""
+    try:
+        connection = serial.Serial(port, BAUD, timeout=0.25)
+    except (serial.SerialException, OSError, ValueError):
+        return None
+
+    try:
+        deadline = clock.monotonic() + HANDSHAKE_TIMEOUT
+        while clock.monotonic() < deadline:
+            connection.write(HANDSHAKE_QUERY)
+            if connection.readline().strip() == HANDSHAKE_REPLY:
+                connection.timeout = READ_TIMEOUT
+                return connection
+    except (serial.SerialException, OSError):
+        pass
+
+    connection.close()
+    return None
+
+def find_pedal(ports=None):
+    """Probe ports (all candidate ports by default) in parallel and return a connection to the pedal.
+
+    Returns None if no port answers the handshake.
+    """
+    if ports is None:
+        ports = candidate_ports()
+    if not ports:
+        return None
+
+    pool = ThreadPool(min(len(ports), 32))
+    try:
+        connections = [c for c in pool.map(probe_port, ports) if c is not None]
+    finally:
+        pool.close()
+
+    for extra in connections[1:]:
+        extra.close()
+    return connections[0] if connections else None
+
+class PedalReader(object):
+    """Reads, timestamps and debounces button events from a pedal connection.
+
+    Parameters:
+        connection -- an open serial.Serial (or anything with readline())
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.running = False
+        self._last_change = {}
+
+        # the start of a line that readline() returned when it timed out part way through
+        self._partial = ''
+
+    def parse(self, line, timestamp):
+        """Return the PedalEvent for a line sent by the pedal, or None if it isn't one or is a bounce."""
+        line = line.strip()
+        if len(line) != 2 or line[0] not in 'LRE' or line[1] not in '01':
+            return None
+
+        button = line[0]
+        if timestamp - self._last_change.get(button, -DEBOUNCE_TIME) < DEBOUNCE_TIME:
+            return None
+        self._last_change[button] = timestamp
+        return PedalEvent(button, line[1] == '1', timestamp)
+
+    def events(self):
+        """Generate events as they arrive until stop() is called."""
+        self.running = True
+        while self.running:
+            try:
+                line = self.connection.readline()
+            except (serial.SerialException, OSError):
+                break
+
+            # the timestamp is taken before any other work
+            timestamp = clock.monotonic()
+            if not line.endswith('\n'):
+                self._partial += line
+                continue
+            line, self._partial = self._partial + line, ''
+            event = self.parse(line, timestamp)
+            if event is not None:
+                yield event
+
+    def stop(self):
+        self.running = False
+
+class PedalThread(QtCore.QThread):
     left_clicked = QtCore.Signal()
     right_clicked = QtCore.Signal()
     action_clicked = QtCore.Signal()
     action_longpress = QtCore.Signal()
-    
+
+    #emitted with the time taken in seconds once the serial ports have been scanned
+    scan_finished = QtCore.Signal((float,))
+
     # holds serial connection object
     connection = None
-    
-    # holds default serial connection attributes
-    baud = 9600
-    timeout = 1
-    
+
     # connection failed flag
     connected = False
-    
-    def __init__(self):
+
+    def __init__(self, ports=None):
+        """ports -- the serial ports to look for the pedal on, all available ports by default"""
         super(PedalThread, self).__init__()
-        
-        os = platform.system()
-        
-        if os == 'Darwin':            
-            try:
-                # try to connect to device @ /dev/tty.usbserial if using mac
-                self.connection = serial.Serial('/dev/tty.usbserial-A7006Rfp', self.baud, timeout=self.timeout)
-                self.connected = True
-            except serial.SerialException:
-                # not able to connect on os x. fail quietly.
-                pass
-        elif os == 'Windows':
-            for i in range(256):
-                try:
-                    # for each port, try to connect to the arduino board
-                    self.connection = serial.Serial(i, self.baud, timeout=self.timeout)
-                    self.connected = True
-                except serial.SerialException:
-                    # not able to connect on windows. fail quietly.
-                    pass
-    
+        self.ports = ports
+        self.reader = None
+
+        # callables that are passed each PedalEvent directly from this thread, without
+        # waiting for the Qt event loop. They must be safe to call from another thread.
+        self.listeners = []
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def connect_device(self):
+        """Find the pedal by probing all ports in parallel.
+
+        This takes up to HANDSHAKE_TIMEOUT, so it is done at the start of run()
+        rather than on the GUI thread.
+        """
+        self.connection = find_pedal(self.ports)
+        self.connected = self.connection is not None
+
+    def stop(self):
+        if self.reader is not None:
+            self.reader.stop()
+
     def run(self):
-        while True and self.connected: 
-            line = self.connection.readline().rstrip()
-            if line == 'L1':
+        start = clock.monotonic()
+        self.connect_device()
+        self.scan_finished.emit(clock.monotonic() - start)
+
+        if not self.connected:
+            return
+
+        self.reader = PedalReader(self.connection)
+        action_pressed = None
+        for event in self.reader.events():
+            for listener in self.listeners:
+                listener(event)
+
+            if event.button == 'L' and event.pressed:
                 self.left_clicked.emit()
-            elif line == 'R1':
+            elif event.button == 'R' and event.pressed:
                 self.right_clicked.emit()
-            elif line == 'E1':
-                t1 = time.clock()
-            elif line == 'E0':
-                t2 = time.clock()
-                if (t2 - t1) < 2:
-                    self.action_clicked.emit()
-                elif (t2 - t1) > 2:
-                    self.action_longpress.emit()
+            elif event.button == 'E':
+                if event.pressed:
+                    action_pressed = event.timestamp
+                elif action_pressed is not None:
+                    if event.timestamp - action_pressed < LONGPRESS_TIME:
+                        self.action_clicked.emit()
+                    else:
+                        self.action_longpress.emit()
+                    action_pressed = None
+
+        self.connection.close()
+
+class FakePedal(object):
+    """A pedal emulated on a pseudo-terminal, for testing without the hardware. POSIX only.
+
+    Open port with a PedalThread or find_pedal([fake.port]) and call press(),
+    release() or click() to send button events. The handshake is answered
+    like the real pedal's firmware does.
+    """
+    def __init__(self):
+        import pty
+        import tty
+
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+
+        # clock.monotonic() of the last event sent, for measuring latency
+        self.sent_time = None
+
+        self._closed = False
+        self._thread = threading.Thread(target=self._answer_handshakes)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _answer_handshakes(self):
+        while not self._closed:
+            try:
+                data = os.read(self._master, 64)
+            except OSError:
+                break
+            if HANDSHAKE_QUERY in data:
+                os.write(self._master, HANDSHAKE_REPLY + '\r\n')
+
+    def write(self, text):
+        """Send text to the port as it is, for example part of a line."""
+        os.write(self._master, text)
+
+    def send(self, button, pressed):
+        self.sent_time = clock.monotonic()
+        self.write('%s%i\r\n' % (button, pressed))
+
+    def press(self, button):
+        self.send(button, True)
+
+    def release(self, button):
+        self.send(button, False)
+
+    def click(self, button):
+        self.press(button)
+        self.release(button)
+
+    def close(self):
+        self._closed = True
+        os.close(self._master)
+        os.close(self._slave)
+
+def measure_latency(presses=100):
+    """Measure the latency from a FakePedal press until the event reaches a listener.
+
+    Returns a list of latencies in seconds.
+    """
+    import time
+
+    fake = FakePedal()
+    connection = find_pedal([fake.port])
+    reader = PedalReader(connection)
+    latencies = []
+
+    def read():
+        for event in reader.events():
+            if event.pressed:
+                latencies.append(clock.monotonic() - fake.sent_time)
+    thread = threading.Thread(target=read)
+    thread.start()
+
+    for _ in range(presses):
+        fake.click('R')
+        # wait longer than the debounce time between presses
+        time.sleep(DEBOUNCE_TIME * 2)
+
+    reader.stop()
+    thread.join()
+    connection.close()
+    fake.close()
+    return latencies
+
+if __name__ == '__main__':
+    latencies = sorted(measure_latency())
+    print 'Press to delivery latency over %i presses:' % len(latencies)
+    print '  median %.3f ms, max %.3f ms' % (latencies[len(latencies) / 2] * 1000, latencies[-1] * 1000)
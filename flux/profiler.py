@@ -0,0 +1,237 @@
+"""A sampling profiler for the audio callback, with output for flame graphs.
+
+The audio path calls resume() as each callback starts and pause() as it
+ends. In between, an interval timer interrupts the callback every INTERVAL
+seconds of callback time and its stack is sampled by the signal handler,
+which runs on the interrupted thread. Outside of callbacks nothing is
+sampled, so the Qt event loop and the GUI stay out of the profile, and the
+only cost per callback is arming and disarming the timer.
+
+Where there's no interval timer (Windows), a thread samples the callback's
+thread instead. Python 2's GIL rarely lets it in while the callback runs, so
+that profile has far fewer samples and is biased towards the ends of long
+numpy calls.
+
+The samples are written as collapsed stacks, one line per distinct stack
+with its count, which flamegraph.pl and speedscope read directly. A summary
+attributes the samples to effects, and within each effect to its hottest
+lines.
+"""
+
+import collections
+import linecache
+import os
+import signal
+import sys
+import threading
+import time
+
+import chain
+import effects
+from effects import _resample
+
+__all__ = ['SamplingProfiler', 'INTERVAL', 'DURATION']
+
+#time between samples [s]
+INTERVAL = 0.002
+
+#how long a profile runs unless it's stopped sooner [s]
+DURATION = 10.0
+
+#lines listed for each effect in the summary
+TOP_LINES = 5
+
+#samples outside of any effect are attributed to this
+AUDIO_PATH = '(audio path)'
+
+_FLUX_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+_HAS_TIMER = hasattr(signal, 'setitimer')
+
+def _effect_codes():
+    """Return a dictionary mapping the code of each effect's own methods to the effect's name.
+
+    Methods an effect inherits are shared with other effects, so they're left
+    out. The resampling and fused stage code is named too, since it runs
+    outside of any effect's own methods.
+    """
+    codes = {}
+    for effect_class in effects.available_effects:
+        for value in vars(effect_class).values():
+            code = getattr(value, '__code__', None)
+            if code is not None:
+                codes[code] = effect_class.name
+    codes[_resample.Resampler.process.__func__.__code__] = 'oversampling'
+    codes[chain.FusedStage.process.__func__.__code__] = 'fused effects'
+    return codes
+
+def _label(code):
+    return '%s (%s:%i)' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+class SamplingProfiler(object):
+    """Samples the stack of the audio callback while it's running.
+
+    Stacks are trimmed to start at the outermost call of one of the root
+    functions, and samples outside of them are dropped.
+
+    Parameters:
+        roots    -- the functions or methods whose calls are profiled
+        interval -- the time between samples [s]
+    """
+    def __init__(self, roots, interval=INTERVAL):
+        self.roots = set(getattr(root, '__func__', root).__code__ for root in roots)
+        self.interval = interval
+
+        #counts of each stack, as a tuple of code objects from the outermost root inwards
+        self.stacks = collections.Counter()
+        #counts of (effect name, file name, line number) for the innermost line in flux's own code
+        self.lines = collections.Counter()
+        self.samples = 0
+        self.callbacks = 0
+        self.callback_time = 0.0
+
+        self._codes = _effect_codes()
+        self._in_flux = {}
+        self._running = False
+        self._deadline = None
+        self._remaining = interval
+        self._resumed = None
+        self._previous_handler = None
+        self._thread = None
+        self._thread_id = None
+
+    @property
+    def running(self):
+        return self._running
+
+    def start(self, duration=DURATION):
+        """Start profiling the callbacks of the thread calling this for duration seconds.
+
+        With an interval timer, this must be called from the main thread,
+        which is where Qt runs the audio callback.
+        """
+        self._deadline = time.time() + duration
+        self._running = True
+        if _HAS_TIMER:
+            self._previous_handler = signal.signal(signal.SIGALRM, self._handle_signal)
+        else:
+            self._thread_id = threading.current_thread().ident
+            self._thread = threading.Thread(target=self._run, name='profiler')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """Stop profiling. Called automatically by the first pause() after the duration has passed."""
+        if not self._running:
+            return
+        self._running = False
+        if _HAS_TIMER:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, self._previous_handler or signal.SIG_DFL)
+        elif self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def resume(self):
+        """Called by the audio path as a callback starts."""
+        if not self._running:
+            return
+        self._resumed = time.time()
+        if _HAS_TIMER:
+            #the timer carries on from where the last callback left it, so the samples
+            #are spread evenly over the time spent in callbacks
+            signal.setitimer(signal.ITIMER_REAL, self._remaining, self.interval)
+
+    def pause(self):
+        """Called by the audio path as a callback ends."""
+        if not self._running or self._resumed is None:
+            return
+        if _HAS_TIMER:
+            self._remaining = signal.setitimer(signal.ITIMER_REAL, 0)[0] or self.interval
+        now = time.time()
+        self.callbacks += 1
+        self.callback_time += now - self._resumed
+        self._resumed = None
+        if now >= self._deadline:
+            self.stop()
+
+    def _handle_signal(self, signum, frame):
+        self._sample(frame)
+
+    def _run(self):
+        while self._running and time.time() < self._deadline:
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self._sample(frame)
+            #don't keep the thread's frames alive between samples
+            del frame
+        self._running = False
+
+    def _sample(self, frame):
+        stack = []
+        while frame is not None:
+            stack.append(frame)
+            frame = frame.f_back
+        stack.reverse()
+
+        for start, frame in enumerate(stack):
+            if frame.f_code in self.roots:
+                break
+        else:
+            return
+        stack = stack[start:]
+        self.samples += 1
+        self.stacks[tuple(frame.f_code for frame in stack)] += 1
+
+        #the innermost effect and the innermost line of flux's code, since numpy's are rarely useful
+        effect = AUDIO_PATH
+        line = None
+        for frame in stack:
+            code = frame.f_code
+            effect = self._codes.get(code, effect)
+            if self._is_flux_code(code):
+                line = code.co_filename, frame.f_lineno
+        if line is not None:
+            self.lines[(effect,) + line] += 1
+
+    def _is_flux_code(self, code):
+        try:
+            return self._in_flux[code]
+        except KeyError:
+            result = self._in_flux[code] = os.path.abspath(code.co_filename).startswith(_FLUX_DIRECTORY)
+            return result
+
+    def collapsed(self):
+        """Return the samples as collapsed stacks, one 'frame;frame;frame count' line per stack."""
+        return '\n'.join('%s %i' % (';'.join(_label(code) for code in stack), count)
+                         for stack, count in sorted(self.stacks.items()))
+
+    def summary(self):
+        """Return a report of the share of samples in each effect, and its hottest lines."""
+        if not self.samples:
+            return 'Profile: no samples in %i callbacks' % self.callbacks
+        lines = ['Profile: %i samples every %.1f ms in %i callbacks, which took %.2f ms each on average' %
+                 (self.samples, self.interval * 1000, self.callbacks,
+                  self.callback_time / max(self.callbacks, 1) * 1000)]
+
+        by_effect = collections.defaultdict(list)
+        for (effect, file_name, line_number), count in self.lines.items():
+            by_effect[effect].append((count, file_name, line_number))
+        totals = sorted(((sum(count for count, _, _ in hot), effect) for effect, hot in by_effect.items()),
+                        reverse=True)
+        for total, effect in totals:
+            lines.append('  %5.1f%%  %s' % (100.0 * total / self.samples, effect))
+            for count, file_name, line_number in sorted(by_effect[effect], reverse=True)[:TOP_LINES]:
+                source = linecache.getline(file_name, line_number).strip()
+                lines.append('      %5.1f%%  %s:%i  %s' % (100.0 * count / self.samples,
+                                                          os.path.basename(file_name), line_number, source))
+        return '\n'.join(lines)
+
+    def write(self, path):
+        """Write the collapsed stacks to path and the summary next to it, ending in _summary.txt."""
+        with open(path, 'w') as f:
+            f.write(self.collapsed() + '\n')
+        summary_path = os.path.splitext(path)[0] + '_summary.txt'
+        with open(summary_path, 'w') as f:
+            f.write(self.summary() + '\n')
+        return summary_path
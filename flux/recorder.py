@@ -0,0 +1,142 @@
+"""Recording of whole sessions to WAV files without blocking the audio thread."""
+
+import collections
+import os
+import threading
+import time
+import wave
+
+import effects
+import instrumentation
+
+__all__ = ['SessionRecorder']
+
+#audio that can be queued while the disk is stalled before blocks are dropped
+QUEUE_SECONDS = 10.0
+
+#how often the writer thread wakes up to write the queued blocks
+WRITE_INTERVAL = 0.25 # [s]
+
+#buffer size of the output files, so that each batch is written sequentially
+FILE_BUFFER = 1 << 20 # [bytes]
+
+class _WaveFile(object):
+    """A 16 bit mono WAV file opened with a large write buffer."""
+    def __init__(self, path, sample_rate):
+        self.path = path
+        self._file = open(path, 'wb', FILE_BUFFER)
+        self._wave = wave.open(self._file, 'wb')
+        self._wave.setnchannels(effects.CHANNEL_COUNT)
+        self._wave.setsampwidth(effects.SAMPLE_SIZE / 8)
+        self._wave.setframerate(sample_rate)
+
+    def write(self, data):
+        self._wave.writeframesraw(data)
+
+    def close(self):
+        #wave only closes files that it opened itself, after fixing up the header
+        self._wave.close()
+        self._file.close()
+
+class SessionRecorder(object):
+    """Streams the processed output, and optionally the dry input, to WAV files.
+
+    The audio thread calls push() with each block's 16 bit sample data. Blocks
+    are appended to a queue, which doesn't take a lock, and a writer thread
+    joins everything that has been queued into one write per file. If the
+    queue fills up because the disk stalls, blocks are dropped and counted in
+    overflows and dropped_samples instead of blocking the audio thread. The
+    dropped blocks are written as silence so that the recording keeps its
+    timing and the two files stay aligned.
+
+    Parameters:
+        path        -- the WAV file to write the output to
+        record_dry  -- if True, the input is written to the same name with '_dry' appended
+        sample_rate -- the sample rate of the audio [Hz]
+        max_queued  -- the number of blocks that can be queued; QUEUE_SECONDS of BUFFER_SIZE blocks by default
+    """
+    def __init__(self, path, record_dry=True, sample_rate=effects.SAMPLE_RATE, max_queued=None):
+        if max_queued is None:
+            max_queued = int(QUEUE_SECONDS * sample_rate / effects.BUFFER_SIZE)
+        self.max_queued = max_queued
+
+        self.path = path
+        self.dry_path = None
+        self._files = [_WaveFile(path, sample_rate)]
+        if record_dry:
+            name, ext = os.path.splitext(path)
+            self.dry_path = name + '_dry' + ext
+            self._files.append(_WaveFile(self.dry_path, sample_rate))
+
+        #entries are (samples of silence to write first, output data, dry data)
+        self._queue = collections.deque()
+        self._gap = 0
+
+        self.overflows = 0
+        self.dropped_samples = 0
+        self.samples_written = 0
+        self.max_queue_length = 0
+        instrumentation.register_source('session recorder', self.stats)
+
+        self._running = True
+        self._thread = threading.Thread(target=self._write_loop)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stats(self):
+        return {'seconds written': float(self.samples_written) / self._files[0]._wave.getframerate(),
+                'overflows': self.overflows, 'dropped samples': self.dropped_samples,
+                'max queue length': self.max_queue_length}
+
+    def push(self, output, dry=None):
+        """Queue one block of 16 bit sample data. Called from the audio thread; never blocks."""
+        queued = len(self._queue)
+        if queued >= self.max_queued:
+            samples = len(output) / (effects.SAMPLE_SIZE / 8)
+            self.overflows += 1
+            self.dropped_samples += samples
+            self._gap += samples
+            return
+
+        self._queue.append((self._gap, output, dry))
+        self._gap = 0
+        self.max_queue_length = max(self.max_queue_length, queued + 1)
+
+    def _write_loop(self):
+        while self._running:
+            time.sleep(WRITE_INTERVAL)
+            self._write_queued()
+        self._write_queued()
+
+    def _write_queued(self):
+        blocks = []
+        while self._queue:
+            blocks.append(self._queue.popleft())
+        if not blocks:
+            return
+
+        silence = '\0' * (effects.SAMPLE_SIZE / 8)
+        for index, wave_file in enumerate(self._files):
+            parts = []
+            for block in blocks:
+                gap, data = block[0], block[1 + index]
+                if gap:
+                    parts.append(silence * gap)
+                parts.append(data if data is not None else silence * (len(block[1]) / len(silence)))
+            wave_file.write(''.join(parts))
+
+        self.samples_written += sum(gap + len(output) / len(silence) for gap, output, dry in blocks)
+
+    def close(self):
+        """Write everything still queued and close the files."""
+        if self._gap:
+            #blocks dropped at the very end
+            self._queue.append((self._gap, '', ''))
+            self._gap = 0
+        self._running = False
+        self._thread.join()
+        for wave_file in self._files:
+            wave_file.close()
+        if self.overflows:
+            print 'Session recording dropped %i samples in %i blocks because the disk was too slow' % (
+                self.dropped_samples, self.overflows)
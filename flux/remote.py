@@ -0,0 +1,256 @@
+"""Remote control of effect parameters over UDP.
+
+Each datagram is either an OSC message or bundle, or a JSON object mapping
+addresses to values. Addresses have the form
+
+    /flux/<preset>/<effect>/<parameter>
+
+where preset is the index of the preset tab or 'current', effect is the index
+of the effect in the preset or its name, and parameter is the parameter's
+name. Names are matched without regard to case, and underscores may be used
+in place of spaces. For example:
+
+    /flux/current/0/Amount 2.5
+    /flux/1/delay/feedback 0.3
+
+All updates in one datagram are applied together at the start of the next
+audio block, so a bundle can change several parameters atomically.
+"""
+
+import json
+import math
+import select
+import socket
+import struct
+import threading
+
+import instrumentation
+
+__all__ = ['DEFAULT_PORT', 'ControlServer', 'ControlClient', 'encode_message', 'encode_bundle', 'decode_packet']
+
+DEFAULT_PORT = 9000
+
+class ControlError(Exception):
+    pass
+
+def _read_string(data, offset):
+    end = data.index('\0', offset)
+    #strings are padded with nulls to a multiple of 4 bytes
+    return data[offset:end], (end + 4) & ~3
+
+def _pad_string(text):
+    text += '\0'
+    return text + '\0' * (-len(text) % 4)
+
+def decode_packet(data):
+    """Return a list of (address, value) pairs from an OSC or JSON packet."""
+    if data.startswith('{'):
+        try:
+            return json.loads(data).items()
+        except ValueError as e:
+            raise ControlError('invalid JSON: %s' % e)
+    try:
+        return _decode_osc(data)
+    except (ValueError, IndexError, struct.error) as e:
+        raise ControlError('invalid OSC packet: %s' % e)
+
+def _decode_osc(data):
+    if data.startswith('#bundle\0'):
+        #skip the 8 byte time tag; bundle elements are always applied immediately
+        messages = []
+        offset = 16
+        while offset < len(data):
+            (size,) = struct.unpack_from('>i', data, offset)
+            messages.extend(_decode_osc(data[offset + 4:offset + 4 + size]))
+            offset += 4 + size
+        return messages
+
+    address, offset = _read_string(data, 0)
+    tags, offset = _read_string(data, offset)
+    args = []
+    for tag in tags[1:]:
+        if tag == 'f':
+            args.append(struct.unpack_from('>f', data, offset)[0])
+            offset += 4
+        elif tag == 'i':
+            args.append(struct.unpack_from('>i', data, offset)[0])
+            offset += 4
+        elif tag == 'd':
+            args.append(struct.unpack_from('>d', data, offset)[0])
+            offset += 8
+        elif tag == 'h':
+            args.append(struct.unpack_from('>q', data, offset)[0])
+            offset += 8
+        elif tag == 's':
+            value, offset = _read_string(data, offset)
+            args.append(value)
+        elif tag in 'TF':
+            args.append(tag == 'T')
+        else:
+            raise ValueError('unsupported type tag %r' % tag)
+
+    if len(args) != 1:
+        raise ValueError('%s: expected one argument, got %i' % (address, len(args)))
+    return [(address, args[0])]
+
+def encode_message(address, value):
+    """Return an OSC message setting address to value."""
+    if isinstance(value, basestring):
+        return _pad_string(address) + _pad_string(',s') + _pad_string(value)
+    if isinstance(value, bool):
+        return _pad_string(address) + _pad_string(',T' if value else ',F')
+    if isinstance(value, int):
+        return _pad_string(address) + _pad_string(',i') + struct.pack('>i', value)
+    return _pad_string(address) + _pad_string(',f') + struct.pack('>f', value)
+
+def encode_bundle(messages):
+    """Return an OSC bundle of encoded messages, to be applied immediately."""
+    time_tag = struct.pack('>II', 0, 1)
+    return _pad_string('#bundle') + time_tag + ''.join(struct.pack('>i', len(m)) + m for m in messages)
+
+def _find(items, key, name_of):
+    """Find key in items, either as an index or a name matched by name_of."""
+    try:
+        index = int(key)
+    except ValueError:
+        pass
+    else:
+        #negative indices would count from the end, which isn't what "/-1/" means to a client
+        if not 0 <= index < len(items):
+            raise ControlError('index %s out of range' % key)
+        return items[index]
+
+    key = key.replace('_', ' ').lower()
+    for item in items:
+        if name_of(item).lower() == key:
+            return item
+    raise ControlError('no match for %r' % key)
+
+class ControlServer(object):
+    """Listens for parameter updates on a UDP port and queues them in an audio path.
+
+    Updates are handed to audio_path.queue_updates() in one batch per datagram,
+    and are applied by the audio path itself, so that they don't go through the
+    GUI.
+
+    Parameters:
+        audio_path -- a backend.AudioPath
+        host       -- the interface to listen on; only the local machine by default
+        port       -- the UDP port to listen on. Use 0 to pick any free port.
+    """
+    def __init__(self, audio_path, host='127.0.0.1', port=DEFAULT_PORT):
+        self.audio_path = audio_path
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        #a large receive buffer absorbs bursts of updates while the GIL is held elsewhere
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        self.socket.setblocking(False)
+        self.socket.bind((host, port))
+        self.address = self.socket.getsockname()
+
+        self.packets = 0
+        self.updates = 0
+        self.errors = 0
+        self.last_error = None
+        instrumentation.register_source('remote control', self.stats)
+
+        self._running = False
+        self._thread = threading.Thread(target=self.serve)
+        self._thread.daemon = True
+
+    def stats(self):
+        return {'packets': self.packets, 'updates': self.updates,
+                'errors': self.errors, 'last error': self.last_error}
+
+    def start(self):
+        self._running = True
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._thread.join()
+        self.socket.close()
+
+    def serve(self):
+        while self._running:
+            readable, _, _ = select.select([self.socket], [], [], 0.1)
+            while readable:
+                try:
+                    data, sender = self.socket.recvfrom(65536)
+                except socket.error:
+                    break
+                self.handle_packet(data)
+
+    def handle_packet(self, data):
+        self.packets += 1
+        try:
+            updates = [self.resolve(address, value) for address, value in decode_packet(data)]
+        except ControlError as e:
+            #the whole packet is dropped so that a bundle is never applied partially
+            self.errors += 1
+            self.last_error = str(e)
+            return
+        except Exception as e:
+            #a packet that slips past the checks mustn't stop the server
+            self.errors += 1
+            self.last_error = 'unexpected %s: %s' % (type(e).__name__, e)
+            return
+
+        self.updates += len(updates)
+        self.audio_path.queue_updates(updates)
+
+    def resolve(self, address, value):
+        """Return the (Parameter, value) pair that address refers to."""
+        parts = address.strip('/').split('/')
+        if len(parts) != 4 or parts[0] != 'flux':
+            raise ControlError('%s: expected /flux/<preset>/<effect>/<parameter>' % address)
+        _, preset, effect, param = parts
+
+        try:
+            if preset == 'current':
+                key = self.audio_path.current_chain
+            elif int(preset) < 0:
+                raise IndexError(preset)
+            else:
+                key = self.audio_path.chain_order[int(preset)]
+            effects = self.audio_path.chains[key].effects
+        except (ValueError, IndexError, KeyError):
+            raise ControlError('%s: no such preset' % address)
+
+        effect = _find(effects, effect, lambda effect: effect.name)
+        name = _find(effect.parameters.keys(), param, lambda name: name)
+        param = effect.parameters[name]
+
+        if hasattr(param, 'choices_dict'):
+            if not isinstance(value, basestring) or value not in param.choices_dict:
+                raise ControlError('%s: %r is not one of %s' % (address, value, ', '.join(param.choices_dict)))
+            return param, value
+        if not isinstance(value, (basestring, int, long, float)):
+            raise ControlError('%s: invalid value %r' % (address, value))
+        try:
+            value = float(value)
+        except ValueError:
+            raise ControlError('%s: invalid value %r' % (address, value))
+        if math.isnan(value) or math.isinf(value):
+            raise ControlError('%s: invalid value %r' % (address, value))
+        return param, param.type(min(max(value, param.minimum), param.maximum))
+
+class ControlClient(object):
+    """Sends parameter updates to a ControlServer."""
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT):
+        self.address = (host, port)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self, address, value):
+        self.socket.sendto(encode_message(address, value), self.address)
+
+    def send_bundle(self, updates):
+        """Send a dictionary of addresses to values, to be applied together."""
+        messages = [encode_message(address, value) for address, value in updates.iteritems()]
+        self.socket.sendto(encode_bundle(messages), self.address)
+
+    def send_json(self, updates):
+        self.socket.sendto(json.dumps(updates), self.address)
+
+    def close(self):
+        self.socket.close()
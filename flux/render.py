@@ -0,0 +1,143 @@
+"""Render a WAV file through a preset without an audio device or GUI.
+
+Usage: python render.py PRESET INPUT OUTPUT [--quality TIER] [--block-size SAMPLES]
+
+PRESET is an .fxs file saved from Flux. INPUT must be a 16 bit mono WAV file,
+at any sample rate, and OUTPUT is written in the same format. The effects run
+at the input's rate, so nothing is resampled. The output
+lines up with the input, since the chain's latency is removed, and continues
+after the input ends until the preset's tails decay, for at most MAX_TAIL
+seconds. --quality picks the tier of every effect, as the Quality box does
+in the GUI.
+"""
+
+import json
+import sys
+import wave
+
+import numpy as np
+
+import chain
+import clock
+import convert
+import effects
+
+__all__ = ['load_preset', 'open_input', 'open_output', 'render_file']
+
+#longest tail rendered after the input ends [s]
+MAX_TAIL = 10.0
+
+def load_preset(path, quality='normal'):
+    """Return an EffectChain of the effects in the .fxs file at path, set to quality."""
+    by_name = dict((effect_class.name, effect_class) for effect_class in effects.available_effects)
+    with open(path) as f:
+        entries = json.load(f)
+
+    chain_effects = []
+    for effect_name, parameters in entries:
+        if effect_name not in by_name:
+            raise ValueError('%s: unknown effect %r' % (path, effect_name))
+        effect = by_name[effect_name]()
+        for name, value in parameters.iteritems():
+            try:
+                effect.parameters[name].value = value
+            except KeyError:
+                print 'Error:', effect_name, 'has no parameter', name
+        effect.set_quality(quality)
+        chain_effects.append(effect)
+    return chain.EffectChain(chain_effects)
+
+def open_input(path):
+    """Open the WAV file at path for reading, raising ValueError if it isn't in the format that effects process."""
+    source = wave.open(path, 'rb')
+    if source.getnchannels() != effects.CHANNEL_COUNT or source.getsampwidth() != effects.SAMPLE_SIZE / 8:
+        source.close()
+        raise ValueError('%s: must be %i bit mono' % (path, effects.SAMPLE_SIZE))
+    return source
+
+def open_output(path, sample_rate=effects.SAMPLE_RATE):
+    """Open a WAV file at path for writing at sample_rate in the format that effects process."""
+    output = wave.open(path, 'wb')
+    output.setnchannels(effects.CHANNEL_COUNT)
+    output.setsampwidth(effects.SAMPLE_SIZE / 8)
+    output.setframerate(sample_rate)
+    return output
+
+def render_file(effect_chain, input_path, output_path, block_size=chain.BLOCK_SIZE):
+    """Process the WAV file at input_path through effect_chain into a WAV file at output_path.
+
+    The file is processed a block at a time, so memory use doesn't depend on
+    its length. effect_chain is set to the file's sample rate. Returns the
+    number of samples written.
+    """
+    converter = convert.SampleConverter()
+    source = open_input(input_path)
+    sample_rate = source.getframerate()
+    effect_chain.set_sample_rate(sample_rate)
+    output = open_output(output_path, sample_rate)
+
+    #the first latency samples come from before the input started
+    latency = int(round(effect_chain.latency))
+    skip = latency
+    written = 0
+    silence = np.zeros(block_size)
+    tail = 0
+    try:
+        while True:
+            frames = source.readframes(block_size)
+            if frames:
+                data = converter.to_float(frames)
+            else:
+                #run on silence until the tails have decayed and the delayed input is out
+                if tail >= latency and effect_chain.tail_level() < chain.TAIL_THRESHOLD:
+                    break
+                if tail >= latency + MAX_TAIL * sample_rate:
+                    break
+                data = silence.copy()
+                tail += len(data)
+
+            data = effect_chain.process_data(data)
+            if skip:
+                skipped = min(skip, len(data))
+                skip -= skipped
+                data = data[skipped:]
+            #writeframes would rewrite the header after every block, so it's left to close()
+            output.writeframesraw(converter.to_bytes(data))
+            written += len(data)
+    finally:
+        source.close()
+        output.close()
+    return written
+
+def main(args):
+    quality = 'normal'
+    block_size = chain.BLOCK_SIZE
+    paths = []
+    while args:
+        arg = args.pop(0)
+        if arg == '--quality':
+            quality = args.pop(0)
+        elif arg == '--block-size':
+            block_size = int(args.pop(0))
+        else:
+            paths.append(arg)
+
+    if len(paths) != 3:
+        print __doc__
+        return 2
+    if quality not in effects.QUALITY_TIERS:
+        print 'Unknown quality %r, use one of %s' % (quality, ', '.join(effects.QUALITY_TIERS))
+        return 2
+
+    preset, input_path, output_path = paths
+    start = clock.monotonic()
+    effect_chain = load_preset(preset, quality)
+    written = render_file(effect_chain, input_path, output_path, block_size)
+    elapsed = clock.monotonic() - start
+    duration = written / float(effect_chain.stream_rate)
+    print 'Rendered %.1f s of audio at %s quality in %.2f s (%.1fx realtime)' % (
+        duration, quality, elapsed, duration / elapsed if elapsed else 0)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
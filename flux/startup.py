@@ -0,0 +1,38 @@
+import contextlib
+import timeit
+
+class StartupProfile(object):
+    """Collects the time taken by each named phase of application startup.
+
+    Parameters:
+        enabled -- if False, phases are still run but nothing is recorded or printed
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.timings = []
+        self._origin = timeit.default_timer()
+
+    @contextlib.contextmanager
+    def timed(self, label):
+        """Context manager that records the time spent in its body under label."""
+        start = timeit.default_timer()
+        try:
+            yield
+        finally:
+            self.add(label, timeit.default_timer() - start)
+
+    def add(self, label, seconds):
+        """Record a phase that was timed elsewhere, e.g. on another thread."""
+        if self.enabled:
+            self.timings.append((label, seconds))
+
+    def report(self):
+        """Print the breakdown of all recorded phases."""
+        if not self.enabled:
+            return
+
+        width = max([len(label) for label, _ in self.timings] + [len('elapsed')])
+        print 'Startup profile:'
+        for label, seconds in self.timings:
+            print '  %-*s %8.1f ms' % (width, label, seconds * 1000)
+        print '  %-*s %8.1f ms' % (width, 'elapsed', (timeit.default_timer() - self._origin) * 1000)
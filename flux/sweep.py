@@ -0,0 +1,246 @@
+"""Render a clip through a preset at many settings of one parameter in a single pass.
+
+Usage: python sweep.py PRESET INPUT OUTPUT_DIRECTORY EFFECT PARAMETER [START STOP COUNT]
+                       [--quality TIER] [--block-size SAMPLES]
+
+EFFECT is the name of an effect in PRESET, or its position counting from 1.
+PARAMETER is swept over COUNT values from START to STOP, by default its
+whole range in 16 steps, or over every choice if it has choices. Each render
+is written to OUTPUT_DIRECTORY as <effect>_<parameter>_<value>.wav, in the
+same format and at the same sample rate as render.py writes.
+
+The copies of the chain are stacked as the rows of one (count, frames) array,
+and each effect that supports it does its numpy work once for all of the rows
+(see AudioEffect.stack), so a sweep costs a small multiple of one render
+rather than count renders. Effects that can't be stacked, or whose swept
+parameter changes the shape of their state, run one row at a time.
+"""
+
+import collections
+import os
+import sys
+
+import numpy as np
+
+import chain
+import clock
+import convert
+import effects
+import render
+
+__all__ = ['SweepChain', 'grid', 'copy_effect', 'sweep_file']
+
+#values a range parameter is swept over when no range is given
+DEFAULT_COUNT = 16
+
+def grid(index, name, values):
+    """Return the settings for sweeping parameter name of the effect at index over values."""
+    return [{(index, name): value} for value in values]
+
+def copy_effect(effect, values):
+    """Return a new effect of the same class and settings as effect, with the parameters in values changed."""
+    copy = type(effect)()
+    for name, param in effect.parameters.iteritems():
+        copy.parameters[name].value = values.get(name, param.value)
+    copy.set_oversampling(effect.oversampling)
+    copy.set_quality(effect.quality)
+    copy.set_sample_rate(effect.sample_rate)
+    return copy
+
+class SweepChain(object):
+    """Runs copies of a chain that differ only in their parameters, each on one row of a (count, frames) array.
+
+    At each position in the chain the copies are grouped by batch_key(), and
+    each group runs as one stacked effect. Copies that can't be stacked run on
+    their own row. Bypassed effects are left out, as a new EffectChain would
+    skip them. When the swept parameter changes an effect's latency, the rows
+    with less latency are delayed to match the one with the most, so that
+    every row lines up with the input delayed by latency samples.
+
+    Parameters:
+        effects  -- the AudioEffects to copy, in order
+        settings -- a dictionary for each copy, mapping (index in effects, parameter name) to the copy's value
+    """
+    def __init__(self, effects, settings):
+        self.count = len(settings)
+        latencies = np.zeros(self.count)
+
+        #for each effect, a list of (rows, effect, stacked) that between them cover every row
+        self._stages = []
+        for index, effect in enumerate(effects):
+            if effect.bypassed:
+                continue
+            copies = [copy_effect(effect, dict((name, value) for (i, name), value in setting.iteritems() if i == index))
+                      for setting in settings]
+            latencies += [copy.latency for copy in copies]
+
+            groups = collections.OrderedDict()
+            for row, copy in enumerate(copies):
+                key = copy.batch_key()
+                groups.setdefault(row if key is None else key, []).append(row)
+            stage = []
+            for rows in groups.values():
+                if len(rows) > 1:
+                    stage.append((rows, type(effect).stack([copies[row] for row in rows]), True))
+                else:
+                    stage.append((rows, copies[rows[0]], False))
+            self._stages.append(stage)
+
+        self.latency = latencies.max() if self.count else 0
+        #(row, DelayLine) for each row that has less latency than the others
+        self._delays = [(row, chain.DelayLine(int(round(self.latency - latency))))
+                        for row, latency in enumerate(latencies) if round(self.latency - latency)]
+
+    @property
+    def stacked(self):
+        """The fraction of the effect copies that run stacked."""
+        if not self._stages:
+            return 1.0
+        stacked = sum(len(rows) for stage in self._stages for rows, effect, is_stacked in stage if is_stacked)
+        return stacked / float(self.count * len(self._stages))
+
+    def process_data(self, data):
+        """Process data, an array of shape (count, frames), and return it."""
+        for stage in self._stages:
+            if len(stage) == 1 and stage[0][2]:
+                #every row in one stack, so no gathering is needed
+                data = stage[0][1].process(data)
+                continue
+            for rows, effect, stacked in stage:
+                if stacked:
+                    data[rows] = effect.process(data[rows])
+                else:
+                    data[rows[0]] = effect.process(data[rows[0]])
+        for row, delay in self._delays:
+            delay.process(data[row])
+        return data
+
+    def tail_level(self):
+        """Return the peak level of the tails still to be output by any of the copies."""
+        return max([effect.tail_level() for stage in self._stages for rows, effect, stacked in stage] + [0])
+
+def sweep_file(effect_chain, settings, input_path, output_paths, block_size=chain.BLOCK_SIZE):
+    """Render the WAV file at input_path through effect_chain at each of settings, into output_paths.
+
+    This is render.render_file for many settings at once. Every output runs
+    on until all of the tails have decayed, so they're the same length.
+    Returns the number of samples written to each.
+    """
+    converter = convert.SampleConverter()
+    source = render.open_input(input_path)
+    sample_rate = source.getframerate()
+    effect_chain.set_sample_rate(sample_rate)
+    sweep_chain = SweepChain(effect_chain.effects, settings)
+    outputs = []
+    try:
+        for path in output_paths:
+            outputs.append(render.open_output(path, sample_rate))
+
+        latency = int(round(sweep_chain.latency))
+        skip = latency
+        written = 0
+        tail = 0
+        while True:
+            frames = source.readframes(block_size)
+            if frames:
+                samples = converter.to_float(frames)
+            else:
+                if tail >= latency and sweep_chain.tail_level() < chain.TAIL_THRESHOLD:
+                    break
+                if tail >= latency + render.MAX_TAIL * sample_rate:
+                    break
+                samples = np.zeros(block_size)
+                tail += len(samples)
+
+            data = np.empty((len(settings), len(samples)))
+            data[:] = samples
+            data = sweep_chain.process_data(data)
+            if skip:
+                skipped = min(skip, data.shape[1])
+                skip -= skipped
+                data = data[:, skipped:]
+            #converted in one call rather than a row at a time. See render.render_file for writeframesraw.
+            samples = converter.to_int(np.ascontiguousarray(data).ravel()).reshape(data.shape)
+            for output, row in zip(outputs, samples):
+                output.writeframesraw(row.tostring())
+            written += data.shape[1]
+    finally:
+        source.close()
+        for output in outputs:
+            output.close()
+    return written
+
+def _find_effect(effect_chain, text):
+    if text.isdigit() and 0 < int(text) <= len(effect_chain.effects):
+        return int(text) - 1
+    for index, effect in enumerate(effect_chain.effects):
+        if effect.name.lower() == text.lower():
+            return index
+    raise ValueError('the preset has no effect %r' % text)
+
+def _sweep_values(param, bounds):
+    if isinstance(param, effects.DiscreteParameter):
+        return list(param.choices_dict.keys())
+    if bounds:
+        start, stop, count = float(bounds[0]), float(bounds[1]), int(bounds[2])
+    else:
+        start, stop, count = param.minimum, param.maximum, DEFAULT_COUNT
+    values = []
+    for value in np.linspace(start, stop, count):
+        value = param.type(value)
+        if value not in values:
+            values.append(value)
+    return values
+
+def _file_name(*parts):
+    return '_'.join(str(part).replace(' ', '-').replace(os.sep, '-') for part in parts) + '.wav'
+
+def main(args):
+    quality = 'normal'
+    block_size = chain.BLOCK_SIZE
+    positional = []
+    while args:
+        arg = args.pop(0)
+        if arg == '--quality':
+            quality = args.pop(0)
+        elif arg == '--block-size':
+            block_size = int(args.pop(0))
+        else:
+            positional.append(arg)
+
+    if len(positional) not in (5, 8):
+        print __doc__
+        return 2
+    if quality not in effects.QUALITY_TIERS:
+        print 'Unknown quality %r, use one of %s' % (quality, ', '.join(effects.QUALITY_TIERS))
+        return 2
+    preset, input_path, output_directory, effect_text, name = positional[:5]
+
+    try:
+        effect_chain = render.load_preset(preset, quality)
+        index = _find_effect(effect_chain, effect_text)
+    except (IOError, ValueError) as error:
+        print 'Error:', error
+        return 2
+    effect = effect_chain.effects[index]
+    if name not in effect.parameters:
+        print 'Error: %s has no parameter %r, use one of %s' % (effect.name, name, ', '.join(sorted(effect.parameters)))
+        return 2
+    values = _sweep_values(effect.parameters[name], positional[5:])
+
+    if not os.path.isdir(output_directory):
+        os.makedirs(output_directory)
+    output_paths = [os.path.join(output_directory, _file_name(effect.name, name, '%g' % value if
+                                                              isinstance(value, float) else value))
+                    for value in values]
+
+    start = clock.monotonic()
+    written = sweep_file(effect_chain, grid(index, name, values), input_path, output_paths, block_size)
+    elapsed = clock.monotonic() - start
+    duration = written / float(effect_chain.stream_rate)
+    print 'Rendered %i settings of %.1f s of audio in %.2f s (%.1fx realtime per setting)' % (
+        len(values), duration, elapsed, duration * len(values) / elapsed if elapsed else 0)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
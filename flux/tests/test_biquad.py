@@ -0,0 +1,58 @@
+"""Tests for the time-varying biquad filter."""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from effects._biquad import SUB_BLOCK, design, TimeVaryingBiquad
+
+def reference(data, b, a, sub_block=SUB_BLOCK):
+    """Filter data one sample at a time in transposed direct form II, with row n // sub_block of b and a."""
+    output = np.empty_like(data)
+    s1 = s2 = 0.0
+    for n, x in enumerate(data):
+        k = n // sub_block
+        y = b[k, 0] * x + s1
+        s1 = b[k, 1] * x - a[k, 0] * y + s2
+        s2 = b[k, 2] * x - a[k, 1] * y
+        output[n] = y
+    return output
+
+class TimeVaryingBiquadTest(unittest.TestCase):
+    def setUp(self):
+        self.signal = np.random.RandomState(0).randn(3000)
+        count = -(-len(self.signal) // SUB_BLOCK)
+        self.b, self.a = design('BP', np.linspace(200, 4000, count), 3.0)
+
+    def render(self, sizes, b, a):
+        """Filter the signal in blocks of the given sizes, repeated until it's used up."""
+        biquad = TimeVaryingBiquad()
+        blocks = []
+        position = 0
+        while position < len(self.signal):
+            for size in sizes:
+                block = self.signal[position:position + size].copy()
+                rows = (position + biquad.starts(len(block))) // SUB_BLOCK
+                blocks.append(biquad.process(block, b[rows], a[rows]))
+                position += len(block)
+        return np.concatenate(blocks)
+
+    def test_matches_reference(self):
+        expected = reference(self.signal, self.b, self.a)
+        for sizes in ([len(self.signal)], [256], [7, 300, 1, 64], [SUB_BLOCK], [33]):
+            np.testing.assert_allclose(self.render(sizes, self.b, self.a), expected, rtol=0, atol=1e-9,
+                                       err_msg='blocks of %s' % sizes)
+
+    def test_static_coefficients(self):
+        b, a = design('LP', np.ones(len(self.b)) * 1000, 2.0)
+        expected = reference(self.signal, b, a)
+        for sizes in ([len(self.signal)], [256], [7, 300, 1, 64]):
+            np.testing.assert_allclose(self.render(sizes, b, a), expected, rtol=0, atol=1e-9,
+                                       err_msg='blocks of %s' % sizes)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""Tests for EffectChain and its stages."""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import chain
+from effects.delay import Delay
+from effects.gain import Gain
+from effects.overdrive import ClassicOverdrive
+
+class FusedStageTest(unittest.TestCase):
+    def setUp(self):
+        self.gain = Gain()
+        self.gain.parameters['Amount'].value = 4.0
+        self.overdrive = ClassicOverdrive()
+        self.chain = chain.EffectChain([self.gain, self.overdrive])
+        self.signal = np.round(np.random.RandomState(0).randn(256) * 4000)
+
+    def expected(self):
+        data = self.signal.copy()
+        for effect in self.chain.effects:
+            data = effect.process_data(data)
+        return data
+
+    def test_stage_is_fused(self):
+        stages = self.chain.stages()
+        self.assertEqual(len(stages), 1)
+        self.assertIsInstance(stages[0], chain.FusedStage)
+
+    def test_only_integer_input_is_fused(self):
+        #after an effect that isn't stateless, or with resampled input, the effects run in turn
+        delay = Delay()
+        self.assertEqual(chain.EffectChain([delay, self.gain, self.overdrive]).stages(),
+                         [delay, self.gain, self.overdrive])
+        self.chain.set_sample_rate(48000, 44100)
+        self.assertEqual(self.chain.stages(), [self.gain, self.overdrive])
+
+    def test_fractional_input_is_rounded(self):
+        stage = self.chain.stages()[0]
+        for block in range(chain.TABLE_SETTLE_BLOCKS):
+            self.chain.process_data(self.signal.copy())
+        self.assertIsNotNone(stage._table)
+        #a faded block, as a chain ringing out is fed
+        faded = self.signal * np.linspace(0, 1, len(self.signal))
+        rounded = np.rint(faded)
+        for effect in self.chain.effects:
+            rounded = effect.process_data(rounded)
+        np.testing.assert_array_equal(self.chain.process_data(faded), rounded)
+
+    def test_table_waits_for_parameters_to_settle(self):
+        stage = self.chain.stages()[0]
+        for block in range(3 * chain.TABLE_SETTLE_BLOCKS):
+            #a knob sweep changes a parameter every block
+            self.gain.parameters['Amount'].value = 1.0 + block / 10.0
+            np.testing.assert_array_equal(self.chain.process_data(self.signal.copy()), self.expected())
+            self.assertIsNone(stage._table)
+
+        for block in range(chain.TABLE_SETTLE_BLOCKS):
+            np.testing.assert_array_equal(self.chain.process_data(self.signal.copy()), self.expected())
+        self.assertIsNotNone(stage._table)
+
+class DelayLineTest(unittest.TestCase):
+    def render(self, line, signal, delays):
+        blocks = []
+        for block, delay in zip(signal.reshape(len(delays), -1), delays):
+            line.delay = delay
+            blocks.append(line.process(block.copy()))
+        return np.concatenate(blocks)
+
+    def test_delay(self):
+        signal = np.random.RandomState(0).randn(1024)
+        out = self.render(chain.DelayLine(), signal, [100] * 4)
+        np.testing.assert_array_equal(out[100:], signal[:-100])
+
+    def test_changes_are_faded(self):
+        #a slow sine, whose largest step between samples is about 0.025
+        signal = np.sin(np.arange(2048) * 0.025)
+        for delays in ([300, 300, 0, 0], [0, 0, 300, 300], [0, 300, 100, 0], [0, 50, 50, 50]):
+            jumpy = np.abs(np.diff(self.render(chain.DelayLine(), signal, delays))).max()
+            faded = np.abs(np.diff(self.render(chain.DelayLine(fade=128), signal, delays))).max()
+            self.assertGreater(jumpy, 0.2)
+            self.assertLess(faded, 0.05, delays)
+
+class ReblockerTest(unittest.TestCase):
+    def test_reset_discards_held_samples(self):
+        reblocker = chain.Reblocker(64)
+        reblocker.process(np.ones(100), lambda block: block)
+        reblocker.reset()
+        #a block of silence comes out first, and then the input
+        ramp = np.arange(1.0, 65.0)
+        np.testing.assert_array_equal(reblocker.process(ramp.copy(), lambda block: block), np.zeros(64))
+        np.testing.assert_array_equal(reblocker.process(np.zeros(64), lambda block: block), ramp)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+"""Tests for the conversion between 16 bit samples and floats."""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from convert import DITHER_TABLE_SIZE, SampleConverter
+from effects import SAMPLE_MIN, SAMPLE_MAX
+
+class SampleConverterTest(unittest.TestCase):
+    def setUp(self):
+        self.converter = SampleConverter()
+
+    def test_round_trip(self):
+        samples = np.random.RandomState(0).randint(SAMPLE_MIN, SAMPLE_MAX + 1, 1000).astype(np.int16)
+        data = self.converter.to_float(samples.tostring())
+        self.assertEqual(data.dtype, float)
+        np.testing.assert_array_equal(data, samples)
+        output = self.converter.to_bytes(data)
+        self.assertTrue(isinstance(output, str))
+        self.assertEqual(output, samples.tostring())
+
+    def test_clipping(self):
+        data = np.array([-1e6, SAMPLE_MIN - 0.5, -1.7, -0.2, 0.2, 1.7, SAMPLE_MAX + 0.5, 1e6])
+        expected = np.array([SAMPLE_MIN, SAMPLE_MIN, -1, 0, 0, 1, SAMPLE_MAX, SAMPLE_MAX], np.int16)
+        np.testing.assert_array_equal(np.fromstring(self.converter.to_bytes(data), np.int16), expected)
+
+    def test_buffers_are_reused(self):
+        first = self.converter.to_bytes(np.ones(64))
+        self.converter.to_bytes(np.zeros(64))
+        #the returned bytes are a copy, so they outlive the next call
+        self.assertEqual(first, np.ones(64, np.int16).tostring())
+        self.assertEqual(len(self.converter.to_float(np.zeros(16, np.int16).tostring())), 16)
+
+    def test_dither_wraps(self):
+        converter = SampleConverter(dither=True)
+        table = converter._dither_table
+        size = 100
+        converter._dither_position = DITHER_TABLE_SIZE - size // 2
+        data = np.zeros(size)
+        converter.to_bytes(data)
+        #a block crossing the end of the table uses its tail, then its head
+        expected = np.concatenate((table[-(size // 2):], table[:size - size // 2]))
+        np.testing.assert_array_equal(data, np.rint(expected))
+        self.assertEqual(converter._dither_position, size - size // 2)
+
+    def test_dither_is_at_most_one_step(self):
+        converter = SampleConverter(dither=True)
+        data = np.random.RandomState(1).uniform(-1000, 1000, 5000)
+        output = np.fromstring(converter.to_bytes(data.copy()), np.int16)
+        self.assertTrue(np.abs(output - data).max() <= 2)
+
+if __name__ == '__main__':
+    unittest.main()
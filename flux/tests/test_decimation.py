@@ -0,0 +1,92 @@
+"""Tests for the Decimation effect."""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from effects import SAMPLE_RATE
+from effects.decimation import Decimation
+
+def process_in_chunks(effect, data, sizes):
+    """Process data through effect in blocks of the given sizes, repeated until it's used up."""
+    out = []
+    start = 0
+    while start < len(data):
+        for size in sizes:
+            if start < len(data):
+                out.append(effect.process(data[start:start + size].copy()))
+                start += size
+    return np.concatenate(out)
+
+class ChunkingTest(unittest.TestCase):
+    #one block, single samples, and irregular blocks that are shorter and longer than a hold
+    CHUNKINGS = [(5000,), (1,), (256,), (7, 1, 30, 2, 100, 13), (3, 64, 1, 1, 500)]
+
+    def setUp(self):
+        self.signal = np.random.RandomState(0).randn(5000) * 8000
+
+    def render(self, sizes, **values):
+        effect = Decimation()
+        for name, value in values.items():
+            effect.parameters[name.replace('_', ' ')].value = value
+        return process_in_chunks(effect, self.signal, sizes)
+
+    def check(self, **values):
+        expected = self.render(self.CHUNKINGS[0], **values)
+        for sizes in self.CHUNKINGS[1:]:
+            np.testing.assert_array_equal(self.render(sizes, **values), expected,
+                                          'blocks of %s with %s' % (sizes, values))
+
+    def test_sample_and_hold(self):
+        for hold in (2, 5, 25):
+            self.check(Sample_rate=hold)
+
+    def test_bit_reduction(self):
+        self.check(Bitrate=8)
+        self.check(Bitrate=12, Sample_rate=7)
+
+    def test_hold_is_continuous(self):
+        out = self.render((3, 64, 1, 1, 500), Sample_rate=5)
+        np.testing.assert_array_equal(out, np.repeat(self.signal[::5], 5))
+
+class OversamplingTest(unittest.TestCase):
+    """The hold is the same length of time whatever the oversampling factor and sample rate."""
+    def render(self, hold, factor=1, sample_rate=SAMPLE_RATE):
+        t = np.arange(sample_rate) / float(sample_rate)
+        signal = np.sin(2 * np.pi * 220 * t) * 8000
+        effect = Decimation()
+        effect.parameters['Sample rate'].value = hold
+        effect.set_oversampling(factor)
+        effect.set_sample_rate(sample_rate)
+        out = process_in_chunks(effect, signal, (256,))
+        latency = int(round(effect.latency))
+        return signal, out[latency:]
+
+    def distortion(self, signal, out):
+        """Return the level of the difference between out and signal, relative to signal [dB]."""
+        #the ends are left out, since they include the resampling filters' transients
+        out = out[1000:-1000]
+        signal = signal[1000:1000 + len(out)]
+        return 10 * np.log10(np.sum((out - signal) ** 2) / np.sum(signal ** 2))
+
+    def test_oversampled_hold_matches(self):
+        for hold in (4, 8, 16):
+            plain = self.distortion(*self.render(hold))
+            oversampled = self.distortion(*self.render(hold, factor=4))
+            self.assertAlmostEqual(oversampled, plain, delta=2.0, msg='hold %i: %.1f dB at 4x, %.1f dB at 1x' %
+                                   (hold, oversampled, plain))
+
+    def test_hold_scales_with_sample_rate(self):
+        for hold in (4, 8):
+            plain = self.distortion(*self.render(hold))
+            doubled = self.distortion(*self.render(hold, sample_rate=2 * SAMPLE_RATE))
+            fractional = self.distortion(*self.render(hold, sample_rate=48000))
+            self.assertAlmostEqual(doubled, plain, delta=2.0)
+            self.assertAlmostEqual(fractional, plain, delta=2.0)
+
+if __name__ == '__main__':
+    unittest.main()
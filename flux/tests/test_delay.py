@@ -0,0 +1,39 @@
+"""Tests for the delay line effects."""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from effects.delay import Delay
+from effects.reverb import Reverb
+
+class BlockSizeTest(unittest.TestCase):
+    """The output doesn't depend on the block size, even for blocks longer than the delay line."""
+    def setUp(self):
+        self.signal = np.random.RandomState(0).randn(20000) * 8000
+
+    def render(self, effect_class, size):
+        effect = effect_class()
+        blocks = [effect.process(self.signal[start:start + size].copy())
+                  for start in range(0, len(self.signal), size)]
+        return np.concatenate(blocks)
+
+    def check(self, effect_class):
+        expected = self.render(effect_class, 64)
+        #longer than the line, and longer than twice the line
+        for size in (len(self.signal), 5000, 256):
+            np.testing.assert_allclose(self.render(effect_class, size), expected, rtol=0, atol=1e-6,
+                                       err_msg='blocks of %i' % size)
+
+    def test_delay(self):
+        self.check(Delay)
+
+    def test_reverb(self):
+        self.check(Reverb)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+"""Tests for the looper and its growing backing file."""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import looper
+
+#a low rate keeps the loops short, so that they outgrow the file's first size quickly [Hz]
+RATE = 100
+
+def record(loop, signal, block_size=64):
+    for start in range(0, len(signal), block_size):
+        loop.process_data(signal[start:start + block_size].copy())
+
+class LooperTest(unittest.TestCase):
+    def setUp(self):
+        self.looper = looper.Looper(sample_rate=RATE)
+
+    def tearDown(self):
+        self.looper.close()
+
+    def test_file_is_created_on_first_recording(self):
+        self.assertIsNone(self.looper._file)
+        self.assertEqual(len(self.looper.tracks), 0)
+        self.looper.start_recording(0)
+        self.assertIsNotNone(self.looper._file)
+        self.assertEqual(len(self.looper.tracks), looper.INITIAL_SECONDS * RATE)
+
+    def test_file_grows_with_the_first_recording(self):
+        #longer than twice the first size
+        signal = np.random.RandomState(0).randn(int(2.5 * looper.INITIAL_SECONDS * RATE)).astype(np.float32)
+        self.looper.start_recording(0)
+        record(self.looper, signal)
+        self.looper.stop_recording()
+        self.assertEqual(self.looper.length, len(signal))
+        self.assertGreaterEqual(len(self.looper.tracks), len(signal))
+
+        #played back over silence, the loop comes out as it was recorded
+        played = np.zeros(len(signal), np.float32)
+        for start in range(0, len(signal), 64):
+            played[start:start + 64] = self.looper.process_data(np.zeros(len(played[start:start + 64])))
+        np.testing.assert_array_equal(played, signal)
+
+    def test_sample_rate_change_keeps_settings(self):
+        self.looper.bpm = 120
+        self.looper.set_muted(2, True)
+        self.looper.start_recording(0)
+        path = self.looper._file.name
+        record(self.looper, np.ones(200))
+        self.looper.stop_recording()
+
+        self.looper.set_sample_rate(2 * RATE)
+        self.assertEqual(self.looper.bpm, 120)
+        self.assertEqual(self.looper.muted, [False, False, True, False])
+        #the loop was recorded at the old rate, so it's gone
+        self.assertEqual(self.looper.length, 0)
+        self.assertEqual(self.looper.recorded, [False] * 4)
+
+        self.looper.close()
+        self.assertFalse(os.path.exists(path))
+
+if __name__ == '__main__':
+    unittest.main()
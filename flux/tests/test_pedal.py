@@ -0,0 +1,114 @@
+"""Tests for the pedal's discovery and event reading, with a FakePedal on a pseudo-terminal."""
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+try:
+    import pedal
+except ImportError:
+    #pedal needs pyserial and PySide
+    pedal = None
+
+#how long to wait for events that should arrive [s]
+WAIT = 0.5
+
+@unittest.skipIf(pedal is None or not hasattr(os, 'openpty'), 'needs pyserial, PySide and pseudo-terminals')
+class PedalReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.fake = pedal.FakePedal()
+        self.connection = pedal.find_pedal([self.fake.port])
+        self.assertIsNotNone(self.connection)
+        self.reader = pedal.PedalReader(self.connection)
+        self.events = []
+        self.thread = threading.Thread(target=self._read)
+        self.thread.start()
+
+    def tearDown(self):
+        self.reader.stop()
+        self.thread.join()
+        self.connection.close()
+        self.fake.close()
+
+    def _read(self):
+        for event in self.reader.events():
+            self.events.append(event)
+
+    def wait_for(self, count):
+        deadline = time.time() + WAIT
+        while len(self.events) < count and time.time() < deadline:
+            time.sleep(0.005)
+        return [(event.button, event.pressed) for event in self.events]
+
+    def test_events(self):
+        self.fake.press('L')
+        time.sleep(pedal.DEBOUNCE_TIME * 2)
+        self.fake.release('L')
+        time.sleep(pedal.DEBOUNCE_TIME * 2)
+        self.fake.press('E')
+        self.assertEqual(self.wait_for(3), [('L', True), ('L', False), ('E', True)])
+
+    def test_bounces_are_dropped(self):
+        #the release and second press come within the debounce time of the first press
+        self.fake.press('R')
+        self.fake.release('R')
+        self.fake.press('R')
+        time.sleep(pedal.DEBOUNCE_TIME * 2)
+        self.fake.release('R')
+        self.assertEqual(self.wait_for(2), [('R', True), ('R', False)])
+
+    def test_buttons_are_debounced_separately(self):
+        self.fake.press('L')
+        self.fake.press('R')
+        self.assertEqual(self.wait_for(2), [('L', True), ('R', True)])
+
+    def test_line_split_across_reads(self):
+        self.fake.write('L')
+        time.sleep(pedal.READ_TIMEOUT * 2)
+        self.fake.write('1\r')
+        time.sleep(pedal.READ_TIMEOUT * 2)
+        self.fake.write('\n')
+        self.assertEqual(self.wait_for(1), [('L', True)])
+
+    def test_noise_is_ignored(self):
+        self.fake.write('garbage\r\nX1\r\nL2\r\n')
+        self.fake.press('R')
+        self.assertEqual(self.wait_for(2), [('R', True)])
+
+@unittest.skipIf(pedal is None or not hasattr(os, 'openpty'), 'needs pyserial, PySide and pseudo-terminals')
+class FindPedalTest(unittest.TestCase):
+    def setUp(self):
+        self._timeout = pedal.HANDSHAKE_TIMEOUT
+        pedal.HANDSHAKE_TIMEOUT = 0.5
+
+    def tearDown(self):
+        pedal.HANDSHAKE_TIMEOUT = self._timeout
+
+    def test_finds_the_port_that_answers(self):
+        #a terminal that never answers the handshake
+        master, slave = os.openpty()
+        fake = pedal.FakePedal()
+        try:
+            connection = pedal.find_pedal([os.ttyname(slave), fake.port])
+            self.assertIsNotNone(connection)
+            self.assertEqual(connection.port, fake.port)
+            connection.close()
+        finally:
+            fake.close()
+            os.close(master)
+            os.close(slave)
+
+    def test_no_pedal(self):
+        master, slave = os.openpty()
+        try:
+            self.assertIsNone(pedal.find_pedal([os.ttyname(slave), '/dev/flux-no-such-port']))
+        finally:
+            os.close(master)
+            os.close(slave)
+
+if __name__ == '__main__':
+    unittest.main()
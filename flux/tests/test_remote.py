@@ -0,0 +1,104 @@
+"""Tests for the remote control server, including packets that are malformed."""
+
+import json
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import effects
+import remote
+
+#how long to wait for a packet to be handled [s]
+WAIT = 1.0
+
+def make_effect(name):
+    for effect_class in effects.available_effects:
+        if effect_class.name == name:
+            return effect_class()
+    raise KeyError(name)
+
+class FakeChain(object):
+    def __init__(self, effects):
+        self.effects = effects
+
+class FakeAudioPath(object):
+    """The parts of backend.AudioPath that ControlServer uses."""
+    def __init__(self):
+        self.chains = {'a': FakeChain([make_effect('Delay'), make_effect('Basic Filters')])}
+        self.chain_order = ['a']
+        self.current_chain = 'a'
+        self.queued = []
+
+    def queue_updates(self, updates):
+        self.queued.append(updates)
+
+class ResolveTest(unittest.TestCase):
+    def setUp(self):
+        self.audio_path = FakeAudioPath()
+        self.server = remote.ControlServer(self.audio_path, port=0)
+        self.delay = self.audio_path.chains['a'].effects[0]
+
+    def tearDown(self):
+        self.server.socket.close()
+
+    def test_value_is_clamped(self):
+        param, value = self.server.resolve('/flux/current/delay/feedback', 5)
+        self.assertIs(param, self.delay.parameters['Feedback'])
+        self.assertEqual(value, 1)
+
+    def test_index_out_of_range(self):
+        for address in ('/flux/0/-1/Mix', '/flux/0/2/Mix', '/flux/-1/0/Mix'):
+            self.assertRaises(remote.ControlError, self.server.resolve, address, 0.5)
+
+    def test_invalid_values(self):
+        for value in ([1, 2], {'a': 1}, None, float('nan'), float('inf'), 'loud'):
+            self.assertRaises(remote.ControlError, self.server.resolve, '/flux/0/0/Mix', value)
+
+    def test_invalid_choices(self):
+        for value in ([1, 2], {'LP': ''}, 3, 'XX'):
+            self.assertRaises(remote.ControlError, self.server.resolve, '/flux/0/1/Type', value)
+
+    def test_malformed_packets_are_counted(self):
+        for packet in ('{"/flux/0/1/Type": ["LP"]}', '{"/flux/0/0/Mix": {}}', '{not json', '[1, 2]', '/flux\0'):
+            self.server.handle_packet(packet)
+        self.assertEqual(self.server.errors, 5)
+        self.assertEqual(self.audio_path.queued, [])
+
+    def test_unexpected_errors_are_counted(self):
+        def fail(address, value):
+            raise RuntimeError('broken')
+        self.server.resolve = fail
+        self.server.handle_packet(json.dumps({'/flux/0/0/Mix': 0.5}))
+        self.assertEqual(self.server.errors, 1)
+        self.assertIn('broken', self.server.last_error)
+
+class ServerTest(unittest.TestCase):
+    def setUp(self):
+        self.audio_path = FakeAudioPath()
+        self.server = remote.ControlServer(self.audio_path, port=0)
+        self.server.start()
+        self.client = remote.ControlClient(*self.server.address)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def wait_for(self, count):
+        deadline = time.time() + WAIT
+        while self.server.packets < count and time.time() < deadline:
+            time.sleep(0.005)
+
+    def test_server_survives_malformed_packets(self):
+        self.client.send_json({'/flux/0/1/Type': ['LP']})
+        self.client.socket.sendto('{"/flux/0/0/Mix": 0.5', self.server.address)
+        self.client.send('/flux/0/0/Mix', 0.25)
+        self.wait_for(3)
+        self.assertEqual(self.server.errors, 2)
+        mix = self.audio_path.chains['a'].effects[0].parameters['Mix']
+        self.assertEqual(self.audio_path.queued, [[(mix, 0.25)]])
+
+if __name__ == '__main__':
+    unittest.main()
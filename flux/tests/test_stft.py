@@ -0,0 +1,67 @@
+"""Tests for the streaming STFT and the phase vocoder built on it."""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from effects import SAMPLE_RATE
+from effects._stft import STFT
+from effects.pitchshift import PhaseVocoder
+
+def random_blocks(signal, seed):
+    """Split signal into blocks of random sizes, including empty and single samples."""
+    random = np.random.RandomState(seed)
+    start = 0
+    while start < len(signal):
+        size = random.choice([0, 1, random.randint(2, 3000)])
+        yield signal[start:start + size].copy()
+        start += size
+
+class STFTTest(unittest.TestCase):
+    def test_identity_delays_by_size(self):
+        signal = np.random.RandomState(0).randn(20000)
+        for size, hop in ((2048, 512), (2048, 1024), (256, 64)):
+            for seed in range(3):
+                stft = STFT(size, hop)
+                self.assertEqual(stft.latency, size)
+                dry = []
+                output = []
+                for block in random_blocks(signal, seed):
+                    dry.append(np.empty(len(block)))
+                    output.append(stft.process(block, lambda spectrum: spectrum, dry[-1]))
+                output = np.concatenate(output)
+                message = 'size %i, hop %i, seed %i' % (size, hop, seed)
+                self.assertEqual(len(output), len(signal))
+                np.testing.assert_allclose(output[:size], 0, rtol=0, atol=1e-12, err_msg=message)
+                np.testing.assert_allclose(output[size:], signal[:-size], rtol=0, atol=1e-9, err_msg=message)
+                np.testing.assert_array_equal(np.concatenate(dry)[size:], signal[:-size], err_msg=message)
+
+    def test_hop_must_divide_size(self):
+        self.assertRaises(ValueError, STFT, 2048, 300)
+
+class PhaseVocoderTest(unittest.TestCase):
+    def dominant_frequency(self, semitones, frequency):
+        effect = PhaseVocoder()
+        effect.parameters['Semitones'].value = semitones
+        signal = 8000 * np.sin(2 * np.pi * frequency * np.arange(3 * SAMPLE_RATE) / float(SAMPLE_RATE))
+        output = np.concatenate([effect.process(signal[start:start + 256].copy())
+                                 for start in range(0, len(signal), 256)])
+        #one second after the vocoder has settled, which gives 1 Hz bins
+        output = output[-SAMPLE_RATE:] * np.hanning(SAMPLE_RATE)
+        return np.argmax(np.abs(np.fft.rfft(output))) * SAMPLE_RATE / float(len(output))
+
+    def test_intervals(self):
+        frequency = 440.0
+        for semitones in (12, -5):
+            expected = frequency * 2 ** (semitones / 12.0)
+            found = self.dominant_frequency(semitones, frequency)
+            #within a twentieth of a semitone
+            self.assertTrue(abs(found / expected - 1) < 0.003,
+                            '%+i semitones: %.1f Hz instead of %.1f Hz' % (semitones, found, expected))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+"""Tests for parameter sweeps."""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import wave
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import chain
+import render
+import sweep
+from effects import AudioEffect, Parameter
+from effects.gain import Gain
+
+class LatentDelay(AudioEffect):
+    """Delays its input by Delay samples, and reports that as its latency."""
+    name = 'Latent Delay'
+
+    def __init__(self):
+        super(LatentDelay, self).__init__()
+        self.parameters = {'Delay':Parameter(int, 0, 100, 0)}
+        self._line = chain.DelayLine()
+
+    @property
+    def latency(self):
+        return super(LatentDelay, self).latency + self.parameters['Delay'].value
+
+    def process_data(self, data):
+        self._line.delay = self.parameters['Delay'].value
+        return self._line.process(data)
+
+class LatencyTest(unittest.TestCase):
+    """Every row lines up with the input, whatever the swept parameter does to the latency."""
+    DELAYS = [0, 10, 37]
+
+    def setUp(self):
+        self.effects = [Gain(), LatentDelay()]
+        self.settings = sweep.grid(1, 'Delay', self.DELAYS)
+
+    def test_rows_are_aligned(self):
+        sweep_chain = sweep.SweepChain(self.effects, self.settings)
+        self.assertEqual(sweep_chain.latency, max(self.DELAYS))
+        impulse = np.zeros((len(self.DELAYS), 256))
+        impulse[:, 5] = 1
+        out = sweep_chain.process_data(impulse)
+        for row in out:
+            self.assertEqual(np.flatnonzero(row).tolist(), [5 + max(self.DELAYS)])
+
+    def test_sweep_file(self):
+        directory = tempfile.mkdtemp()
+        try:
+            input_path = os.path.join(directory, 'input.wav')
+            signal = np.zeros(1000, np.int16)
+            signal[100] = 1000
+            source = render.open_output(input_path)
+            source.writeframes(signal.tostring())
+            source.close()
+
+            paths = [os.path.join(directory, '%i.wav' % delay) for delay in self.DELAYS]
+            sweep.sweep_file(chain.EffectChain(self.effects), self.settings, input_path, paths, block_size=64)
+            for path in paths:
+                output = wave.open(path, 'rb')
+                samples = np.frombuffer(output.readframes(output.getnframes()), np.int16)
+                output.close()
+                self.assertEqual(np.flatnonzero(samples).tolist(), [100], path)
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+"""Tests for the watchdog and the quality steps that it takes."""
+
+import copy
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import effects
+import watchdog
+from effects import OVERSAMPLING_FACTORS
+from effects.fuzzbox import Fuzzbox
+
+def render(effect, signal, size=256):
+    """Return a copy of effect's output for signal, leaving effect as it was."""
+    effect = copy.deepcopy(effect)
+    return np.concatenate([effect.process(signal[start:start + size].copy())
+                           for start in range(0, len(signal), size)])
+
+def work(effect):
+    """Return the resampling work of effect per sample, which is 0 if it isn't oversampled."""
+    oversampler = effect._oversampler
+    return 0 if oversampler is None else oversampler.factor * oversampler.taps
+
+class DegradeTest(unittest.TestCase):
+    def setUp(self):
+        self.signal = np.random.RandomState(0).randn(4096) * 8000
+
+    def highest(self, effect_class, oversampling=OVERSAMPLING_FACTORS[-1]):
+        effect = effect_class()
+        effect.set_quality('high')
+        if effect.supports_oversampling:
+            effect.set_oversampling(oversampling)
+        return effect
+
+    def test_every_step_changes_processing(self):
+        for effect_class in effects.available_effects:
+            for oversampling in (1, OVERSAMPLING_FACTORS[-1]):
+                self.check_steps(self.highest(effect_class, oversampling))
+
+    def check_steps(self, effect):
+        output = render(effect, self.signal)
+        steps = []
+        while True:
+            previous_work = work(effect)
+            step = effect.degrade()
+            if step is None:
+                break
+            steps.append(step)
+            self.assertTrue(len(steps) < 10, '%s doesn\'t stop degrading' % effect.name)
+            degraded = render(effect, self.signal)
+            self.assertFalse(np.array_equal(degraded, output), '%s: %s changed nothing' % (effect.name, step))
+            if effect.supports_oversampling:
+                self.assertTrue(work(effect) < previous_work, '%s: %s' % (effect.name, step))
+            output = degraded
+        self.assertEqual(effect.degraded, len(steps))
+
+    def test_oversampling_is_lowered_one_step_at_a_time(self):
+        effect = self.highest(Fuzzbox)
+        steps = []
+        while True:
+            step = effect.degrade()
+            if step is None:
+                break
+            steps.append(step)
+        self.assertEqual(steps, ['normal tier', 'oversampling 4x', 'oversampling 2x', 'oversampling 1x'])
+        while effect.restore():
+            pass
+        self.assertEqual((effect.tier, effect.oversampling), ('high', OVERSAMPLING_FACTORS[-1]))
+
+class WatchdogTest(unittest.TestCase):
+    def test_actions_reduce_cost(self):
+        signal = np.random.RandomState(1).randn(4096) * 8000
+        effect = Fuzzbox()
+        effect.set_quality('high')
+        effect.set_oversampling(OVERSAMPLING_FACTORS[-1])
+        dog = watchdog.Watchdog()
+        dog._log = lambda message: None
+        output = render(effect, signal)
+        work_done = work(effect)
+        #a load of twice the callback's duration, until the effect is bypassed
+        while not effect.bypassed:
+            count = len(dog.actions)
+            for i in range(watchdog.OVERRUN_CALLBACKS * 5):
+                dog.record(effect, 0.01)
+                dog.check(0.02, 441)
+                if len(dog.actions) > count:
+                    break
+            self.assertEqual(len(dog.actions), count + 1)
+            if effect.bypassed:
+                break
+            degraded = render(effect, signal)
+            self.assertFalse(np.array_equal(degraded, output))
+            self.assertTrue(work(effect) < work_done)
+            output, work_done = degraded, work(effect)
+        self.assertEqual(effect.degraded, len(dog.actions) - 1)
+
+        dog.reset()
+        self.assertFalse(effect.bypassed)
+        self.assertEqual((effect.tier, effect.oversampling), ('high', OVERSAMPLING_FACTORS[-1]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+"""Keeps the effects within the realtime budget by lowering their quality when they overrun it.
+
+EffectChains with a watchdog time each of their stages. Once per audio
+callback the audio path reports how long processing took, and if that stays
+over BUDGET of the callback's duration the watchdog takes one action at a
+time: the most expensive effect that can still get cheaper is degraded one
+quality step (see AudioEffect.degrade), and if none can, the most expensive
+effect is bypassed, once. Once the load has stayed under HEADROOM for a while the
+most recent action is undone. Every action is printed.
+"""
+
+import effects
+import instrumentation
+
+__all__ = ['Watchdog']
+
+#fraction of each callback's duration that processing may take before the watchdog acts
+BUDGET = 0.7
+
+#fraction of each callback's duration that processing must stay under before quality is restored
+HEADROOM = 0.35
+
+#weight of the newest measurement in the rolling costs and load
+SMOOTHING = 0.1
+
+#callbacks that the load must stay over budget before each action
+OVERRUN_CALLBACKS = 20
+
+#callbacks that the load must stay under HEADROOM before an action is undone
+RECOVER_CALLBACKS = 200
+
+#RECOVER_CALLBACKS is doubled each time undoing an action leads straight back to an overrun, up to this factor
+MAX_BACKOFF = 64
+
+class Watchdog(object):
+    """Tracks the cost of the effects against the callback deadline and steps their quality down and up.
+
+    record() is called by EffectChain for each stage it runs, and check()
+    by the audio path once per callback. Both run on the audio thread, as do
+    the actions, so effects are never changed while they're processing.
+
+    Parameters:
+        budget   -- fraction of the callback's duration that processing may use
+        headroom -- fraction of the callback's duration below which quality is restored
+    """
+    def __init__(self, budget=BUDGET, headroom=HEADROOM):
+        self.budget = budget
+        self.headroom = headroom
+        self.enabled = True
+
+        #the rate of the audio passed to check(), which the audio path sets to the device's [Hz]
+        self.sample_rate = effects.SAMPLE_RATE
+
+        #rolling cost of each stage in seconds per run, and the rolling load as a fraction of the deadline
+        self.costs = {}
+        self.load = 0.0
+
+        #(effect, bypassed) for each action, most recent last. bypassed is False for a degrade().
+        self.actions = []
+
+        self._seen = set()
+        self._over = 0
+        self._under = 0
+        self._backoff = 1
+        self._since_restore = None
+        self._exhausted = False
+
+        instrumentation.register_source('watchdog', self.stats)
+
+    def record(self, stage, seconds):
+        """Add a measurement of the time that stage, an effect or FusedStage, took to run."""
+        cost = self.costs.get(stage)
+        self.costs[stage] = seconds if cost is None else cost + SMOOTHING * (seconds - cost)
+        self._seen.add(stage)
+
+    def check(self, seconds, samples):
+        """Account for a callback of samples that took seconds to process, and act if needed."""
+        if not samples:
+            return
+        if self._seen:
+            #forget stages that no longer run, so that they aren't picked
+            for stage in [stage for stage in self.costs if stage not in self._seen]:
+                del self.costs[stage]
+            self._seen = set()
+
+        load = seconds / (samples / float(self.sample_rate))
+        self.load += SMOOTHING * (load - self.load)
+        if self._since_restore is not None:
+            self._since_restore += 1
+        if not self.enabled:
+            #undone here rather than when disabled, since effects are only changed on the audio thread
+            if self.actions:
+                self.reset()
+            return
+
+        if self.load > self.budget:
+            self._under = 0
+            self._over += 1
+            if self._over >= OVERRUN_CALLBACKS:
+                self._over = 0
+                self._step_down()
+        elif self.load < self.headroom and self.actions:
+            self._over = 0
+            self._under += 1
+            if self._under >= RECOVER_CALLBACKS * self._backoff:
+                self._under = 0
+                self._step_up()
+        else:
+            self._over = self._under = 0
+
+    def reset(self):
+        """Undo every action. Only call this from the audio thread."""
+        while self.actions:
+            self._step_up()
+        self._backoff = 1
+
+    def _effect_costs(self):
+        """Return (cost, effect) for every effect that's running, most expensive first."""
+        result = []
+        for stage, cost in self.costs.items():
+            if stage.bypassed:
+                continue
+            #the cost of a fused run is shared out evenly between its effects
+            run = getattr(stage, 'effects', [stage])
+            result.extend((cost / len(run), effect) for effect in run)
+        result.sort(key=lambda (cost, effect): cost, reverse=True)
+        return result
+
+    def _step_down(self):
+        if self._since_restore is not None and self._since_restore < RECOVER_CALLBACKS:
+            #the last restore didn't fit, so wait longer before the next
+            self._backoff = min(self._backoff * 2, MAX_BACKOFF)
+        self._since_restore = None
+
+        ranked = self._effect_costs()
+        for cost, effect in ranked:
+            step = effect.degrade()
+            if step is not None:
+                self.actions.append((effect, False))
+                self._log('%s took %.2f ms, lowered to %s' % (effect.name, cost * 1000, step))
+                return
+        #bypassing is a last resort, so it's only done to one effect
+        if ranked and not any(bypassed for effect, bypassed in self.actions):
+            cost, effect = ranked[0]
+            effect.set_bypassed(True)
+            self.actions.append((effect, True))
+            self._log('%s took %.2f ms and is at its lowest quality, bypassed' % (effect.name, cost * 1000))
+        elif not self._exhausted:
+            self._exhausted = True
+            self._log('still over budget, but nothing more can be done')
+
+    def _step_up(self):
+        effect, bypassed = self.actions.pop()
+        self._since_restore = 0
+        self._exhausted = False
+        if bypassed:
+            #leave it alone if it was switched back on in the meantime
+            if effect.bypassed:
+                effect.set_bypassed(False)
+                self._log('%s restored from bypass' % effect.name)
+        elif effect.restore():
+            self._log('%s restored one quality step' % effect.name)
+
+    def _log(self, message):
+        print 'Watchdog: load %.0f%%, %s' % (self.load * 100, message)
+
+    def stats(self):
+        return {'load': round(self.load, 3),
+                'actions': len(self.actions),
+                'bypassed': sum(1 for effect, bypassed in self.actions if bypassed)}
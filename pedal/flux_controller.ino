@@ -33,6 +33,8 @@ void setup() {
 }
 
 void loop() {
+  // answer the host's handshake so that it can tell the pedal apart from other serial devices
+  if (Serial.available() > 0 && Serial.read() == '?'){Serial.println("FLUX");}
   if (leftFlag == true){leftSwitch();}
   if (rightFlag == true){rightSwitch();}
   if (enableFlag == true){enableSwitch();}